@@ -19,6 +19,12 @@ OUTPUT_DIR ?= ./results/Recon3DModel
 
 
 DATABOOST_DIR ?= data/hierarchical_boosting
+BOOST_THRESHOLDS ?= $(DATABOOST_DIR)/thresholds_of_significance.txt
+
+## Snapshots of the models (arrays memory-mapped by later runs, keyed by file content)
+MODEL_CACHE_DIR ?= ./results/.model_cache
+## Artifacts of the stages (edges, components, measures), keyed by content, code and options
+STAGE_CACHE_DIR ?= ./results/.stage_cache
 
 ## Path to the scripts
 PIPELINE_DIR ?= /home/bego/Documents/PROJECTS/METABOLOME/metabolic_evo-topo
@@ -30,6 +36,25 @@ CCOMPONENTS_DIR ?= $(OUTPUT_DIR)/connectedComponents
 SEQUENCES_DIR ?= $(OUTPUT_DIR)/sequences
 STATSBOOST_DIR ?= $(OUTPUT_DIR)/boosting
 PLOTS_DIR ?= $(OUTPUT_DIR)/plots
+PERMUT_DIR ?= $(OUTPUT_DIR)/permutations
+KNOCKOUT_DIR ?= $(OUTPUT_DIR)/knockouts
+NULL_DIR ?= $(OUTPUT_DIR)/nullModels
+CURRENCY_DIR ?= $(OUTPUT_DIR)/currencySweep
+## Run report of model2DRG and topology: JSON lines with time, memory and sizes of every stage
+## and measure (run_report.py). PROFILE = a stage or measure name (edges, genes, components,
+## measures, betweenness...) to run it under cProfile, e.g. make topology PROFILE=betweenness
+RUN_REPORT ?= $(OUTPUT_DIR)/run_report.jsonl
+PROFILE ?=
+REPORT_OPTS = --report $(RUN_REPORT) $(if $(PROFILE),--profile $(PROFILE))
+
+## Benchmark of the stages (benchmark_pipeline.py) and its stored baseline
+BENCH_DIR ?= ./results/benchmark
+BENCH_BASELINE ?= $(BENCH_DIR)/baseline.jsonl
+
+## Models of the batch runner (batch_runner.py): MATFILE:OUTPUT_DIR pairs, run together
+BATCH_MODELS ?= data/Recon2.v04/Recon2.v04.mat:./results/Recon2 data/Recon3D/Recon3D_301/Recon3DModel_301.mat:./results/Recon3DModel
+## Run report of the batch (all models)
+BATCH_REPORT ?= ./results/batch_report.jsonl
 
 
 ##~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~##
@@ -43,7 +68,6 @@ SED ?= /bin/sed
 MKDIR_P ?= /bin/mkdir -p 
 PYTHON ?= /usr/bin/python2
 RSCRIPT ?= /usr/bin/Rscript
-BEDTOOLS ?= /home/bego/Software/bedtools2/bin/intersectBed
 
 
 ##~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~##
@@ -55,8 +79,16 @@ BEDTOOLS ?= /home/bego/Software/bedtools2/bin/intersectBed
 ## NOTE: add command-line options here
 
 ## Create a directed reaction graph (DRG)
+## --backend objects | sparse (sparse matrix products, also writes adjacency.npz)
+## --currency list | names | degree:N | none (currency metabolites: fixed list, its 16 names in every
+## compartment, names in N or more reactions, or none; see currencySweep to choose N)
+## --model-cache folder (reuse model snapshots)
+## --stage-cache folder (reuse nodes/edges, subsystems and genes of unchanged inputs/code)
+MODEL2DRG_OPTS ?= --backend sparse --model-cache $(MODEL_CACHE_DIR) --stage-cache $(STAGE_CACHE_DIR)
 MODEL2DRG_SRC=$(SCRIPTS_DIR)/create_reaction_graph.py 
-MODEL2DRG_EXE=$(PYTHON) $(MODEL2DRG_SRC) 
+## Python modules of model2DRG and topology (changes are resolved by the stage cache)
+PYTHON_SRC=$(wildcard $(SCRIPTS_DIR)/*.py)
+MODEL2DRG_EXE=$(PYTHON) $(MODEL2DRG_SRC) $(MODEL2DRG_OPTS) $(REPORT_OPTS) 
 
 ## Extract gene coordinates & link to reactions
 COORD_SRC=$(SCRIPTS_DIR)/get_genes_coordinates.R 
@@ -67,8 +99,37 @@ SEQ_SRC=$(SCRIPTS_DIR)/get_genes_sequences.R
 SEQ_EXE=$(RSCRIPT) $(SEQ_SRC)
 
 ## Calculate topology measures of all connected components of a DRG
+## --jobs N (components in a pool of N processes)
+## --approx-samples K | --approx-error EPSILON [--seed S] (sampled closeness/betweenness + CI95)
+## --spectral-tol TOL --spectral-maxiter N (eigenvector/Katz/PageRank convergence)
+## --lists (also write the legacy COMPONENT/topology/*.list files, read by plotBoostTopo)
+## --stage-cache folder (reuse components and every unchanged measure)
+TOPOLOGY_OPTS ?= --jobs 1 --lists --stage-cache $(STAGE_CACHE_DIR)
 TOPOLOGY_SRC=$(SCRIPTS_DIR)/calculate_topology_RG.py 
-TOPOLOGY_EXE=$(PYTHON) $(TOPOLOGY_SRC) 
+TOPOLOGY_EXE=$(PYTHON) $(TOPOLOGY_SRC) $(TOPOLOGY_OPTS) $(REPORT_OPTS) 
+
+## Benchmark the stages: bundled models and synthetic models (sizes in multiples of Recon3D)
+## --skip measures (e.g. closeness,betweenness) --approx-samples K (sampled shortest-path measures)
+## --repeat N (best of N runs) --tolerance T (regression: slower than baseline * (1 + T))
+BENCH_MODELS ?= data/erythrocyte/iAB_RBC_283.mat data/Recon2.v04/Recon2.v04.mat data/Recon3D/Recon3D_301/Recon3DModel_301.mat
+BENCH_OPTS ?= $(addprefix --model ,$(BENCH_MODELS)) --synthetic 0.1,1,10 --approx-samples 500 --model-cache $(MODEL_CACHE_DIR)
+BENCH_SRC=$(SCRIPTS_DIR)/benchmark_pipeline.py
+BENCH_EXE=$(PYTHON) $(BENCH_SRC) $(BENCH_OPTS)
+
+## Consistency checks of the graph engines against networkx and the objects backend
+## --reactions N (size of the synthetic model and graph) --seed S
+CHECK_OPTS ?= --reactions 300 --seed 0
+CHECK_SRC=$(SCRIPTS_DIR)/check_engines.py
+CHECK_EXE=$(PYTHON) $(CHECK_SRC) $(CHECK_OPTS)
+
+## Run model2DRG, topology (and boostStats, permutationTests) of several models in one run
+## --jobs N (reaction graphs, components of all models and permutation tests in N processes)
+## --boosting folder (*.scores read once for all models with gene_coordinates.bed)
+## model2DRG/topology options: --backend, --model-cache, --stage-cache, --lists, --approx-samples...
+BATCH_OPTS ?= --jobs 4 --backend sparse --model-cache $(MODEL_CACHE_DIR) --stage-cache $(STAGE_CACHE_DIR) --lists \
+	--boosting $(DATABOOST_DIR) --thresholds $(BOOST_THRESHOLDS) --permutations 100000 --seed 46268008
+BATCH_SRC=$(SCRIPTS_DIR)/batch_runner.py
+BATCH_EXE=$(PYTHON) $(BATCH_SRC) $(BATCH_OPTS) --report $(BATCH_REPORT)
 
 ## Convert boosting files into BED
 PARSEBOOST_SRC=$(SCRIPTS_DIR)/HierBoosting2BED.sh
@@ -76,10 +137,44 @@ PARSEBOOST_EXE=$(SHELL) $(PARSEBOOST_SRC)
 BOOST_FILES=$(wildcard $(DATABOOST_DIR)/*.scores)
 BOOSTBED_FILES=$(patsubst $(DATABOOST_DIR)/%.scores, $(DATABOOST_DIR)/%.bed, $(BOOST_FILES))
 
-## Calculate boosting stats per gene
-STATSBOOST_SRC=$(SCRIPTS_DIR)/selection_score_stats.R
-STATSBOOST_EXE=$(RSCRIPT) $(STATSBOOST_SRC)
-STATSBOOST_FILES=$(patsubst $(DATABOOST_DIR)/%.bed, $(STATSBOOST_DIR)/%.intersect, $(BOOSTBED_FILES))
+## Calculate boosting stats per gene (mean/max score, selected) of all boosting tests
+## --chunk N (score windows read at a time)
+STATSBOOST_SRC=$(SCRIPTS_DIR)/boosting_stats.py
+STATSBOOST_EXE=$(PYTHON) $(STATSBOOST_SRC) --thresholds $(BOOST_THRESHOLDS)
+
+## Permutation tests of positive selected genes vs. centralities (p-values and null distributions)
+## --permutations B --seed S (random stream of every test) --jobs N (tests in N processes)
+## --components 000,001 (default: giant component)
+PERMUT_OPTS ?= --permutations 100000 --seed 46268008 --jobs 1 --thresholds $(BOOST_THRESHOLDS)
+PERMUT_SRC=$(SCRIPTS_DIR)/permutation_tests.py
+PERMUT_EXE=$(PYTHON) $(PERMUT_SRC) $(PERMUT_OPTS)
+
+## Knockout scan: topology deltas of the component of every deleted reaction
+## --jobs N (knockouts in N processes) --approx-samples K [--seed S] (betweenness from K sources)
+## --components 000,001 --reactions R1,R2 (subset of the knockouts)
+KNOCKOUT_OPTS ?= --jobs 4 --approx-samples 500 --seed 46268008 --stage-cache $(STAGE_CACHE_DIR)
+KNOCKOUT_SRC=$(SCRIPTS_DIR)/knockout_scan.py
+KNOCKOUT_EXE=$(PYTHON) $(KNOCKOUT_SRC) $(KNOCKOUT_OPTS) --report $(RUN_REPORT)
+
+## Null models: z-scores of the topology measures against degree-preserving rewirings
+## --replicates K (rewirings per component) --swaps Q (swaps tried per link) --self-loops keep|swap
+## --jobs N (rewirings in N processes) --seed S (rewirings and sampled sources)
+## --measures closeness,betweenness --components 000 --approx-samples K (as topology)
+NULL_OPTS ?= --replicates 200 --approx-samples 500 --jobs 4 --seed 46268008 --stage-cache $(STAGE_CACHE_DIR)
+NULL_SRC=$(SCRIPTS_DIR)/null_models.py
+NULL_EXE=$(PYTHON) $(NULL_SRC) $(NULL_OPTS) --report $(RUN_REPORT)
+
+## Currency sweep: reaction graphs and summary of the currency rules for every degree cutoff
+## --cutoffs 25,50,100 (reactions of a metabolite name) --no-graphs (summary only)
+CURRENCY_OPTS ?= --cutoffs 25,50,100,200,400,800 --model-cache $(MODEL_CACHE_DIR)
+CURRENCY_SRC=$(SCRIPTS_DIR)/currency_metabolites.py
+CURRENCY_EXE=$(PYTHON) $(CURRENCY_SRC) $(CURRENCY_OPTS) --report $(RUN_REPORT)
+
+## Query service over the reaction graph, genes and topology table (graph_server.py)
+## --port P [--host H] (local HTTP) | --socket FILE (Unix socket) --path-cache N (sources of paths kept)
+SERVER_OPTS ?= --port 8765 --path-cache 256
+SERVER_SRC=$(SCRIPTS_DIR)/graph_server.py
+SERVER_EXE=$(PYTHON) $(SERVER_SRC) $(SERVER_OPTS)
 
 ## Plot relation posotive genes boosting vs. centralities
 PLOTBOOST_SRC=$(SCRIPTS_DIR)/plot_PS_Boosting_Topology.R
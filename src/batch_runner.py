@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+
+'''
+
+Run model2DRG and topology (and optionally boostStats and the permutation tests) for
+several models in one process tree, with the same options:
+
+    python batch_runner.py [--jobs N] [--backend objects|sparse] [--currency list|names|degree:N|none]
+        [--model-cache folder] [--stage-cache folder] [--lists] [--approx-samples K | --approx-error EPSILON] [--seed S]
+        [--boosting folder --thresholds FILE [--permutations B]] [--report FILE]
+        matfile:OUTPUT_DIR ...
+
+Every model writes the folders of the Makefile under its OUTPUT_DIR: reactionGraph,
+connectedComponents (and boosting, permutations).
+
+    1. Reaction graphs: one task per model in a pool of N processes.
+    2. Topology: the connected components of every model are built in this process. Large
+    components (>= LARGE_COMPONENT nodes) are calculated first, one after the other, splitting
+    their sources across the N processes (as calculate_topology_RG.py --jobs N); then the
+    measures of the other components of all models are tasks of a single pool, largest
+    components first (schedule_components), so the run takes about the time of the largest
+    model instead of the sum. Cached measures (--stage-cache) are reused per model.
+    3. With --boosting (folder of *.scores): the boosting scores are read once for all the
+    models with gene_coordinates.bed (models_boosting_stats), then the permutation tests of
+    every model are tasks of the pool.
+
+Pools are created after the inputs of each phase are in memory: workers inherit them
+(nothing is pickled but the task positions and the results).
+
+'''
+import os
+import sys
+import glob
+import getopt
+import multiprocessing
+import create_reaction_graph
+import calculate_topology_RG
+import boosting_stats
+import permutation_tests
+import run_report
+import currency_metabolites
+import subsystem_graph
+from calculate_topology_RG import MeasureBuffer
+from gene_reactions import read_gene_reactions
+
+
+REACTION_GRAPH = 'reactionGraph'
+CCOMPONENTS = 'connectedComponents'
+BOOSTING = 'boosting'
+PERMUTATIONS = 'permutations'
+
+
+
+def make_folder(folder):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+
+
+def parse_models(args):
+    '''
+    matfile:OUTPUT_DIR arguments --> list of (matfile, output dir)
+    '''
+    models = []
+    for arg in args:
+        matfile, sep, output = arg.rpartition(':')
+        if not sep:
+            sys.exit('Expected matfile:OUTPUT_DIR, got ' + arg)
+        models.append((matfile, output))
+    return(models)
+
+
+
+def run_pool(function, tasks, jobs):
+    '''
+    Results of function over the tasks, in a pool of jobs processes (in order)
+    '''
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes=min(jobs, len(tasks)))
+        results = pool.map(function, tasks, chunksize=1)
+        pool.close()
+        pool.join()
+        return(results)
+    return([function(t) for t in tasks])
+
+
+
+_OPTIONS = {}
+
+def _graph_task(model):
+    matfile, output = model
+    folder = os.path.join(output, REACTION_GRAPH)
+    make_folder(folder)
+    print('\n## ' + matfile + ' --> ' + folder)
+    create_reaction_graph.build_reaction_graph(folder, matfile, _OPTIONS['backend'],
+                                               _OPTIONS['model_cache'], _OPTIONS['stage_cache'], _OPTIONS['currency'])
+    return(folder)
+
+
+
+def reaction_graphs(models, jobs):
+    '''
+    Phase 1: reaction graph of every model (largest model file first)
+    '''
+    order = sorted(models, key=lambda m: -os.path.getsize(m[0]))
+    run_pool(_graph_task, order, jobs)
+
+
+
+_MODELS = []
+_APPROX = None
+
+def _topology_task(task):
+    '''
+    Worker: measures of some components of a model (inherited from the parent process)
+    '''
+    m, positions = task
+    output, graphs, missing = _MODELS[m]
+    results = []
+    for pos in positions:
+        buffered = MeasureBuffer(output + '/' + graphs[pos].name)
+        results.append((pos, calculate_topology_RG.DG_topology(buffered, graphs[pos], 1, _APPROX, missing)))
+    return(m, results)
+
+
+
+def topology(models, jobs, approx=None, lists=False, cache_dir=None):
+    '''
+    Phase 2: components of every model and their measures on a single pool
+    '''
+    global _MODELS, _APPROX
+    state = []
+    for matfile, output in models:
+        print('\n## Components of ' + matfile)
+        folder = os.path.join(output, CCOMPONENTS)
+        make_folder(folder)
+        graphs, graph_key = calculate_topology_RG.reaction_graph_components(os.path.join(output, REACTION_GRAPH), cache_dir)
+        keys = calculate_topology_RG.measure_keys(graph_key, approx) if cache_dir else {}
+        produced, missing = calculate_topology_RG.cached_measures(graphs, cache_dir, keys)
+        state.append({'ifiles': os.path.join(output, REACTION_GRAPH), 'output': folder, 'graphs': graphs, 'keys': keys, 'produced': produced, 'missing': missing})
+
+    ## large components: sources split across the processes
+    large = []
+    if jobs > 1:
+        large = [(m, pos) for m, s in enumerate(state) if s['missing'] for pos, comp in enumerate(s['graphs'])
+                 if comp.number_of_nodes() >= calculate_topology_RG.LARGE_COMPONENT and comp.number_of_edges() > 0]
+    large.sort(key=lambda t: -state[t[0]]['graphs'][t[1]].number_of_nodes())
+    for m, pos in large:
+        s = state[m]
+        comp = s['graphs'][pos]
+        print('\nComponent: ' + s['output'] + '/' + comp.name)
+        s['produced'][comp.name].update(calculate_topology_RG.DG_topology(MeasureBuffer(s['output'] + '/' + comp.name),
+                                                                          comp, jobs, approx, s['missing']))
+
+    tasks = []
+    for m, s in enumerate(state):
+        if s['missing']:
+            skip = set(pos for l, pos in large if l == m)
+            tasks += [(m, positions) for positions in calculate_topology_RG.schedule_components(s['graphs'], skip)]
+    ## largest first across models
+    tasks.sort(key=lambda t: -max(state[t[0]]['graphs'][pos].number_of_nodes() for pos in t[1]))
+    print('\nCalculating topology: ' + str(len(tasks)) + ' tasks of ' + str(len(models)) +
+          ' models in ' + str(jobs) + ' processes')
+
+    _MODELS = [(s['output'], s['graphs'], s['missing']) for s in state]
+    _APPROX = approx
+    for m, results in run_pool(_topology_task, tasks, jobs):
+        for pos, items in results:
+            state[m]['produced'][state[m]['graphs'][pos].name].update(items)
+    _MODELS, _APPROX = [], None
+
+    for s in state:
+        if s['graphs']:
+            calculate_topology_RG.finish_topology(s['output'], s['graphs'], s['produced'], s['missing'],
+                                                  lists, cache_dir, s['keys'])
+            subsystem_graph.write_topology_summary(s['ifiles'], s['output'])
+            calculate_topology_RG.write_connected_components(s['output'], s['graphs'])
+        else:
+            print('No connected components found')
+
+
+
+_TESTS = {}
+
+def _permutation_task(output):
+    folder = os.path.join(output, PERMUTATIONS)
+    make_folder(folder)
+    gene_map = read_gene_reactions(os.path.join(output, REACTION_GRAPH, 'geneReactions.list'))
+    tests = permutation_tests.read_boosting_tests(sorted(glob.glob(os.path.join(output, BOOSTING, '*.txt'))),
+                                                  _TESTS['thresholds'])
+    rows = permutation_tests.component_tests('000', gene_map, os.path.join(output, CCOMPONENTS), tests,
+                                             folder, _TESTS['permutations'], _TESTS['seed'])
+    permutation_tests.write_tests(folder, rows)
+    return(output)
+
+
+
+def selection(models, jobs, boosting_dir, thresholds, permutations, seed):
+    '''
+    Phase 3: boosting statistics of the models with gene coordinates (scores read once)
+    and their permutation tests
+    '''
+    global _TESTS
+    outputs = [output for matfile, output in models
+               if os.path.exists(os.path.join(output, REACTION_GRAPH, 'gene_coordinates.bed'))]
+    for matfile, output in models:
+        if output not in outputs:
+            print('No gene_coordinates.bed in ' + output + ' (run get_genes_coordinates.R), no boosting tests')
+    if not outputs:
+        return
+    for output in outputs:
+        make_folder(os.path.join(output, BOOSTING))
+    boosting_stats.models_boosting_stats([os.path.join(output, REACTION_GRAPH, 'gene_coordinates.bed') for output in outputs],
+                                         [os.path.join(output, BOOSTING) for output in outputs],
+                                         sorted(glob.glob(os.path.join(boosting_dir, '*.scores'))), thresholds)
+    _TESTS = {'thresholds': thresholds, 'permutations': permutations, 'seed': seed}
+    run_pool(_permutation_task, outputs, jobs)
+    _TESTS = {}
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: see the docstring
+    opts, args = getopt.getopt(sys.argv[1:], 'j:b:', ['jobs=', 'backend=', 'currency=', 'model-cache=', 'stage-cache=',
+                               'lists', 'approx-samples=', 'approx-error=', 'seed=', 'boosting=', 'thresholds=',
+                               'permutations=', 'report='])
+    jobs = 1
+    _OPTIONS = {'backend': 'objects', 'currency': 'list', 'model_cache': None, 'stage_cache': None}
+    approx = {}
+    lists = False
+    boosting_dir, report = None, None
+    thresholds_file = boosting_stats.THRESHOLDS_FILE
+    permutations = permutation_tests.PERMUTATIONS
+    for opt, arg in opts:
+        if opt in ('-j', '--jobs'):
+            jobs = int(arg)
+        elif opt in ('-b', '--backend'):
+            _OPTIONS['backend'] = arg
+        elif opt == '--currency':
+            _OPTIONS['currency'] = arg
+        elif opt == '--model-cache':
+            _OPTIONS['model_cache'] = arg
+        elif opt == '--stage-cache':
+            _OPTIONS['stage_cache'] = arg
+        elif opt == '--lists':
+            lists = True
+        elif opt == '--approx-samples':
+            approx['samples'] = int(arg)
+        elif opt == '--approx-error':
+            approx['epsilon'] = float(arg)
+        elif opt == '--seed':
+            approx['seed'] = int(arg)
+        elif opt == '--boosting':
+            boosting_dir = arg
+        elif opt == '--thresholds':
+            thresholds_file = arg
+        elif opt == '--permutations':
+            permutations = int(arg)
+        elif opt == '--report':
+            report = arg
+    if _OPTIONS['backend'] not in ('objects', 'sparse'):
+        sys.exit('Unknown backend: ' + _OPTIONS['backend'] + ' (objects | sparse)')
+    try:
+        currency_metabolites.rule_cutoff(_OPTIONS['currency'])
+    except ValueError as e:
+        sys.exit(str(e))
+    seed = approx.get('seed', permutation_tests.SEED)
+    if 'samples' not in approx and 'epsilon' not in approx:
+        approx = {}     # --seed alone: exact calculation
+    models = parse_models(args)
+    if report and os.path.dirname(report) and not os.path.exists(os.path.dirname(report)):
+        os.makedirs(os.path.dirname(report))
+    run_report.start(report, 'batch_runner.py')
+
+    with run_report.stage('reaction_graphs', models=len(models)):
+        reaction_graphs(models, jobs)
+    with run_report.stage('topology', models=len(models), jobs=jobs):
+        topology(models, jobs, approx, lists, _OPTIONS['stage_cache'])
+    if boosting_dir:
+        with run_report.stage('selection', models=len(models)):
+            selection(models, jobs, boosting_dir, boosting_stats.read_thresholds(thresholds_file), permutations, seed)
+    run_report.finish()
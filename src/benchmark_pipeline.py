@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+
+'''
+
+Benchmark of the pipeline stages on the bundled models and on synthetic models of
+controlled size, to follow throughput and memory before loading new reconstructions.
+
+Steps timed on every model:
+    - make_edge_file            edges per reaction (objects backend, no currency)
+    - make_edge_files_sparse    both edge files with sparse matrix products
+    - make_geneReaction_file
+    - get_connected_components
+    - DG_metrics                CSR adjacency and degree arrays of every component
+    - DG_<measure>              every measure of TOPOLOGY_MEASURES, on all components
+
+Every step runs in its own forked process: wall time, peak RSS of that process
+(ru_maxrss, includes the inputs of the step) and edges per second (links written,
+gene-reaction pairs, or links of the components processed). Results are written as JSON lines, one per step:
+
+    {"model", "step", "reactions", "nodes", "edges", "wall_s", "peak_rss_mb",
+     "edges_per_s", "python", "networkx", "numpy", "date"}
+
+Synthetic models (--synthetic SCALES, multiples of the Recon3D size) draw metabolites
+with a skewed popularity (a few hubs, as real reconstructions), a share of currency
+metabolites (CURRENCY_METABOLITES) and of reversible reactions.
+
+With --baseline FILE, every step is compared with the same model/step of a previous
+run: ratio of wall times, steps slower than 1 + tolerance are reported as regressions.
+With --repeat N every step runs N times and the best wall time is kept.
+
+    python benchmark_pipeline.py [--model matfile]... [--synthetic 0.1,1,10]
+        [--model-cache folder] [--skip closeness,betweenness] [--approx-samples K]
+        [--repeat N] [--baseline FILE] [--tolerance 0.2] output.jsonl
+
+'''
+import os
+import sys
+import json
+import time
+import getopt
+import shutil
+import tempfile
+import platform
+import multiprocessing
+try:
+    from Queue import Empty
+except ImportError:     # Python 3
+    from queue import Empty
+import numpy as np
+import scipy.sparse as sp
+import networkx as nx
+import create_reaction_graph
+import sparse_reaction_graph
+import calculate_topology_RG
+from model_loader import CompactModel
+from run_report import peak_rss_mb
+from graph_core import GraphCore
+from create_reaction_graph import CURRENCY_METABOLITES
+from calculate_topology_RG import MeasureBuffer, TOPOLOGY_MEASURES, SHORTEST_PATH_MEASURES
+
+
+## Size of Recon3DModel_301 (reactions without biomass, metabolites, genes): scale 1 of --synthetic
+RECON3D_REACTIONS = 10597
+RECON3D_METABOLITES = 5835
+RECON3D_GENES = 2248
+
+## Default shape of the synthetic models (as Recon3D)
+METABOLITES_PER_REACTION = 3.8
+REVERSIBLE_SHARE = 0.5
+CURRENCY_SHARE = 0.2
+SUBSYSTEMS = 100
+
+## Seconds between checks that the process of a step is still running
+POLL_SECONDS = 1.0
+
+## Steps slower than baseline * (1 + TOLERANCE) are regressions, unless both take less than
+## MIN_SECONDS (timer noise)
+TOLERANCE = 0.2
+MIN_SECONDS = 0.05
+
+
+
+def synthetic_model(n_reactions, mets_per_reaction=METABOLITES_PER_REACTION,
+                    reversible_share=REVERSIBLE_SHARE, currency_share=CURRENCY_SHARE,
+                    n_metabolites=None, n_genes=None, seed=0):
+    '''
+    CompactModel with n_reactions reactions:
+        - participants per reaction: 2 + Poisson(mets_per_reaction - 2), half reactants
+        - a participant is a currency metabolite with probability currency_share,
+        otherwise a metabolite drawn with weight 1/(rank + 10)
+        - reversible reactions (lb < 0 < ub): reversible_share
+        - 1-3 Entrez-like genes per reaction, subsystems in turn
+    '''
+    rng = np.random.RandomState(seed)
+    scale = n_reactions / float(RECON3D_REACTIONS)
+    if n_metabolites is None:
+        n_metabolites = max(10, int(RECON3D_METABOLITES * scale))
+    if n_genes is None:
+        n_genes = max(5, int(RECON3D_GENES * scale))
+    currency = sorted(CURRENCY_METABOLITES)
+    metabolite_ids = currency + ['m%07d[c]' % i for i in range(n_metabolites)]
+    weight = 1.0 / (np.arange(n_metabolites) + 10.0)
+    weight /= weight.sum()
+
+    size = 2 + rng.poisson(max(0.0, mets_per_reaction - 2.0), n_reactions)
+    total = int(size.sum())
+    is_currency = rng.random_sample(total) < currency_share
+    rows = np.where(is_currency, rng.randint(0, len(currency), total),
+                    len(currency) + rng.choice(n_metabolites, total, p=weight))
+    cols = np.repeat(np.arange(n_reactions), size)
+    ## first half of the participants of a reaction are reactants
+    first = np.repeat(np.cumsum(size) - size, size)
+    coef = np.where(np.arange(total) - first < np.repeat(size // 2, size), -1.0, 1.0)
+    S = sp.csc_matrix((coef, (rows, cols)), shape=(len(metabolite_ids), n_reactions))
+    S.sum_duplicates()
+    S.eliminate_zeros()
+
+    per_reaction = rng.randint(1, 4, n_reactions)
+    g_rows = rng.randint(0, n_genes, int(per_reaction.sum()))
+    g_cols = np.repeat(np.arange(n_reactions), per_reaction)
+    G = sp.csc_matrix((np.ones(len(g_rows), dtype=np.int8), (g_rows, g_cols)), shape=(n_genes, n_reactions))
+    G.sum_duplicates()
+    G.data[:] = 1
+
+    reversible = rng.random_sample(n_reactions) < reversible_share
+    lb = np.where(reversible, -1000.0, 0.0)
+    ub = np.full(n_reactions, 1000.0)
+    return(CompactModel(S, G, lb, ub, ['R%07d' % j for j in range(n_reactions)], metabolite_ids,
+                        ['%d.1' % (10000 + i) for i in range(n_genes)],
+                        ['Subsystem %d' % (j % SUBSYSTEMS) for j in range(n_reactions)],
+                        id='synthetic-%d' % n_reactions))
+
+
+
+def _child(queue, step):
+    try:
+        start = time.time()
+        edges = step()
+        wall = time.time() - start
+        queue.put((wall, peak_rss_mb(), edges, None))
+    except Exception as e:
+        queue.put((None, peak_rss_mb(), None, '%s: %s' % (type(e).__name__, e)))
+
+
+
+def run_step(step):
+    '''
+    Run step() in a forked process: wall time (s), peak RSS (MB), edges processed
+    (returned by the step) and error (None if it finished). A process that dies
+    without a result (e.g. killed out of memory) is a failed step with its exit code.
+    '''
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_child, args=(queue, step))
+    p.start()
+    while True:
+        try:
+            result = queue.get(timeout=POLL_SECONDS)
+            break
+        except Empty:
+            if not p.is_alive():
+                try:
+                    result = queue.get(timeout=POLL_SECONDS)
+                except Empty:
+                    result = (None, None, None, 'process exited with code %s' % p.exitcode)
+                break
+    p.join()
+    return(result)
+
+
+
+def model_steps(model, out, skip=(), approx=None):
+    '''
+    Steps of the benchmark of a model: list of (name, function returning edges processed).
+    Inputs of later steps (graph, components, metrics) are built here once.
+    '''
+    steps = [('make_edge_file', lambda: len(create_reaction_graph.make_edge_file(out, model, rm_currency=True))),
+             ('make_edge_files_sparse', lambda: sum(len(e) for e in
+                sparse_reaction_graph.make_edge_files(out, model, CURRENCY_METABOLITES))),
+             ('make_geneReaction_file', lambda: len(create_reaction_graph.make_geneReaction_file(out, model)))]
+
+    edges = sparse_reaction_graph.make_edge_files(out, model, CURRENCY_METABOLITES)[1]
+    DG = GraphCore.from_edges(model.reaction_ids, (e.split('\t') for e in edges), 'ReactionGraph')
+    steps.append(('get_connected_components',
+                  lambda: sum(c.number_of_edges() for c in calculate_topology_RG.get_connected_components(DG))))
+    components = calculate_topology_RG.get_connected_components(DG)
+    steps.append(('DG_metrics', lambda: sum(calculate_topology_RG.DG_metrics(c)['adjacency'].nnz for c in components)))
+    metrics = [calculate_topology_RG.DG_metrics(c) for c in components]
+
+    def measure_step(name, function):
+        def step():
+            for comp, m in zip(components, metrics):
+                if name in SHORTEST_PATH_MEASURES:
+                    function(MeasureBuffer(), comp, 1, approx, m)
+                else:
+                    function(MeasureBuffer(), comp, m)
+            return(DG.number_of_edges())
+        return(step)
+    for name, function, code in TOPOLOGY_MEASURES:
+        if name not in skip:
+            steps.append(('DG_' + name, measure_step(name, function)))
+    return(steps, DG)
+
+
+
+def benchmark_model(name, model, skip=(), approx=None, repeat=1):
+    '''
+    Records (dictionaries) of every step of the model (best wall time of repeat runs)
+    '''
+    out = tempfile.mkdtemp(prefix='benchmark_')
+    try:
+        steps, DG = model_steps(model, out, skip, approx)
+        info = {'model': name, 'reactions': len(model.reaction_ids),
+                'nodes': DG.number_of_nodes(), 'edges': DG.number_of_edges(),
+                'python': platform.python_version(), 'networkx': nx.__version__,
+                'numpy': np.__version__, 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+        records = []
+        for step_name, step in steps:
+            print('\n## ' + name + ': ' + step_name)
+            runs = [run_step(step) for i in range(repeat)]
+            wall, rss, edges, error = min(runs, key=lambda r: (r[0] is None, r[0]))
+            rss = [r[1] for r in runs if r[1] is not None]
+            record = dict(info, step=step_name, wall_s=wall, peak_rss_mb=round(max(rss), 1) if rss else None)
+            record['edges_per_s'] = edges / wall if wall and edges is not None else None
+            if error:
+                record['error'] = error
+            records.append(record)
+    finally:
+        shutil.rmtree(out)
+    return(records)
+
+
+
+def read_records(filename):
+    f = open(filename)
+    records = [json.loads(line) for line in f if line.strip()]
+    f.close()
+    return(records)
+
+
+
+def compare(records, baseline, tolerance=TOLERANCE):
+    '''
+    Add the ratio of wall times to the baseline (same model and step) to every record.
+    Returns the records slower than 1 + tolerance.
+    '''
+    previous = dict(((r['model'], r['step']), r) for r in baseline)
+    regressions = []
+    for r in records:
+        b = previous.get((r['model'], r['step']))
+        if b is None or not b.get('wall_s') or r.get('wall_s') is None:
+            continue
+        r['baseline_wall_s'] = b['wall_s']
+        r['ratio'] = r['wall_s'] / b['wall_s']
+        if r['ratio'] > 1.0 + tolerance and max(r['wall_s'], b['wall_s']) >= MIN_SECONDS:
+            regressions.append(r)
+    return(regressions)
+
+
+
+def report(records):
+    print('\n%-22s %-26s %10s %10s %12s %8s' % ('MODEL', 'STEP', 'WALL_S', 'RSS_MB', 'EDGES/S', 'RATIO'))
+    for r in records:
+        wall = '%.3f' % r['wall_s'] if r.get('wall_s') is not None else r.get('error', 'NA')
+        rate = '%.0f' % r['edges_per_s'] if r.get('edges_per_s') else 'NA'
+        rss = '%.1f' % r['peak_rss_mb'] if r.get('peak_rss_mb') is not None else 'NA'
+        ratio = '%.2f' % r['ratio'] if 'ratio' in r else ''
+        print('%-22s %-26s %10s %10s %12s %8s' % (r['model'], r['step'], wall, rss, rate, ratio))
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: [--model matfile]... [--synthetic scales] [--model-cache folder] [--skip measures]
+    ## [--approx-samples K] [--seed S] [--repeat N] [--baseline file] [--tolerance T] output.jsonl
+    opts, args = getopt.getopt(sys.argv[1:], 'm:s:', ['model=', 'synthetic=', 'model-cache=', 'skip=',
+                               'approx-samples=', 'seed=', 'repeat=', 'baseline=', 'tolerance='])
+    matfiles, scales = [], []
+    model_cache, baseline, approx = None, None, None
+    skip = ()
+    tolerance = TOLERANCE
+    seed = 0
+    repeat = 1
+    for opt, arg in opts:
+        if opt in ('-m', '--model'):
+            matfiles.append(arg)
+        elif opt in ('-s', '--synthetic'):
+            scales = [float(s) for s in arg.split(',') if s]
+        elif opt == '--model-cache':
+            model_cache = arg
+        elif opt == '--skip':
+            skip = tuple(s for s in arg.split(',') if s)
+        elif opt == '--approx-samples':
+            approx = {'samples': int(arg)}
+        elif opt == '--seed':
+            seed = int(arg)
+        elif opt == '--repeat':
+            repeat = int(arg)
+        elif opt == '--baseline':
+            baseline = arg
+        elif opt == '--tolerance':
+            tolerance = float(arg)
+    if approx is not None:
+        approx['seed'] = seed
+    output = args[0]
+
+    records = []
+    for matfile in matfiles:
+        model = create_reaction_graph.load_graph_model(matfile, model_cache)
+        records += benchmark_model(os.path.splitext(os.path.basename(matfile))[0], model, skip, approx, repeat)
+    for scale in scales:
+        model = synthetic_model(int(round(RECON3D_REACTIONS * scale)), seed=seed)
+        records += benchmark_model('synthetic-x%g' % scale, model, skip, approx, repeat)
+
+    regressions = compare(records, read_records(baseline), tolerance) if baseline else []
+    f = open(output, 'w')
+    for r in records:
+        f.write(json.dumps(r, sort_keys=True) + '\n')
+    f.close()
+    report(records)
+    if baseline:
+        print('\n' + str(len(regressions)) + ' steps slower than the baseline (tolerance ' + str(tolerance) + ')')
+        for r in regressions:
+            print('    ' + r['model'] + ' ' + r['step'] + ': x%.2f' % r['ratio'])
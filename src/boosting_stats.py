@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+'''
+
+Mean and maximum hierarchical boosting score of every gene, for all the boosting
+tests (populations) in one run, reading the *.scores files directly.
+Replaces HierBoosting2BED.sh + intersectBed + selection_score_stats.R (same output).
+
+    - Gene windows: gene_coordinates.bed (get_genes_coordinates.R), already extended
+    10 kb up/downstream: chromosome, start, end, entrezgene, hgnc_symbol.
+    Indexed by chromosome and sorted by start.
+    - Boosting scores: whole_genome.POP.TEST.boosting.scores, read in chunks
+    (gridID chromosome start end score, header line). Every chunk of windows is
+    intersected with the sorted gene windows (overlap of at least 1 bp, BED half-open
+    intervals as intersectBed) and the scores are accumulated by gene window:
+    the intermediate BED and intersect files are not written.
+    - Statistics by gene symbol (as selection_score_stats.R): mean and maximum score of
+    the windows overlapping any gene window with that symbol.
+    - Significance: maxBoost >= threshold of the test (thresholds_of_significance.txt).
+    - Several models (models_boosting_stats): the gene windows of all models are indexed
+    together and every scores file is read once.
+
+Output, one file per test (POP_TEST.txt):
+    hgnc_symbol  GENE  meanBoost  maxBoost  selected (1: positive selection, 0: not, NA: no threshold)
+
+    python boosting_stats.py [--thresholds FILE] [--chunk N] gene_coordinates.bed output_folder scores...
+
+'''
+import os
+import sys
+import getopt
+import numpy as np
+import pandas as pd
+
+
+THRESHOLDS_FILE = 'data/hierarchical_boosting/thresholds_of_significance.txt'
+
+## Boosting windows read at a time
+CHUNK = 200000
+
+
+
+def test_name(scores_file):
+    '''
+    Name of the boosting test: whole_genome.CEU.Complete.boosting.scores --> CEU_Complete
+    '''
+    filename = os.path.basename(scores_file)
+    filename = filename.split('whole_genome.', 1)[-1]
+    return('_'.join(filename.split('.')[:2]))
+
+
+
+def read_thresholds(filename):
+    '''
+    {TEST: threshold of significance}
+    '''
+    thresholds = {}
+    f = open(filename)
+    for line in f:
+        fields = line.split()
+        if len(fields) >= 2:
+            thresholds[fields[0]] = float(fields[1])
+    f.close()
+    return(thresholds)
+
+
+
+def read_gene_windows(bedfiles):
+    '''
+    Gene windows of the gene_coordinates.bed files (one per model):
+        - genes: list of (entrezgene, hgnc_symbol), one per line of the files
+        - index: {chromosome: (starts, ends, lines, longest window)} sorted by start
+        - slices: lines of every file in genes
+    '''
+    genes, slices = [], []
+    by_chrom = {}
+    for bedfile in bedfiles:
+        first = len(genes)
+        f = open(bedfile)
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 5:
+                continue
+            by_chrom.setdefault(fields[0], []).append((int(fields[1]), int(fields[2]), len(genes)))
+            genes.append((fields[3], fields[4]))
+        f.close()
+        slices.append(slice(first, len(genes)))
+    index = {}
+    for chrom, windows in by_chrom.items():
+        windows.sort()
+        starts = np.array([w[0] for w in windows], dtype=np.int64)
+        ends = np.array([w[1] for w in windows], dtype=np.int64)
+        lines = np.array([w[2] for w in windows], dtype=np.int64)
+        index[chrom] = (starts, ends, lines, int((ends - starts).max()))
+    return(genes, index, slices)
+
+
+
+def overlaps(chrom_index, w_start, w_end):
+    '''
+    Pairs (boosting window, gene line) that overlap: gene start < window end and
+    gene end > window start. Candidates are the genes starting in
+    [window start - longest gene window, window end).
+    '''
+    starts, ends, lines, longest = chrom_index
+    lo = np.searchsorted(starts, w_start - longest, 'left')
+    hi = np.searchsorted(starts, w_end, 'left')
+    n = np.maximum(hi - lo, 0)
+    window = np.repeat(np.arange(len(w_start)), n)
+    offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    candidate = np.repeat(lo, n) + offset
+    keep = ends[candidate] > w_start[window]
+    return(window[keep], lines[candidate[keep]])
+
+
+
+def read_scores(scores_file, chunk=CHUNK):
+    '''
+    Chunks (DataFrames: chromosome, start, end, score) of a boosting scores file
+    '''
+    return(pd.read_csv(scores_file, sep=r'\s+', header=None, skiprows=1,
+                       usecols=[1, 2, 3, 4], names=['chromosome', 'start', 'end', 'score'],
+                       dtype={'chromosome': str}, chunksize=chunk))
+
+
+
+def accumulate_scores(scores_file, n_genes, index, chunk=CHUNK):
+    '''
+    Sum, number and maximum of the scores of the windows overlapping every gene line
+    '''
+    total = np.zeros(n_genes)
+    count = np.zeros(n_genes, dtype=np.int64)
+    top = np.full(n_genes, -np.inf)
+    for block in read_scores(scores_file, chunk):
+        chrom = ('chr' + block['chromosome']).values
+        w_start = block['start'].values.astype(np.int64)
+        w_end = block['end'].values.astype(np.int64)
+        score = block['score'].values.astype(np.float64)
+        for c in np.unique(chrom):
+            if c not in index:
+                continue
+            rows = np.flatnonzero(chrom == c)
+            window, line = overlaps(index[c], w_start[rows], w_end[rows])
+            s = score[rows][window]
+            np.add.at(total, line, s)
+            np.add.at(count, line, 1)
+            np.maximum.at(top, line, s)
+    return(total, count, top)
+
+
+
+def gene_stats(genes, total, count, top):
+    '''
+    Mean and maximum score by gene symbol, rows (symbol, entrezgene, mean, max)
+    of the gene lines with windows, sorted by symbol (as selection_score_stats.R)
+    '''
+    sym_total, sym_count, sym_top = {}, {}, {}
+    pairs = set()
+    for i, (entrez, symbol) in enumerate(genes):
+        if count[i] == 0 or symbol in ('', 'NA'):
+            continue
+        sym_total[symbol] = sym_total.get(symbol, 0.0) + total[i]
+        sym_count[symbol] = sym_count.get(symbol, 0) + count[i]
+        sym_top[symbol] = max(sym_top.get(symbol, -np.inf), top[i])
+        pairs.add((symbol, entrez))
+    return([(symbol, entrez, sym_total[symbol] / sym_count[symbol], sym_top[symbol])
+            for symbol, entrez in sorted(pairs)])
+
+
+
+def _number(x):
+    if x != x:      # NaN
+        return('NA')
+    return('%.15g' % x)
+
+
+
+def write_stats(filename, stats, threshold=None):
+    f = open(filename, 'w')
+    f.write('hgnc_symbol\tGENE\tmeanBoost\tmaxBoost\tselected\n')
+    for symbol, entrez, mean, top in stats:
+        if threshold is None or top != top:
+            selected = 'NA'
+        else:
+            selected = '1' if top >= threshold else '0'
+        f.write('\t'.join([symbol, entrez, _number(mean), _number(top), selected]) + '\n')
+    f.close()
+
+
+
+def boosting_stats(bedfile, output, scores_files, thresholds=None, chunk=CHUNK):
+    '''
+    Statistics of every boosting test: output/TEST.txt. Returns {TEST: rows}.
+    '''
+    return(models_boosting_stats([bedfile], [output], scores_files, thresholds, chunk)[0])
+
+
+
+def models_boosting_stats(bedfiles, outputs, scores_files, thresholds=None, chunk=CHUNK):
+    '''
+    boosting_stats of several models (gene windows bedfiles[i], statistics in outputs[i])
+    reading every scores file once. Returns [{TEST: rows}] by model.
+    '''
+    genes, index, slices = read_gene_windows(bedfiles)
+    thresholds = thresholds or {}
+    results = [{} for output in outputs]
+    for scores_file in scores_files:
+        test = test_name(scores_file)
+        print('Processing ' + scores_file)
+        total, count, top = accumulate_scores(scores_file, len(genes), index, chunk)
+        for i, (output, lines) in enumerate(zip(outputs, slices)):
+            stats = gene_stats(genes[lines], total[lines], count[lines], top[lines])
+            write_stats(os.path.join(output, test + '.txt'), stats, thresholds.get(test))
+            print('    ' + test + ': ' + str(len(stats)) + ' genes (' + output + ')')
+            results[i][test] = stats
+    return(results)
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: [--thresholds FILE] [--chunk N] gene_coordinates.bed output_folder scores...
+    opts, args = getopt.getopt(sys.argv[1:], 't:', ['thresholds=', 'chunk='])
+    thresholds_file = THRESHOLDS_FILE
+    chunk = CHUNK
+    for opt, arg in opts:
+        if opt in ('-t', '--thresholds'):
+            thresholds_file = arg
+        elif opt == '--chunk':
+            chunk = int(arg)
+    bedfile = args[0]
+    output = args[1]
+    if not os.path.exists(output):
+        os.makedirs(output)
+    boosting_stats(bedfile, output, args[2:], read_thresholds(thresholds_file), chunk)
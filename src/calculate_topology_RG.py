@@ -10,11 +10,51 @@
     - Return node properties: dictionaries keyed by node label
     {REACTION: VALUE}
 
+    - Graph and components are compact graph cores (graph_core.py): interned reaction IDs,
+    int32 CSR arrays shared with the measures, networkx graphs only built on demand.
+
+    - Output: columnar table of all measures of the run (cComponents/topology_table, 
+    see topology_table.py), and with --lists the legacy cComponents/COMPONENT/topology/*.list files.
+    Mean/max of every numeric measure by subsystem: cComponents/subsystem_topology.txt
+    (subsystem_graph.py, from reactionSubsystems.list of the reaction graph).
+
+    - Stage cache (--stage-cache folder): connected components and every measure are 
+    reused from previous runs with the same input graph, code and parameters (stage_cache.py). 
+    Changing one measure only recalculates that measure.
+
+    - Approximate mode (--approx-samples K | --approx-error EPSILON [--seed S]):
+    closeness and betweenness of components larger than the sample are estimated 
+    from K sampled source nodes (path_centrality). Their files get a first comment line
+    (# approximate ...) and a CI95 column (half-width of the 95% interval: empirical
+    Bernstein bound for betweenness, normal approximation for closeness).
+
+    - Run report (--report FILE [--profile NAME]): time, CPU and peak memory of every stage
+    and of every measure of every component, as JSON lines (run_report.py).
+
 '''
 
 import os
 import sys
+import getopt
+import inspect
+import multiprocessing
 import networkx as nx
+import graph_core
+import path_centrality
+import csr_metrics
+import reachability
+import spectral
+import topology_table
+import subsystem_graph
+import stage_cache
+import run_report
+
+
+## Components smaller than this are batched together in a single task (--jobs)
+SMALL_COMPONENT = 50
+BATCH_NODES = 2000
+## Components from this size split betweenness/closeness sources across processes (--jobs)
+LARGE_COMPONENT = 1000
 
 
 def progress(count, total):
@@ -40,143 +80,231 @@ def make_folder(folder):
     
     
 
-def create_directed_RG(out):
+class MeasureBuffer(list):
+    '''
+    Pass as the out argument of the DG_* functions to keep the measures in memory
+    instead of writing them: list of (filename, header, measure, message, error, comment).
+    Write them later with write_measures. folder: output folder of the component.
     '''
-    Create a DIRECTED Reaction Graph
+    def __init__(self, folder=None):
+        list.__init__(self)
+        self.folder = folder
+
+
+
+def write_measure(out, filename, header, measure, message=None, error=None, comment=None):
     '''
-    edges_model = open(out + '/edge.list', 'rb')
-    nodes_model = open(out + '/node.list', 'rb')
-    nodes_model2 = nodes_model.read().splitlines()
+    Write a node measure {REACTION: VALUE} in out/topology/filename (sorted by REACTION).
+    Optional error {REACTION: CI95} column and first comment line (# comment).
+    '''
+    if isinstance(out, MeasureBuffer):
+        out.append((filename, header, measure, message, error, comment))
+        return
+    make_folder(out+'/topology')
+    f = open(out+'/topology/'+filename,'w')
+    if comment:
+        f.write('# '+comment+'\n')
+    if error is None:
+        f.write('REACTION\t'+header+'\n')
+        for k in sorted(measure):
+            f.write(k+'\t'+str(measure[k])+ '\n')
+    else:
+        f.write('REACTION\t'+header+'\tCI95\n')
+        for k in sorted(measure):
+            f.write(k+'\t'+str(measure[k])+'\t'+str(error[k])+ '\n')
+    f.close()
+    if message:
+        print(message)
+
+
+
+def write_measures(out, buffered):
+    for item in buffered:
+        write_measure(out, *item)
 
-    DG = nx.read_edgelist(edges_model, create_using=nx.DiGraph(), delimiter = '\t')
-    DG.add_nodes_from(nodes_model2)
-    DG.name = 'ReactionGraph'
-    DG = nx.freeze(DG)
+
+
+def create_directed_RG(out):
+    '''
+    Create a DIRECTED Reaction Graph (graph core, not modified afterwards)
+    '''
+    DG = graph_core.read_reaction_graph(out, 'ReactionGraph')
     ## Some stats about the graph
     f = open(out + '/stats.txt','w')
-    f.write(nx.info(DG)+'\n')
+    f.write(DG.info()+'\n')
     f.close()    
     return(DG)
 
 
-def get_connected_components(out, DG):
+def get_connected_components(DG, node_sets=None):
     '''
-    To obtain the connected components we need to create an INDIRECTED graph from 
-    a DIRECTED graph. To transform it again to a DIRECTED graph we need to remove
-    the duplicated links.     
-    Returns a sorted list of DIRECTED connected components (Giant component first). 
-    Writes: 
-        - edgelist for each component --> read with: nx.read_edgelist(filename,create_using=nx.DiGraph())
-        - nodelist for each component: isolated nodes have empty edgelist.
-    
+    Connected components of the DIRECTED graph (weakly connected components), taken 
+    directly as induced subgraphs: they keep only the original directed links.
+    Returns a sorted list of DIRECTED connected components (Giant component first,
+    ties by first reaction label) named 000, 001, ... 
+    Files are written at the end with write_connected_component.
+    node_sets: nodes of the components (connected_node_sets) if already calculated.
     '''   
-    UDG = DG.to_undirected()
+    if node_sets is None:
+        node_sets = connected_node_sets(DG)
+
+    components = [component_graph(DG, '%03d' % count, nodes) for count, nodes in enumerate(node_sets)]
+
+    print('\nNumber of connected components: '+str(len(components)))
+
+    return(components)
+
+
+
+def connected_node_sets(DG):
+    '''
+    Nodes of the weakly connected components, sorted (largest first, ties by first
+    reaction label). Each list keeps the order of the nodes in the graph.
+    '''
     print('\nCalculating number of connected components...')
-    CC = list(sorted(nx.connected_component_subgraphs(UDG),key=len, reverse=True))
-
-    if CC :
-        count=0
-        for mini in CC:
-          miniD = mini.to_directed()  
-          name = CC.index(mini)
-          miniD.name = ('%03d' % name ) 
-          
-          # remove links that were not in the original files
-          edges2remove = list(set(miniD.edges()) - set(DG.edges()))
-          miniD.remove_edges_from(edges2remove)
-          
-          ## write edge list, node list in new folder
-          newout = out+'/'+str(miniD.name)
-          make_folder(newout)
-          nx.write_edgelist(miniD, newout+'/edge.list', delimiter="\t", data=False)
-          nodes_file = open(newout+'/node.list', 'w')
-          for nodes in miniD.nodes():
-              nodes_file.write(nodes+'\n')
-          nodes_file.close()    
-          # print progress
-          count+=1
-          progress(count, len(CC))
-
-    print('\nNumber of connected components: '+str(len(CC)))
-
-    return(CC)
-
-
-def DG_indegree(out,DGc):
+    labels, count = DG.weak_components()
+    members = [[] for c in range(count)]
+    for pos, c in enumerate(labels.tolist()):
+        members[c].append(DG.labels[pos])
+    return(sorted(members, key=lambda c: (-len(c), min(c))))
+
+
+
+def component_graph(DG, name, nodes):
+    '''
+    Induced subgraph: all out-links of the nodes stay inside the component
+    '''
+    index = DG.index()
+    return(DG.subgraph(sorted(index[n] for n in nodes), name))
+
+
+
+def cached_connected_components(DG, cache_dir, graph_key):
+    '''
+    get_connected_components, the node sets are reused from the stage cache
+    '''
+    key = stage_cache.hash_values(graph_key, stage_cache.code_version(graph_core), inspect.getsource(connected_node_sets))
+    cached = stage_cache.lookup(cache_dir, 'topology', 'components', key)
+    if cached:
+        print('\nConnected components: cached '+cached)
+        run_report.record('cache', stage='components', cached=['components'], calculated=[])
+        return(get_connected_components(DG, stage_cache.load_object(cached)))
+    node_sets = connected_node_sets(DG)
+    stage_cache.store_object(cache_dir, 'topology', 'components', key, node_sets)
+    return(get_connected_components(DG, node_sets))
+
+
+
+def write_connected_component(out, miniD):
+    '''
+    Write a connected component in its own folder: 
+        - edgelist --> read with: nx.read_edgelist(filename,create_using=nx.DiGraph())
+        - nodelist: isolated nodes have empty edgelist.
+        - stats.txt
+    '''
+    make_folder(out)
+    miniD.write_edgelist(out+'/edge.list')
+    nodes_file = open(out+'/node.list', 'w')
+    for nodes in miniD.nodes():
+        nodes_file.write(nodes+'\n')
+    nodes_file.close()
+    f = open(out + '/stats.txt','w')
+    f.write(miniD.info()+'\n')
+    f.close()
+
+
+def DG_metrics(DGc):
+    '''
+    Degree-based measures of the component computed together from its CSR adjacency
+    (csr_metrics). Pass the result to the DG_* functions to avoid recomputing them.
+    '''
+    return(csr_metrics.node_metrics(DGc))
+
+
+
+def DG_indegree(out,DGc,metrics=None):
     '''
     Normalized indegree (values are normalized by /n-1) 
     '''
-    make_folder(out+'/topology')
-    measure = nx.in_degree_centrality(DGc)
-    f = open(out+'/topology/indegree.list','w')
-    f.write('REACTION\tINDEGREE\n')
-    for k,v in measure.items():
-        f.write(k+'\t'+str(v)+ '\n')
-    f.close
-    print('indegree calculated')
+    metrics = metrics or DG_metrics(DGc)
+    measure = csr_metrics.node_measure(metrics, metrics['indegree'])
+    write_measure(out, 'indegree.list', 'INDEGREE', measure, 'indegree calculated')
     return(measure)
 
     
-def DG_outdegree(out,DGc):
+def DG_outdegree(out,DGc,metrics=None):
     '''
     Normalized outdegree (values are normalized by /n-1) 
     '''
-    make_folder(out+'/topology')
-    measure = nx.out_degree_centrality(DGc)
-    f = open(out+'/topology/outdegree.list','w')
-    f.write('REACTION\tOUTDEGREE\n')    
-    for k,v in measure.items():
-        f.write(k+'\t'+str(v)+ '\n')
-    f.close
-    print('outdegree calculated')
+    metrics = metrics or DG_metrics(DGc)
+    measure = csr_metrics.node_measure(metrics, metrics['outdegree'])
+    write_measure(out, 'outdegree.list', 'OUTDEGREE', measure, 'outdegree calculated')
     return(measure)
     
     
-def DG_degree(out,DGc):
+def DG_degree(out,DGc,metrics=None):
     '''
     Degree (values are normalized by /n-1) 
     '''
-    make_folder(out+'/topology')
-    measure = nx.degree_centrality(DGc)
-    f = open(out+'/topology/degree.list','w')
-    f.write('REACTION\tDEGREE\n')    
-    for k,v in measure.items():
-        f.write(k+'\t'+str(v)+ '\n')
-    f.close
-    print('degree calculated')
+    metrics = metrics or DG_metrics(DGc)
+    measure = csr_metrics.node_measure(metrics, metrics['degree'])
+    write_measure(out, 'degree.list', 'DEGREE', measure, 'degree calculated')
     return(measure)
 
     
     
-def DG_closeness(out,DGc):
+def approximate(DGc, approx):
+    '''
+    Comment line of the approximate measures of the component, None if the sample
+    covers the whole component (exact calculation)
+    approx: {'samples': K, 'epsilon': EPSILON, 'seed': S}
+    '''
+    if not approx:
+        return(None)
+    n = DGc.number_of_nodes()
+    k = path_centrality.sample_size(n, approx.get('samples'), approx.get('epsilon'))
+    if k >= n:
+        return(None)
+    return('approximate: %d of %d sampled sources (seed %d), CI95 = half-width of the 95%% interval '
+           '(betweenness: empirical Bernstein bound, closeness: normal approximation)' % (k, n, approx.get('seed', 0)))
+
+
+
+def DG_closeness(out,DGc,jobs=1,approx=None,metrics=None):
     '''
     Closeness reciprocal of the sum of the shortest path distances from a node to all other nodes.
     If the graph is not completely connected, this algorithm computes the closeness centrality 
     for each connected part separately.
+    Exact values from blocks of BFS distances of the CSR adjacency (csr_metrics), 
+    with jobs > 1 the blocks are split across processes.
+    With approx, estimated from sampled source nodes (+ CI95 column).
     '''
-    make_folder(out+'/topology')
-    measure = nx.closeness_centrality(DGc)                     
-    f = open(out+'/topology/closeness.list','w')
-    f.write('REACTION\tCLOSENESS\n')    
-    for k,v in measure.items():
-        f.write(k+'\t'+str(v)+ '\n')
-    f.close
-    print('closeness calculated')
+    comment = approximate(DGc, approx)
+    if comment:
+        measure, error = path_centrality.approximate_closeness(DGc, approx.get('samples'), 
+                            approx.get('epsilon'), approx.get('seed', 0), jobs)
+        write_measure(out, 'closeness.list', 'CLOSENESS', measure, 'closeness estimated', error, comment)
+        return(measure)
+    metrics = metrics or DG_metrics(DGc)
+    measure = csr_metrics.node_measure(metrics, csr_metrics.closeness(metrics['adjacency'], jobs))
+    write_measure(out, 'closeness.list', 'CLOSENESS', measure, 'closeness calculated')
     return(measure)
     
     
-def DG_betweenness(out,DGc):
+def DG_betweenness(out,DGc,jobs=1,approx=None,metrics=None):
     '''
-    Betweeness
+    Betweeness (Brandes algorithm on the CSR adjacency, path_centrality)
+    With jobs > 1 the source nodes are split across processes.
+    With approx, estimated from sampled source nodes (+ CI95 column).
     '''
-    make_folder(out+'/topology')
-    measure = nx.betweenness_centrality(DGc)                     
-    f = open(out+'/topology/betweenness.list','w')
-    f.write('REACTION\tBETWEENESS\n')
-    for k,v in measure.items():
-        f.write(k+'\t'+str(v)+ '\n')
-    f.close
-    print('betweenness calculated')
+    comment = approximate(DGc, approx)
+    if comment:
+        measure, error = path_centrality.approximate_betweenness(DGc, approx.get('samples'), 
+                            approx.get('epsilon'), approx.get('seed', 0), jobs)
+        write_measure(out, 'betweenness.list', 'BETWEENESS', measure, 'betweenness estimated', error, comment)
+        return(measure)
+    measure = path_centrality.betweenness_centrality(DGc, jobs)
+    write_measure(out, 'betweenness.list', 'BETWEENESS', measure, 'betweenness calculated')
     return(measure)
     
 
@@ -186,14 +314,8 @@ def DG_eigen_left_ORI(out,DGc):
     corresponds to the in-edges in the graph.     
     Using Numpy calculation to avoid non-convergence
     '''
-    make_folder(out+'/topology')
-    measure = nx.eigenvector_centrality_numpy(DGc)
-    f = open(out+'/topology/eigen_left.list','w')
-    f.write('REACTION\tEIGENLEFT\n')    
-    for k,v in measure.items():
-        f.write(k+'\t'+str(v)+ '\n')
-    f.close
-    print('left eigenvector calculated')
+    measure = nx.eigenvector_centrality_numpy(DGc.to_networkx())
+    write_measure(out, 'eigen_left.list', 'EIGENLEFT', measure, 'left eigenvector calculated')
     return(measure)
 
 
@@ -203,93 +325,100 @@ def DG_eigen_right_ORI(out,DGc):
     Right Eigenvector centrality: For out-edges eigenvector centrality first reverse the graph with G.reverse().
     Using Numpy calculation to avoid non-convergence
     '''
-    make_folder(out+'/topology')
-    DGcREV = DGc.reverse()
+    DGcREV = DGc.to_networkx().reverse()
     measure = nx.eigenvector_centrality_numpy(DGcREV)
-    f = open(out+'/topology/eigen_right.list','w')
-    f.write('REACTION\tEIGENRIGHT\n')    
-    for k,v in measure.items():
-        f.write(k+'\t'+str(v)+ '\n')
-    f.close
-    print('right eigenvector calculated')
+    write_measure(out, 'eigen_right.list', 'EIGENRIGHT', measure, 'right eigenvector calculated')
     return(measure)
 
 
 
 
-def DG_eigen_left(out,DGc):
+def DG_eigenvector(out, DGc, metrics, left):
+    '''
+    Left/right eigenvector centrality on the sparse adjacency (spectral), from the constant
+    starting vector: values only depend on the component and the parameters (not on the
+    files of previous runs). When the Perron vector is degenerate or not unique (not strongly
+    connected) Katz/PageRank values are written instead,
+    with a first comment line (# method: ...).
+    '''
+    filename, header, side = ('eigen_left.list', 'EIGENLEFT', 'left') if left else ('eigen_right.list', 'EIGENRIGHT', 'right')
+    metrics = metrics or DG_metrics(DGc)
+    values, method, note = spectral.eigenvector(metrics['adjacency'], left)
+    measure = csr_metrics.node_measure(metrics, values)
+    if note:
+        print('WARNING: '+side[0].upper()+'.Eigenvector '+note)
+        write_measure(out, filename, header, measure, side+' eigenvector calculated ('+method+')',
+                      comment='method: '+method+' ('+note+')')
+    else:
+        write_measure(out, filename, header, measure, side+' eigenvector calculated')
+    return(measure)
+
+
+
+def DG_eigen_left(out,DGc,metrics=None):
     '''
     Left Eigenvector centrality: For directed graphs this is "left" eigenvector centrality which 
     corresponds to the in-edges in the graph.     
-    Using Numpy calculation to avoid non-convergence
+    Sparse ARPACK calculation, Katz/PageRank if it does not converge.
     '''
-    warnings.filterwarnings("error")    
-    make_folder(out+'/topology')
-    try:
-        measure = nx.eigenvector_centrality_numpy(DGc)
-        f = open(out+'/topology/eigen_left.list','w')
-        f.write('REACTION\tEIGENLEFT\n')    
-        for k,v in measure.items():
-            f.write(k+'\t'+str(v)+ '\n')
-        f.close
-        print('left eigenvector calculated')
-    except RuntimeWarning:
-        print('WARNING: L.Eigenvector calculation did not converge (score = NA)')
-        measure = dict(zip(DGc.nodes(),['NA']*DGc.number_of_nodes() ) )     
-    return(measure)
+    return(DG_eigenvector(out, DGc, metrics, left=True))
 
     
     
-def DG_eigen_right(out,DGc):
+def DG_eigen_right(out,DGc,metrics=None):
     '''
-    Right Eigenvector centrality: For out-edges eigenvector centrality first reverse the graph with G.reverse().
-    Using Numpy calculation to avoid non-convergence
+    Right Eigenvector centrality: out-edges eigenvector centrality (adjacency not transposed).
+    Sparse ARPACK calculation, Katz/PageRank if it does not converge.
     '''
-    warnings.filterwarnings("error")    
-    make_folder(out+'/topology')
-    DGcREV = DGc.reverse()
-    try:
-        measure = nx.eigenvector_centrality_numpy(DGcREV)
-        f = open(out+'/topology/eigen_right.list','w')
-        f.write('REACTION\tEIGENRIGHT\n')    
-        for k,v in measure.items():
-            f.write(k+'\t'+str(v)+ '\n')
-        f.close
-        print('right eigenvector calculated')
-    except RuntimeWarning:
-        print('WARNING: R.Eigenvector calculation did not converge (score = NA)')
-        measure = dict(zip(DGcREV.nodes(),['NA']*DGcREV.number_of_nodes() ) )     
+    return(DG_eigenvector(out, DGc, metrics, left=False))
+
 
+
+def DG_katz(out,DGc,metrics=None):
+    '''
+    Katz centrality (in-edges, as nx.katz_centrality), alpha below 1/spectral radius
+    '''
+    metrics = metrics or DG_metrics(DGc)
+    values, alpha = spectral.katz(spectral.operator(metrics['adjacency'], left=True))
+    if values is None:
+        print('WARNING: Katz centrality did not converge (score = NA)')
+        measure = dict(zip(metrics['nodes'], ['NA']*len(metrics['nodes'])))
+    else:
+        measure = csr_metrics.node_measure(metrics, values)
+    write_measure(out, 'katz.list', 'KATZ', measure, 'katz calculated')
     return(measure)
 
 
 
-def DG_ratio_io(out,DGc):
+def DG_pagerank(out,DGc,metrics=None):
     '''
-    Calculate the in/out-degree ratio by node. 
-    Careful with ZeroDivisionError
+    PageRank (in-edges, damping 0.85, as nx.pagerank)
     '''
-    make_folder(out+'/topology')
-    measure = {}
-    for n in DGc.nodes():
-          outd = DGc.in_degree(n)     # indegree not normalized
-          ind = DGc.out_degree(n)     # outdegree not normalized
-          if outd == 0:
-            ratio = 0.0
-          else:
-            ratio = float(ind)/outd   # ratio in/outdegree
-          measure[n] = ratio
-    f = open(out+'/topology/ratio_io.list','w')
-    f.write('REACTION\tRATIO_IO\n')
-    for k,v in measure.items():
-        f.write(k+'\t'+str(v)+ '\n')
-    f.close
-    print('ratio in/outdegree calculated')
+    metrics = metrics or DG_metrics(DGc)
+    values = spectral.pagerank(spectral.operator(metrics['adjacency'], left=True))
+    if values is None:
+        print('WARNING: PageRank did not converge (score = NA)')
+        measure = dict(zip(metrics['nodes'], ['NA']*len(metrics['nodes'])))
+    else:
+        measure = csr_metrics.node_measure(metrics, values)
+    write_measure(out, 'pagerank.list', 'PAGERANK', measure, 'pagerank calculated')
+    return(measure)
+
+
+
+def DG_ratio_io(out,DGc,metrics=None):
+    '''
+    Calculate the in/out-degree ratio by node: outdegree/indegree (not normalized),
+    0 if indegree = 0 (no ZeroDivisionError).
+    '''
+    metrics = metrics or DG_metrics(DGc)
+    measure = csr_metrics.node_measure(metrics, metrics['ratio_io'])
+    write_measure(out, 'ratio_io.list', 'RATIO_IO', measure, 'ratio in/outdegree calculated')
     return(measure)
 
 
 
-def DG_source_sink(out,DGc):
+def DG_source_sink(out,DGc,metrics=None):
     '''
     Compute Source/Sink (Input/Yeld) categories based on node degree:
       - Source (input): indegree = 0
@@ -301,146 +430,340 @@ def DG_source_sink(out,DGc):
 
     Modified from Ludovica Montanucci yeld_input function.
     '''
-    make_folder(out+'/topology')
-    measure = {}
-    indegree = nx.in_degree_centrality(DGc)
-    outdegree = nx.out_degree_centrality(DGc)
-    for node in indegree.keys():
-        if indegree[node] == 0.0 and outdegree[node] != 0.0:
-            measure[node] = 'source' #'input'
-        elif indegree[node] != 0.0 and outdegree[node] == 0.0:
-            measure[node] = 'sink' #'yeld' 
-        elif indegree[node] != 0.0 and outdegree[node] != 0.0:
-            measure[node] = 'intermediate' #'noinput_noyeld' 
-        elif indegree[node] == 0.0 and outdegree[node] == 0.0:
-            measure[node] = 'isolated' #'input_yeld' 
-
-    f = open(out+'/topology/source_sink.list','w')
-    f.write('REACTION\tSOURCE_SINK\n')    
-    for k,v in measure.items():
-        f.write(k+'\t'+str(v)+ '\n')
-    f.close
-    print('source/sink calculated')
+    metrics = metrics or DG_metrics(DGc)
+    measure = csr_metrics.node_measure(metrics, metrics['source_sink'])
+    write_measure(out, 'source_sink.list', 'SOURCE_SINK', measure, 'source/sink calculated')
     return(measure)
 
 
 
-def DG_get_num_pred_succ(dict_pred_succ):
-  '''
-  Calculate the number of predecessors or successors from a dictionary. 
-  Cannot do it directly because of recursive loop in previous function.
-  '''
-  dictionary = dict_pred_succ
-  for k in dictionary:
-    dictionary[k] = len(dictionary[k])
-  return dictionary
+def DG_successors_predecessors(out,DGc,metrics=None):
+    '''
+    Count for every node:
+        -Successors: number of nodes(reactions) that go after that node. 
+        -Predecessors: number of nodes(reactions) that go before that node.
+    
+    In a linear pathway (without feedback loops or reversible reactions) these are the 
+    nodes before/after it. With cycles, the nodes of a strongly connected component reach
+    each other: counts are calculated on the condensation of the graph (reachability).
+    Self-feedback loops are ignored. Modified from Ludovica Montanucci.  
+    '''
+    metrics = metrics or DG_metrics(DGc)
+    succ, pred, acyclic = reachability.successors_predecessors(metrics['adjacency'])
+    if not acyclic:    # NOT directly linear (reversible rr, loop)
+        print('WARNING: Graph has cycles (successors/predecessors of strongly connected components)')
+    num_measure_succ = csr_metrics.node_measure(metrics, succ)
+    num_measure_pred = csr_metrics.node_measure(metrics, pred)
+    write_measure(out, 'sucessors.list', 'SUCCESORS', num_measure_succ)
+    write_measure(out, 'predecessors.list', 'PREDECESSORS', num_measure_pred, 'successors/predecessors calculated')
+    return(num_measure_succ, num_measure_pred)
+
+
+## Measures of DG_topology in order. ADD functions HERE: 
+## (name, function, code it depends on: functions/modules, for the stage cache keys)
+TOPOLOGY_MEASURES = [
+    ('indegree', DG_indegree, [csr_metrics]),
+    ('outdegree', DG_outdegree, [csr_metrics]),
+    ('ratio_io', DG_ratio_io, [csr_metrics]),
+    ('closeness', DG_closeness, [approximate, csr_metrics, path_centrality]),
+    ('betweenness', DG_betweenness, [approximate, csr_metrics, path_centrality]),
+    ('source_sink', DG_source_sink, [csr_metrics]), # source-sink-intermediate
+    ('successors_predecessors', DG_successors_predecessors, [csr_metrics, reachability]),
+    ## some components do not converge: Katz/PageRank fallback
+    ('eigen_right', DG_eigen_right, [DG_eigenvector, csr_metrics, spectral]),
+    ('eigen_left', DG_eigen_left, [DG_eigenvector, csr_metrics, spectral]),
+    ('katz', DG_katz, [csr_metrics, spectral]),
+    ('pagerank', DG_pagerank, [csr_metrics, spectral]),
+]
+## Measures that take jobs and approx (shortest paths)
+SHORTEST_PATH_MEASURES = ('closeness', 'betweenness')
+
+
+
+def DG_topology(out,DGc,jobs=1,approx=None,names=None):
+    '''
+    Calculate all topological measures of a component (or only those in names).
+    jobs: processes for the shortest-path measures (closeness, betweenness)
+    approx: sampling options of the shortest-path measures (None: exact)
+    If out is a MeasureBuffer, returns {measure name: its buffered files}
+    '''
+    size = {'component': DGc.name, 'nodes': DGc.number_of_nodes(), 'edges': DGc.number_of_edges()}
+    with run_report.stage('metrics', 'measure', **size):
+        metrics = DG_metrics(DGc) # degree arrays and CSR adjacency shared by the measures
+    produced = {}
+    for name, function, code in TOPOLOGY_MEASURES:
+        if names is not None and name not in names:
+            continue
+        start = len(out) if isinstance(out, MeasureBuffer) else 0
+        with run_report.stage(name, 'measure', **size):
+            if name in SHORTEST_PATH_MEASURES:
+                function(out,DGc,jobs,approx,metrics)
+            else:
+                function(out,DGc,metrics)
+        if isinstance(out, MeasureBuffer):
+            produced[name] = out[start:]
+    return(produced)
 
 
 
-def DG_get_predecessors(DirG,node,all_predec):
-  '''
-  Networkx function only gets the immediate predecessor node of n. 
-  Modified from Ludovica Montanucci.
-  '''
-  for n in DirG.predecessors_iter(node):
-    all_predec=all_predec.union(DG_get_predecessors(DirG,n,all_predec))
-    all_predec=all_predec.union(set([n]))
-  return all_predec
+def measure_keys(graph_key, approx):
+    '''
+    Stage cache key of every measure: input graph, code of the measure (and of
+    write_measure/DG_metrics), modules and parameters
+    '''
+    keys = {}
+    common = [inspect.getsource(write_measure), inspect.getsource(DG_metrics), nx.__version__,
+              stage_cache.code_version(graph_core)]
+    for name, function, code in TOPOLOGY_MEASURES:
+        parts = [inspect.getsource(function)]
+        for c in code:
+            parts.append(stage_cache.code_version(c) if inspect.ismodule(c) else inspect.getsource(c))
+        params = None
+        if name in SHORTEST_PATH_MEASURES:
+            params = approx or None
+        elif spectral in code:
+            params = [spectral.TOL, spectral.MAXITER]
+        keys[name] = stage_cache.hash_values(graph_key, common, parts, params)
+    return(keys)
+
+
+
+def schedule_components(components, skip=()):
+    '''
+    Group the positions of the components with edges into tasks for a process pool:
+    largest component first, small components (< SMALL_COMPONENT nodes) batched 
+    together up to BATCH_NODES nodes per task. Tasks keep the order of the components.
+    '''
+    tasks, batch, batch_nodes = [], [], 0
+    for pos, comp in enumerate(components):
+        if comp.number_of_edges() == 0 or pos in skip:
+            continue
+        n = comp.number_of_nodes()
+        if n >= SMALL_COMPONENT:
+            tasks.append([pos])
+            continue
+        if batch_nodes + n > BATCH_NODES:
+            tasks.append(batch)
+            batch, batch_nodes = [], 0
+        batch.append(pos)
+        batch_nodes += n
+    if batch:
+        tasks.append(batch)
+    return(tasks)
+
+
+
+_COMPONENTS = []
+_APPROX = None
+_OUTPUT = None
+_MISSING = None
+
+def _topology_task(positions):
+    '''
+    Worker: measures of the components in memory (inherited from the parent process)
+    '''
+    results = []
+    for pos in positions:
+        buffered = MeasureBuffer(_OUTPUT+'/'+_COMPONENTS[pos].name)
+        results.append((pos, DG_topology(buffered, _COMPONENTS[pos], 1, _APPROX, _MISSING)))
+    return(results)
 
 
 
-def DG_get_successors(DirG,node,all_succ):
-  '''
-  Networkx function only gets the immediate successor node of n. 
-  Modified from Ludovica Montanucci.
-  '''
-  for n in DirG.successors_iter(node):
-    all_succ=all_succ.union(DG_get_successors(DirG,n,all_succ))
-    all_succ=all_succ.union(set([n]))
-  return all_succ
+def emit_measures(output, comp, produced, measures, lists=False):
+    '''
+    Keep the measures of a component for the topology table (in TOPOLOGY_MEASURES order),
+    write its .list files if lists
+    '''
+    print('\nComponent: '+comp.name)
+    buffered = [item for name, function, code in TOPOLOGY_MEASURES for item in produced.get(name, [])]
+    measures[comp.name] = buffered
+    if lists:
+        write_measures(output+'/'+comp.name, buffered)
+    else:
+        for item in buffered:
+            if item[3]:
+                print(item[3])
 
 
 
-def DG_successors_predecessors(out,DGc):
+def cached_measures(components, cache_dir=None, keys=None):
     '''
-    In a linear pathway, count:
-        -Successors: number of nodes(reactions) that go after that node. 
-        -Predecessors: number of nodes(reactions) that go before that node.
-    
-    A linear pathway is a pathway without feedback loops or reversible reactions.
-    Remove self-feedback loops to avoid an infinite recursive loop.      
-    Modified from Ludovica Montanucci.  
+    Measures of every component reused from the stage cache: {component: {measure name: items}}
+    and the names of the measures to calculate
     '''
-    make_folder(out+'/topology')
-    measure_pred, measure_succ,num_measure_pred,num_measure_succ = {}, {}, {}, {}
-    DirG = nx.DiGraph(DGc) # need to copy it to remove self-feedback loops
-    DirG.remove_edges_from(DirG.selfloop_edges())  
-
-    n_simple_cycles = nx.simple_cycles(DirG) 
-    if next(n_simple_cycles,None):    # NOT directly linear (reversible rr, loop)
-        print('WARNING: Graph has cycles (successors/predecessors = CYC)')
-        #num_measure_pred = dict(zip(DirG.nodes(),['CYC']*DirG.number_of_nodes() ) ) 
-        #num_measure_succ = dict(zip(DirG.nodes(),['CYC']*DirG.number_of_nodes() ) ) 
-    else:
-        for node in DirG.nodes():       # LINEAR GRAPH 
-            measure_succ[node] = DG_get_successors(DirG,node, set([]) )
-            measure_pred[node] = DG_get_predecessors(DirG,node, set([]) )
-        num_measure_succ = DG_get_num_pred_succ(measure_succ)
-        num_measure_pred = DG_get_num_pred_succ(measure_pred)
-        print('successors/predecessors calculated')
-    
-    if len(num_measure_succ) > 0:    
-        f = open(out+'/topology/sucessors.list','w')
-        f.write('REACTION\tSUCCESORS\n')
-        for k,v in num_measure_succ.items():
-            f.write(k+'\t'+str(v)+ '\n')
-        f.close
-        f = open(out+'/topology/predecessors.list','w')
-        f.write('REACTION\tPREDECESSORS\n')
-        for k,v in num_measure_pred.items():
-            f.write(k+'\t'+str(v)+ '\n')
-        f.close
-        return(num_measure_succ, num_measure_pred)
+    keys = keys or {}
+    produced = dict((comp.name, {}) for comp in components)
+    missing = []
+    for name, function, code in TOPOLOGY_MEASURES:
+        cached = stage_cache.lookup(cache_dir, 'topology', name, keys.get(name))
+        if cached:
+            print('\n'+name+': cached '+cached)
+            for comp_name, items in stage_cache.load_object(cached).items():
+                produced[comp_name][name] = items
+        else:
+            missing.append(name)
+    run_report.record('cache', stage='measures', calculated=missing,
+                      cached=[name for name, function, code in TOPOLOGY_MEASURES if name not in missing])
+    return(produced, missing)
+
+
+
+def finish_topology(output, components, produced, missing, lists=False, cache_dir=None, keys=None):
+    '''
+    Store the calculated measures in the stage cache and write the measures of every
+    component in component order (topology table, and .list files if lists).
+    Returns the measures {component: buffered measures}.
+    '''
+    if cache_dir:
+        for name in missing:
+            stage_cache.store_object(cache_dir, 'topology', name, keys[name], 
+                dict((comp.name, produced[comp.name][name]) for comp in components if name in produced[comp.name]))
+
+    measures = {}
+    for comp in components:
+        if comp.number_of_edges() > 0:
+            emit_measures(output, comp, produced[comp.name], measures, lists)
+        else:
+            print('\nComponent: '+comp.name)
+            print('No edges found!')
+
+    with run_report.stage('table', rows=sum(comp.number_of_nodes() for comp in components)):
+        topology_table.write_table(output, [(comp.name, comp.nodes()) for comp in components], measures)
+    return(measures)
+
+
+
+def components_topology(output, components, jobs=1, approx=None, lists=False, cache_dir=None, graph_key=None):
+    '''
+    Calculate the topological measures of every component with edges and write them 
+    in component order (topology table, and .list files if lists). With jobs > 1:
+        - large components (>= LARGE_COMPONENT nodes) are calculated first, splitting the
+        sources of the shortest-path measures across jobs processes.
+        - the rest of components are sent to a pool of processes.
+    With cache_dir, every measure (all components) is reused from the stage cache when its
+    key did not change (graph_key: contents of the input graph), only the others are calculated.
+    Returns the measures {component: buffered measures}.
+    '''
+    global _COMPONENTS, _APPROX, _OUTPUT, _MISSING
+    keys = measure_keys(graph_key, approx) if cache_dir else {}
+    produced, missing = cached_measures(components, cache_dir, keys)
+
+    if missing and jobs > 1:
+        large = [pos for pos, comp in enumerate(components) 
+                 if comp.number_of_nodes() >= LARGE_COMPONENT and comp.number_of_edges() > 0]
+        for pos in large:
+            comp = components[pos]
+            print('\nComponent: '+comp.name)
+            produced[comp.name].update(DG_topology(MeasureBuffer(output+'/'+comp.name), comp, jobs, approx, missing))
+
+        _COMPONENTS, _APPROX, _OUTPUT, _MISSING = components, approx, output, missing
+        tasks = schedule_components(components, skip=set(large))
+        print('\nCalculating topology: '+str(len(tasks))+' tasks in '+str(jobs)+' processes')
+        pool = multiprocessing.Pool(processes=jobs)
+        for results in pool.imap(_topology_task, tasks):
+            for pos, items in results:
+                produced[components[pos].name].update(items)
+        pool.close()
+        pool.join()
+        _COMPONENTS, _APPROX, _OUTPUT, _MISSING = [], None, None, None
+    elif missing:
+        for comp in components:
+            if comp.number_of_edges() > 0:
+                print('\nComponent: '+comp.name)
+                produced[comp.name].update(DG_topology(MeasureBuffer(output+'/'+comp.name), comp, 1, approx, missing))
+
+    return(finish_topology(output, components, produced, missing, lists, cache_dir, keys))
+
+
+
+def reaction_graph_components(ifiles, cache_dir=None):
+    '''
+    Directed reaction graph of a reaction_graph folder and its connected components
+    (reused from the stage cache with cache_dir). Returns the components and the
+    stage cache key of the graph (None without cache_dir).
+    '''
+    with run_report.stage('read_graph') as counts:
+        DirRG = create_directed_RG(ifiles)
+        counts.update(nodes=DirRG.number_of_nodes(), edges=DirRG.number_of_edges())
+
+    with run_report.stage('components') as counts:
+        if cache_dir:
+            graph_key = stage_cache.hash_files([ifiles+'/edge.list', ifiles+'/node.list'])
+            graphs = cached_connected_components(DirRG, cache_dir, graph_key)
+        else:
+            graph_key = None
+            graphs = get_connected_components(DirRG) 
+        counts.update(components=len(graphs), with_edges=sum(1 for comp in graphs if comp.number_of_edges() > 0),
+                      giant_nodes=graphs[0].number_of_nodes() if graphs else 0)
+    return(graphs, graph_key)
+
+
+
+def write_connected_components(output, graphs):
+    print('\nWriting connected components...')
+    with run_report.stage('write_components'):
+        for count, comp in enumerate(graphs):
+            write_connected_component(output+'/'+comp.name, comp)
+            progress(count+1, len(graphs))
+    print('')
+
 
 
 if __name__ == '__main__':
 
-    ## Get arguments
-    ifiles = sys.argv[1] # files inside reaction_graph
-    output = sys.argv[2] # cComponents
+    ## Get arguments: [--jobs N] [--approx-samples K | --approx-error EPSILON] [--seed S] 
+    ##                [--spectral-tol TOL] [--spectral-maxiter N] [--lists] [--stage-cache folder]
+    ##                [--report FILE] [--profile NAME] reaction_graph cComponents
+    opts, args = getopt.getopt(sys.argv[1:], 'j:', ['jobs=', 'approx-samples=', 'approx-error=', 'seed=',
+                                                    'spectral-tol=', 'spectral-maxiter=', 'lists', 'stage-cache=',
+                                                    'report=', 'profile='])
+    jobs = 1
+    approx = {}
+    lists = False
+    cache_dir = None
+    report, profile = None, None
+    for opt, arg in opts:
+        if opt in ('-j', '--jobs'):
+            jobs = int(arg)
+        elif opt == '--stage-cache':
+            cache_dir = arg
+        elif opt == '--lists':
+            lists = True
+        elif opt == '--approx-samples':
+            approx['samples'] = int(arg)
+        elif opt == '--approx-error':
+            approx['epsilon'] = float(arg)
+        elif opt == '--seed':
+            approx['seed'] = int(arg)
+        elif opt == '--spectral-tol':
+            spectral.TOL = float(arg)
+        elif opt == '--spectral-maxiter':
+            spectral.MAXITER = int(arg)
+        elif opt == '--report':
+            report = arg
+        elif opt == '--profile':
+            profile = arg
+    if approx and 'samples' not in approx and 'epsilon' not in approx:
+        approx = {}     # --seed alone: exact calculation
+    ifiles = args[0] # files inside reaction_graph
+    output = args[1] # cComponents
+    run_report.start(report, 'calculate_topology_RG.py', profile)
     
-    ## Create the main directed Reaction Graph
-    DirRG = create_directed_RG(ifiles)
-
-    ## Generate all connected components of the graph (undirected)
-    graphs = get_connected_components(output, DirRG) 
+    ## Create the main directed Reaction Graph and its connected components (in memory)
+    graphs, graph_key = reaction_graph_components(ifiles, cache_dir)
 
-    ## CALCULATE TOPOLOGICAL MEASURES - DIRECTED graph. ADD functions HERE
+    ## CALCULATE TOPOLOGICAL MEASURES - DIRECTED graph
     if graphs:
-        ccomp_list = sorted(os.listdir(output))
-        for item in ccomp_list:
-            print('\nComponent: '+item)
-            newout = output+'/'+str(item)
-            comp = create_directed_RG(newout)
-            if comp.number_of_edges() > 0:
-                DG_indegree(newout,comp)
-                DG_outdegree(newout,comp)
-                DG_ratio_io(newout,comp)
-                DG_closeness(newout,comp)
-                DG_betweenness(newout,comp)
-                DG_source_sink(newout,comp) # source-sink-intermediate
-                DG_successors_predecessors(newout,comp) # returns 2 dictionaries
-
-                ## some components do not converge
-                #if comp.number_of_nodes() > 2:
-                #    DG_eigen_right(newout,comp)
-                #    DG_eigen_left(newout,comp)
-                #else:
-                #    print('Eigenvector calculation needs nodes > 2')
+        with run_report.stage('measures', jobs=jobs):
+            components_topology(output, graphs, jobs, approx, lists, cache_dir, graph_key)
 
-            else:
-                print('No edges found!')
+        ## mean/max of the measures by subsystem (reactionSubsystems.list of the reaction graph)
+        subsystem_graph.write_topology_summary(ifiles, output)
+
+        ## write edge list, node list of every component
+        write_connected_components(output, graphs)
     else:
         print('No connected components found')
+    run_report.finish()
         
-
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+'''
+
+Consistency checks of the graph engines against the reference implementations, on small
+synthetic inputs (seconds, no model files needed):
+
+    - Reaction graph: edge files of the sparse backend (sparse_reaction_graph) against
+    the objects backend (create_reaction_graph), with and without currency metabolites,
+    on a synthetic model (benchmark_pipeline.synthetic_model) with reversible reactions
+    and coefficients other than -1/+1.
+    - Graph core (graph_core.GraphCore) against networkx: nodes, edges, weakly connected
+    components, induced subgraphs and to_networkx.
+    - Against networkx: degree centralities and closeness (csr_metrics), exact betweenness
+    and closeness with 1 and JOBS processes (path_centrality, also the same values with
+    any number of processes), betweenness after deleting a node (dependency_rows, as
+    knockout_scan) and number of successors/predecessors (reachability).
+
+The synthetic graph has several weakly connected components, cycles and self-loops.
+Every check is printed with its largest difference; the exit status is 1 if any fails.
+
+    python check_engines.py [--reactions N] [--seed S]
+
+'''
+import sys
+import getopt
+import shutil
+import tempfile
+import numpy as np
+import networkx as nx
+import create_reaction_graph
+import sparse_reaction_graph
+import csr_metrics
+import path_centrality
+import reachability
+from graph_core import GraphCore
+from benchmark_pipeline import synthetic_model
+from create_reaction_graph import CURRENCY_METABOLITES
+
+
+## Size of the synthetic model and graph
+REACTIONS = 300
+
+## Shape of the synthetic graph: groups of nodes (weakly connected components), links per
+## node inside its group and share of nodes with a self-loop
+GROUPS = 4
+LINKS_PER_NODE = 2.0
+SELF_LOOP_SHARE = 0.05
+
+## Share of the coefficients of the synthetic model set to +/-2 (not linked in reversible reactions)
+STOICHIOMETRY_SHARE = 0.1
+
+## Processes of the parallel checks
+JOBS = 3
+
+## Largest absolute difference accepted between two values
+TOLERANCE = 1e-9
+
+
+
+def synthetic_graph(n, seed=0):
+    '''
+    networkx DiGraph of n reactions in GROUPS groups: links drawn between the nodes of a
+    group (cycles), self-loops on a share of the nodes (SELF_LOOP_SHARE)
+    '''
+    rng = np.random.RandomState(seed)
+    labels = ['R%05d' % i for i in range(n)]
+    group = rng.randint(0, GROUPS, n)
+    G = nx.DiGraph(name='synthetic')
+    G.add_nodes_from(labels)
+    for u in range(n):
+        members = np.flatnonzero(group == group[u])
+        for v in rng.choice(members, rng.poisson(LINKS_PER_NODE)):
+            if v != u:
+                G.add_edge(labels[u], labels[v])
+        if rng.random_sample() < SELF_LOOP_SHARE:
+            G.add_edge(labels[u], labels[u])
+    return(G)
+
+
+
+def self_loops(G):
+    return([(v, v) for v in G.nodes() if G.has_edge(v, v)])
+
+
+
+def max_difference(values, reference):
+    '''
+    Largest absolute difference between two {node: value} dictionaries (inf if their nodes differ)
+    '''
+    if set(values) != set(reference):
+        return(float('inf'))
+    return(max([abs(values[n] - reference[n]) for n in reference] + [0.0]))
+
+
+
+def close(name, values, reference):
+    '''
+    Check of two {node: value} dictionaries: (name, passed, detail)
+    '''
+    difference = max_difference(values, reference)
+    return((name, difference <= TOLERANCE, 'max difference %.3g' % difference))
+
+
+
+def same(name, values, reference):
+    '''
+    Check of two values that must be equal: (name, passed, detail)
+    '''
+    return((name, values == reference, ''))
+
+
+
+def read_lines(filename):
+    f = open(filename)
+    lines = f.read().splitlines()
+    f.close()
+    return(lines)
+
+
+
+def check_backends(n, seed=0):
+    '''
+    Edge files of both backends on the same synthetic model
+    '''
+    model = synthetic_model(n, seed=seed)
+    rng = np.random.RandomState(seed)
+    model.S.data[rng.random_sample(len(model.S.data)) < STOICHIOMETRY_SHARE] *= 2.0
+    checks = []
+    for rule, currency in [('list', CURRENCY_METABOLITES), ('none', frozenset())]:
+        objects, sparse = tempfile.mkdtemp(), tempfile.mkdtemp()
+        try:
+            create_reaction_graph.make_edge_files(objects, model, currency=currency)
+            sparse_reaction_graph.make_edge_files(sparse, model, currency)
+            for filename in ('edge.list', 'edge_withCurrency.list'):
+                edges = read_lines(sparse + '/' + filename)
+                checks.append(same('backends ' + filename + ' (currency ' + rule + ', ' +
+                                   str(len(edges)) + ' links)', edges, read_lines(objects + '/' + filename)))
+        finally:
+            shutil.rmtree(objects)
+            shutil.rmtree(sparse)
+    return(checks)
+
+
+
+def check_graph_core(G):
+    '''
+    GraphCore of the edges of G against G
+    '''
+    core = GraphCore.from_edges(G.nodes(), G.edges(), G.name)
+    labels, count = core.weak_components()
+    components = set(frozenset(core.labels[i] for i in np.flatnonzero(labels == c)) for c in range(count))
+    reference = set(frozenset(c) for c in nx.weakly_connected_components(G))
+    largest = max(reference, key=len)
+    positions = sorted(core.index()[label] for label in largest)
+    sub = core.subgraph(positions, 'largest')
+    H = core.to_networkx()
+    checks = [same('graph core nodes', set(core.nodes()), set(G.nodes())),
+              same('graph core edges', (set(core.edges()), core.number_of_edges()),
+                   (set(G.edges()), G.number_of_edges())),
+              same('graph core weak components (' + str(count) + ')', components, reference),
+              same('graph core subgraph', set(sub.edges()), set(G.subgraph(largest).edges())),
+              same('graph core to_networkx', (set(H.nodes()), set(H.edges())), (set(G.nodes()), set(G.edges())))]
+    if hasattr(nx, 'info'):     # removed in networkx 3
+        checks.append(same('graph core info', core.info(), nx.info(G)))
+    return(checks)
+
+
+
+def check_measures(G):
+    '''
+    Measures of the graph core of G against networkx
+    '''
+    core = GraphCore.from_edges(G.nodes(), G.edges(), G.name)
+    metrics = csr_metrics.node_metrics(core)
+    A = metrics['adjacency']
+    measure = lambda values: csr_metrics.node_measure(metrics, values)
+    betweenness = nx.betweenness_centrality(G)
+    closeness = nx.closeness_centrality(G)
+    serial = path_centrality.betweenness_centrality(core)
+    checks = [close('indegree', measure(metrics['indegree']), nx.in_degree_centrality(G)),
+              close('outdegree', measure(metrics['outdegree']), nx.out_degree_centrality(G)),
+              close('degree', measure(metrics['degree']), nx.degree_centrality(G)),
+              close('closeness (csr_metrics)', measure(csr_metrics.closeness(A)), closeness),
+              close('closeness (path_centrality)', path_centrality.closeness_centrality(core), closeness),
+              close('closeness (path_centrality, jobs ' + str(JOBS) + ')',
+                    path_centrality.closeness_centrality(core, JOBS), closeness),
+              close('betweenness', serial, betweenness),
+              same('betweenness jobs 1 = jobs ' + str(JOBS), path_centrality.betweenness_centrality(core, JOBS), serial)]
+
+    ## knockout of the node with the most links
+    degree = dict(G.degree(G.nodes()))
+    removed = max(sorted(degree), key=lambda v: degree[v])
+    r = core.index()[removed]
+    sources = [s for s in range(len(core)) if s != r]
+    rows = path_centrality.dependency_rows(A, sources, removed=r).sum(axis=0)
+    H = G.copy()
+    H.remove_node(removed)
+    knockout = dict((v, x) for v, x in zip(metrics['nodes'], rows.tolist()) if v != removed)
+    checks.append(close('betweenness without ' + removed, knockout, nx.betweenness_centrality(H, normalized=False)))
+
+    succ, pred, acyclic = reachability.successors_predecessors(A)
+    H = G.copy()
+    H.remove_edges_from(self_loops(G))
+    checks += [close('successors', measure(succ), dict((v, len(nx.descendants(G, v))) for v in G)),
+               close('predecessors', measure(pred), dict((v, len(nx.ancestors(G, v))) for v in G)),
+               same('acyclic', acyclic, nx.is_directed_acyclic_graph(H))]
+    return(checks)
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: see the docstring
+    opts, args = getopt.getopt(sys.argv[1:], '', ['reactions=', 'seed='])
+    n, seed = REACTIONS, 0
+    for opt, arg in opts:
+        if opt == '--reactions':
+            n = int(arg)
+        elif opt == '--seed':
+            seed = int(arg)
+
+    G = synthetic_graph(n, seed)
+    print('Synthetic graph: ' + str(G.number_of_nodes()) + ' nodes, ' + str(G.number_of_edges()) + ' links, ' +
+          str(len(self_loops(G))) + ' self-loops')
+    checks = check_backends(n, seed) + check_graph_core(G) + check_measures(G)
+    failed = [name for name, passed, detail in checks if not passed]
+    for name, passed, detail in checks:
+        print(('ok      ' if passed else 'FAILED  ') + name + ('  ' + detail if detail else ''))
+    print(str(len(checks) - len(failed)) + ' of ' + str(len(checks)) + ' checks passed')
+    sys.exit(1 if failed else 0)
@@ -7,7 +7,8 @@ The rules are:
 
     - If the products of a node are the reactants of any other node, 
     create a directed link between them.
-    - Removing currency metabolites.
+    - Removing currency metabolites: a fixed list (default) or a rule on the degree of the 
+    metabolites, --currency list|names|degree:N|none (currency_metabolites, currency.list).
     - Remove generic biomass reaction
     - Allowing self-loops. 
     - If reaction is reversible, check reactants signs (+/-) to identify phyisiological direction. 
@@ -16,16 +17,32 @@ The rules are:
         - List of edges (DIRECTED)
         - List of genes (EntrezGene IDs)
         - List of subsystems (METABOLIC PATHWAYS)
+        - Subsystem quotient graph and aggregates of the reactions of every subsystem,
+        from the links as they are built, and subsystem of every reaction (subsystem_graph)
         - Link between genes IDs and reactions
+    - Edges are built per reaction (--backend objects, default) or with sparse 
+    matrix products (--backend sparse), that also writes the adjacency matrices (CSR).
+    - With --stage-cache folder, nodes/edges, subsystems and genes are reused from previous 
+    runs with the same model contents, currency metabolites, code and options (stage_cache).
+    - With --report FILE, time, CPU, peak memory and sizes of every stage are appended 
+    to FILE as JSON lines; --profile STAGE runs that stage under cProfile (run_report).
         
 '''
 import os
 import sys
 import getopt
 import re
-import cobra
 import pandas as pd
-import itertools
+import model_loader
+import gene_reactions
+import stage_cache
+import run_report
+import subsystem_graph
+import currency_metabolites
+from model_loader import load_model, file_hash
+from gene_reactions import index_genes, gene_reaction_pairs
+from subsystem_graph import reaction_subsystems, write_subsystem_graph
+from currency_metabolites import CURRENCY_METABOLITES
 
 
 
@@ -45,15 +62,7 @@ def make_pwy_file(out,mod):
     Write a file with all metabolic subsystems ( = pathways) in the model. 
     '''  
     f = open(out + '/subsystems.list', 'w')
-    list_of_pathways = []
-
-    for r in mod.reactions: 
-      pwy_r = r.subsystem
-      if pwy_r.startswith('[array'): ## Recon3D has a different format that Recon2
-            pwy_r = r.subsystem.split("\'")[1]
-            list_of_pathways.append(pwy_r) 
-      else:
-            list_of_pathways.append(pwy_r) 
+    list_of_pathways = reaction_subsystems(mod)
 
     for item in set(list_of_pathways):
       f.write("%s\n" % item)
@@ -62,7 +71,7 @@ def make_pwy_file(out,mod):
     
     
 
-def make_gene_file(out,mod):
+def make_gene_file(out,mod,gene_index=None):
     '''
     Write a file with genes in the model.
     GeneID:
@@ -70,24 +79,17 @@ def make_gene_file(out,mod):
         - Ensembl Stable Gene ID --> unique ids
         - Other --> unique ids
     '''
-    test_gene = mod.genes[0]
-    
-    if test_gene.id[0].isdigit():        
-        all_genes_dup = []
-        for g in mod.genes:
-            all_genes_dup.append(g.id)      
-        all_genes = set([ x.split('.')[0] for x in all_genes_dup] )
+    if gene_index is None:
+        gene_index = index_genes(mod)
+    id_type, gene_map = gene_index
+
+    if id_type == 'EntrezGene':
         print('\nGene ID seems EntrezGene')
-    elif test_gene.id.startswith('ENSG'):
-        all_genes = []
-        for g in mod.genes:
-            all_genes.append(g.id)  
+    elif id_type == 'Ensembl':
         print('\nGene ID seems Ensembl Stable Gene ID')
     else:
-        all_genes = []
-        for g in mod.genes:
-            all_genes.append(g.id)      
         print('\nGene ID is not detected as EntrezGene or Ensembl, creating file anyway')
+    all_genes = list(gene_map.keys())
   
     f = open(out +'/gene.list', 'w')
     for g in all_genes:
@@ -96,7 +98,7 @@ def make_gene_file(out,mod):
     return(all_genes)
 
     
-def make_geneReaction_file(out,mod):
+def make_geneReaction_file(out,mod,gene_index=None):
     '''
     Write a file linking reactions and genes.
     If the gene participates in a reaction, it doesn't matter if it's the only one, 
@@ -109,130 +111,139 @@ def make_geneReaction_file(out,mod):
     Returns a pandas data.frame: GENE REACTION
 
     '''
-    RXNsByGENE = {}
-    df_g, df_r = [], []
-    for g in mod.genes:
-      g_id = g.id   # 27349.1 
-      all_rr = []
-      for rr in list(g.reactions):
-        all_rr.append(rr.id)
-      RXNsByGENE[g_id] = all_rr
-    
-    test_gene = mod.genes[0]
-    
-    if test_gene.id[0].isdigit(): 
-        all_genes = set([ x.split('.')[0] for x in RXNsByGENE.keys() ] )
-        for uniq_g in list(all_genes):
-          values_rr = [ v for k,v in RXNsByGENE.items() if k.startswith(str(uniq_g+'.'))] 
-          uniq_rr = set([item for sublist  in values_rr for item in sublist] )  
-          for item in uniq_rr:
-            df_r.append(item)
-            df_g.append(uniq_g)
-        genereactions_file = pd.DataFrame({'GENE': df_g, 'REACTION': df_r})
-        genereactions_file.to_csv(out +'/geneReactions.list', sep='\t',index=False)
-    else:
-        all_genes = set(RXNsByGENE.keys())
-        for uniq_g in list(all_genes):
-          values_rr = [ v for k,v in RXNsByGENE.items() if k == uniq_g] 
-          uniq_rr = set([item for sublist in values_rr for item in sublist] )  
-          for item in uniq_rr:
-            df_r.append(item)
-            df_g.append(uniq_g)
-        genereactions_file = pd.DataFrame({'GENE': df_g, 'REACTION': df_r})
-        genereactions_file.to_csv(out +'/geneReactions.list', sep='\t',index=False)
+    if gene_index is None:
+        gene_index = index_genes(mod)
+    df_g, df_r = gene_reaction_pairs(gene_index[1])
 
+    genereactions_file = pd.DataFrame({'GENE': df_g, 'REACTION': df_r}, columns=['GENE', 'REACTION'])
+    genereactions_file.to_csv(out +'/geneReactions.list', sep='\t',index=False)
     return(genereactions_file)
 
 
-def remove_currency_meta(mod, reaction, metas):
+
+def remove_currency_meta(mod, reaction, metas, currency=CURRENCY_METABOLITES):
     '''
-    Do not take into account currency metabolites with the highest degree: 
-    16 metabolites in 8 compartments (128 metabolites)
-    NOTE: compartments might change!
+    Do not take into account currency metabolites (IDs, CURRENCY_METABOLITES by default:
+    see currency_metabolites.py for the other rules).
+    Returns a new dictionary {metabolite: coefficient} without them, the reaction is not modified.
     '''
-    #currency =  ["adp", "atp", "co2", "o2", "h2o", "h2o2", "h", "k", "na1", "nad", "nadh", "nadp", "nadph", "nh4", "pi", "ppi"]
-    #compartments = ["[c]","[e]", "[l]", "[m]", "[x]", "[r]", "[g]", "[n]"]
-    #currency_comp = []
-    #for c in currency:
-    #    cc = ';'.join('%s%s' % (c,cm)  for cm in compartments)
-    #    cc = cc.split(';')
-    #    currency_comp.extend(cc)
-    currency_comp = ['adp[c]', 'adp[e]', 'adp[l]', 'adp[m]', 'adp[x]', 'adp[r]', 'adp[g]', 'adp[n]', 'atp[c]', 'atp[e]', 'atp[l]', 'atp[m]', 'atp[x]', 'atp[r]', 'atp[g]', 'atp[n]', 'co2[c]', 'co2[e]', 'co2[l]', 'co2[m]', 'co2[x]', 'co2[r]', 'co2[g]', 'co2[n]', 'o2[c]', 'o2[e]', 'o2[l]', 'o2[m]', 'o2[x]', 'o2[r]', 'o2[g]', 'o2[n]', 'h2o[c]', 'h2o[e]', 'h2o[l]', 'h2o[m]', 'h2o[x]', 'h2o[r]', 'h2o[g]', 'h2o[n]', 'h2o2[c]', 'h2o2[e]', 'h2o2[l]', 'h2o2[m]', 'h2o2[x]', 'h2o2[r]', 'h2o2[g]', 'h2o2[n]', 'h[c]', 'h[e]', 'h[l]', 'h[m]', 'h[x]', 'h[r]', 'h[g]', 'h[n]', 'k[c]', 'k[e]', 'k[l]', 'k[m]', 'k[x]', 'k[r]', 'k[g]', 'k[n]', 'na1[c]', 'na1[e]', 'na1[l]', 'na1[m]', 'na1[x]', 'na1[r]', 'na1[g]', 'na1[n]', 'nad[c]', 'nad[e]', 'nad[l]', 'nad[m]', 'nad[x]', 'nad[r]', 'nad[g]', 'nad[n]', 'nadh[c]', 'nadh[e]', 'nadh[l]', 'nadh[m]', 'nadh[x]', 'nadh[r]', 'nadh[g]', 'nadh[n]', 'nadp[c]', 'nadp[e]', 'nadp[l]', 'nadp[m]', 'nadp[x]', 'nadp[r]', 'nadp[g]', 'nadp[n]', 'nadph[c]', 'nadph[e]', 'nadph[l]', 'nadph[m]', 'nadph[x]', 'nadph[r]', 'nadph[g]', 'nadph[n]', 'nh4[c]', 'nh4[e]', 'nh4[l]', 'nh4[m]', 'nh4[x]', 'nh4[r]', 'nh4[g]', 'nh4[n]', 'pi[c]', 'pi[e]', 'pi[l]', 'pi[m]', 'pi[x]', 'pi[r]', 'pi[g]', 'pi[n]', 'ppi[c]', 'ppi[e]', 'ppi[l]', 'ppi[m]', 'ppi[x]', 'ppi[r]', 'ppi[g]', 'ppi[n]']
+    return(dict((m, c) for m, c in metas.items() if str(m) not in currency))
 
-    [reaction.pop(mod.metabolites.get_by_id(str(m))) for m in metas if str(m) in currency_comp]
 
-    return(reaction)
+
+def split_metabolites(metabolites, reversible):
+    '''
+    Split the metabolites {metabolite: coefficient} of a reaction into reactants and products.
+    In reversible reactions --> metabolites -/+ sign indicates the physiological direction,
+    only coefficients -1/+1 are taken into account. 
+    '''
+    if reversible == True:
+        react_cleaned = [m for m, c in metabolites.items() if c == -1.0]
+        prod_cleaned = [m for m, c in metabolites.items() if c == 1.0]
+    else:
+        react_cleaned = [m for m, c in metabolites.items() if c < 0]
+        prod_cleaned = [m for m, c in metabolites.items() if c > 0]
+    return(react_cleaned,prod_cleaned)
+
 
 
-def extract_metabolites_ordered(mod, reaction, remove_currency):
+def extract_metabolites_ordered(mod, reaction, remove_currency, currency=CURRENCY_METABOLITES):
     '''
     For every reaction extract the metabolites (reactants, products)
     In reversible reactions --> metabolites -/+ sign indicates the physiological direction
 
     '''
-    products_interch, reactants_interch = [],[]
     rr = mod.reactions.get_by_id(reaction)
     #remove currency metabolites from the reaction?
     if remove_currency == True: 
-        cleaned_reaction = remove_currency_meta(mod, rr,rr.metabolites)
+        metabolites = remove_currency_meta(mod, rr, rr.metabolites, currency)
     else:
-        cleaned_reaction = rr
-    if cleaned_reaction.reversibility == True:
-        for sign in cleaned_reaction.metabolites:
-            if cleaned_reaction.metabolites[sign] == 1.0: # product
-                products_interch.append(sign)
-            elif cleaned_reaction.metabolites[sign] == -1.0: # reactant
-                reactants_interch.append(sign)
-        react_cleaned = reactants_interch
-        prod_cleaned = products_interch
-    else:
-        react_cleaned = cleaned_reaction.reactants
-        prod_cleaned = cleaned_reaction.products
-    return(react_cleaned,prod_cleaned)
+        metabolites = rr.metabolites
+    return(split_metabolites(metabolites, rr.reversibility))
+
+
+
+def index_reactions(mod, modes=(False, True), currency=CURRENCY_METABOLITES):
+    '''
+    Classify the reactants and products of every reaction in a single pass and build an
+    inverted index: metabolite --> position of the reactions that consume it.
+    Reactions are split only once, currency metabolites (IDs) are then filtered out for the
+    remove_currency mode. The model is not modified.
+    Returns a dictionary keyed by remove_currency (False/True): (products by node, consumers)
+    '''
+    index = dict((rm_currency, ({}, {})) for rm_currency in modes)
+    for pos, node in enumerate(mod.reactions):
+        react_all, prod_all = split_metabolites(node.metabolites, node.reversibility)
+        for rm_currency in modes:
+            if rm_currency == True:
+                react_cleaned = [m for m in react_all if str(m) not in currency]
+                prod_cleaned = [m for m in prod_all if str(m) not in currency]
+            else:
+                react_cleaned, prod_cleaned = react_all, prod_all
+            products_by_node, consumers = index[rm_currency]
+            products_by_node[node.id] = prod_cleaned
+            for m in set(react_cleaned):
+                consumers.setdefault(m, []).append(pos)
+    return(index)
+
+
+
+def index_consumers(mod, remove_currency, currency=CURRENCY_METABOLITES):
+    '''
+    Metabolite index for one mode only (see index_reactions). 
+    Returns the products by reaction and the index. 
+    '''
+    return(index_reactions(mod, modes=(remove_currency,), currency=currency)[remove_currency])
+
+
+
+def linked_positions(node1, index):
+    '''
+    Positions of the reactions consuming any of the products of node1, in model order
+    '''
+    products_by_node, consumers = index
+    linked = set()
+    for m in products_by_node[node1.id]:
+        linked.update(consumers.get(m, []))
+    return(sorted(linked))
 
 
 
-def make_links(node1, mod, remove_currency):
+def make_links(node1, mod, remove_currency, index=None, currency=CURRENCY_METABOLITES):
     '''
     If any of the products of a given node are the reactants of another node --> create a link between them
     Allows for self-loops: if the products of a node are also its reactants.
     Keep unique edges: if more than one product is a reactant count only 1 link.
 
-    Extract reactants and products for a node: 
-    react_cleaned,prod_cleaned = extract_metabolites_ordered(mod, node1.id, remove_currency)
-    reactants = extract_metabolites_ordered(mod, node1.id, remove_currency)[0]
-    products = extract_metabolites_ordered(mod, node1.id, remove_currency)[1]
-
+    The consumers of each product are looked up in the metabolite index (see index_consumers), 
+    so the cost is proportional to the links of the node and not to the size of the model.
+    Pass the index when calling it for many nodes, otherwise it is built for this node.
     '''
+    if index is None:
+        index = index_consumers(mod, remove_currency, currency)
 
-    #Extract products for a node1   
-    prod_cleaned = extract_metabolites_ordered(mod, node1.id, remove_currency)[1]
-    
-    #If any of the products of node1 are reactants of node make a link 
-    list_of_edges = [
-        node1.id+'\t'+node2.id
-        for node2 in mod.reactions
-        if any(map(lambda x: x in prod_cleaned, extract_metabolites_ordered(mod, node2.id, remove_currency)[0]))
-    ]    
-
-    all_edges_node = set(list_of_edges)  
+    all_edges_node = [ node1.id+'\t'+mod.reactions[pos].id for pos in linked_positions(node1, index) ]
     return(all_edges_node)
 
 
 
-def make_edge_file(out,mod, rm_currency):
+def make_edge_file(out,mod, rm_currency, index=None, targets=None, currency=CURRENCY_METABOLITES):
     '''
     Write a file with all edges between nodes, edges are directed. 
     With or without removing curreny metabolites to compare graphs.
+    With targets (a list), the positions linked from every node are appended to it.
     '''
     print('\nCalculating links...')  
 
-    all_links_model_nodes = [ 
-        make_links(nodes,mod,remove_currency=rm_currency) 
-        for nodes in mod.reactions  
-    ]
-    
-    all_links_model = list(itertools.chain(*all_links_model_nodes))
+    if index is None:
+        index = index_consumers(mod, rm_currency, currency)
+    reactions = mod.reactions
+    all_links_model = []
+    for nodes in reactions:
+        linked = linked_positions(nodes, index)
+        if targets is not None:
+            targets.append(linked)
+        all_links_model.extend(nodes.id+'\t'+reactions[pos].id for pos in linked)
 
     if rm_currency is True:
         f = open(out +'/edge.list', 'w')
@@ -245,41 +256,181 @@ def make_edge_file(out,mod, rm_currency):
 
 
 
+def make_edge_files(out,mod, subsystems=None, currency=CURRENCY_METABOLITES):
+    '''
+    Write both edge files (with and without currency metabolites) from a single 
+    classification of the reactions. The model is not modified.
+    Currency metabolites: IDs (CURRENCY_METABOLITES by default).
+    With the subsystems of the reactions, the links without currency metabolites are
+    also collapsed into the subsystem graph (subsystem_graph).
+    '''
+    index = index_reactions(mod, currency=currency)
+    edges_currency = make_edge_file(out, mod, rm_currency = False, index = index[False])
+    targets = [] if subsystems is not None else None
+    edges = make_edge_file(out, mod, rm_currency = True, index = index[True], targets = targets)
+    if subsystems is not None:
+        write_subsystem_graph(out, subsystem_graph.adjacency_from_targets(targets), subsystems)
+    return(edges_currency, edges)
 
-if __name__ == '__main__':
 
-    ## Get arguments 
-    output = sys.argv[1]
-    matfile = sys.argv[2]
-       
-    model = cobra.io.load_matlab_model(matfile)
-
-    ## NOTE: removing generic biomass reaction from model
-    biomass= [r.id for r in model.reactions if re.search('biomass', r.id,re.IGNORECASE)]
-    print('\nRemoving reactions: '+str(biomass))
-    if biomass:
-        model.remove_reactions(biomass)
-
-    ## Create file with nodes --> REACTION
-    nodesModel = make_node_file(output, model)
-    print('\nNumber of nodes: '+str(len(nodesModel)))
-
-    ## Create file with edges (directed) --> keep currency metabolites
-    edgesModelwCurrency = make_edge_file(output, model, rm_currency = False)
-    print('\nNumber of links (with currency metabolites): '+str(len(edgesModelwCurrency)))
- 
-    ## Create file with edges (directed) --> remove currency metabolites
-    edgesModel = make_edge_file(output, model, rm_currency = True)
-    print('\nNumber of links (no currency metabolites): '+str(len(edgesModel)))
+
+
+def load_graph_model(matfile, model_cache=None):
+    '''
+    Load the model and remove the generic biomass reaction
+    '''
+    with run_report.stage('load_model') as counts:
+        model = load_model(matfile, model_cache)
+
+        ## NOTE: removing generic biomass reaction from model
+        biomass= [r.id for r in model.reactions if re.search('biomass', r.id,re.IGNORECASE)]
+        print('\nRemoving reactions: '+str(biomass))
+        if biomass:
+            model.remove_reactions(biomass)
+        counts.update(reactions=len(model.reaction_ids), metabolites=len(model.metabolite_ids), 
+                      genes=len(model.gene_ids))
+    return(model)
+
+
+
+def stage_keys(matfile, backend, currency='list'):
+    '''
+    Stage cache keys of the artifacts (edges, subsystems, genes): model contents,
+    currency metabolites (rule), code version and options
+    '''
+    model_hash = file_hash(matfile)
+    this = os.path.abspath(__file__)
+    edges_code = [this, model_loader, subsystem_graph, currency_metabolites]
+    if backend == 'sparse':
+        import sparse_reaction_graph
+        edges_code.append(sparse_reaction_graph)
+    return({'edges': stage_cache.hash_values(model_hash, currency, backend, 
+                                             stage_cache.code_version(*edges_code)),
+            'subsystems': stage_cache.hash_values(model_hash, stage_cache.code_version(this, model_loader, subsystem_graph)),
+            'genes': stage_cache.hash_values(model_hash, stage_cache.code_version(this, model_loader, gene_reactions))})
+
+
+
+def build_reaction_graph(output, matfile, backend='objects', model_cache=None, stage_cache_dir=None, currency='list'):
+    '''
+    Write the files of the reaction graph of a model (nodes/edges, subsystems, genes) in output.
+    Currency metabolites are selected by a rule (currency_metabolites: list, names, degree:N, none).
+    Artifacts already calculated are restored from the stage cache (stage_cache_dir).
+    '''
+    keys = stage_keys(matfile, backend, currency) if stage_cache_dir else {}
+    model = None
+
+    with run_report.stage('edges') as counts:
+        cached = stage_cache.lookup(stage_cache_dir, 'model2DRG', 'edges', keys.get('edges'))
+        counts['cached'] = bool(cached)
+        if cached:
+            stage_cache.restore_files(cached, output)
+            print('\nNodes and links: cached '+cached)
+        else:
+            model = load_graph_model(matfile, model_cache)
+
+            ## Create file with nodes --> REACTION
+            nodesModel = make_node_file(output, model)
+            print('\nNumber of nodes: '+str(len(nodesModel)))
+
+            ## Create files with edges (directed) --> keep & remove currency metabolites
+            ## and the subsystem graph from the links without currency metabolites
+            edge_files = ['node.list', 'edge.list', 'edge_withCurrency.list', 'currency.list'] + subsystem_graph.SUBSYSTEM_FILES
+            currencyModel = currency_metabolites.select_currency(model, currency, output+'/currency.list')
+            subsystems = reaction_subsystems(model)
+            subsystem_graph.write_reaction_subsystems(output, [r.id for r in model.reactions], subsystems)
+            if backend == 'sparse':
+                import sparse_reaction_graph
+                edgesModelwCurrency, edgesModel = sparse_reaction_graph.make_edge_files(output, model, currencyModel,
+                                                                                         subsystems)
+                edge_files += ['adjacency.npz', 'adjacency_withCurrency.npz']
+            else:
+                edgesModelwCurrency, edgesModel = make_edge_files(output, model, subsystems, currencyModel)
+            print('\nNumber of links (with currency metabolites): '+str(len(edgesModelwCurrency)))
+            print('\nNumber of links (no currency metabolites): '+str(len(edgesModel)))
+            counts.update(nodes=len(nodesModel), edges=len(edgesModel), edges_currency=len(edgesModelwCurrency),
+                          currency=len(currencyModel),
+                          subsystems=len(set(subsystems)))
+            if stage_cache_dir:
+                stage_cache.store_files(stage_cache_dir, 'model2DRG', 'edges', keys['edges'], 
+                                        [output+'/'+f for f in edge_files])
     
-    ## Create file with subsystems (Pathways)
-    subsystemsModel = make_pwy_file(output, model)
-    print('\nNumber of subsystems: '+ str(len(subsystemsModel)))
+    with run_report.stage('subsystems') as counts:
+        cached = stage_cache.lookup(stage_cache_dir, 'model2DRG', 'subsystems', keys.get('subsystems'))
+        counts['cached'] = bool(cached)
+        if cached:
+            stage_cache.restore_files(cached, output)
+            print('\nSubsystems: cached '+cached)
+        else:
+            if model is None:
+                model = load_graph_model(matfile, model_cache)
+
+            ## Create file with subsystems (Pathways)
+            subsystemsModel = make_pwy_file(output, model)
+            print('\nNumber of subsystems: '+ str(len(subsystemsModel)))
+            counts['subsystems'] = len(subsystemsModel)
+            if stage_cache_dir:
+                stage_cache.store_files(stage_cache_dir, 'model2DRG', 'subsystems', keys['subsystems'], 
+                                        [output+'/subsystems.list'])
+
+    with run_report.stage('genes') as counts:
+        cached = stage_cache.lookup(stage_cache_dir, 'model2DRG', 'genes', keys.get('genes'))
+        counts['cached'] = bool(cached)
+        if cached:
+            stage_cache.restore_files(cached, output)
+            print('\nGenes: cached '+cached)
+        else:
+            if model is None:
+                model = load_graph_model(matfile, model_cache)
+
+            ## Group reactions by gene once (geneID: EntrezGene | Ensembl )
+            geneIndex = index_genes(model)
+
+            ## Create file with genes (geneID: EntrezGene | Ensembl )
+            genesModel = make_gene_file(output, model, geneIndex)
+            print('\nNumber of genes:' +str(len(genesModel)))
+
+            ## Create file linking reactions and genes (geneID: EntrezGene | Ensembl )
+            geneReaction = make_geneReaction_file(output, model, geneIndex)
+            counts.update(genes=len(genesModel), gene_reactions=len(geneReaction))
+            if stage_cache_dir:
+                stage_cache.store_files(stage_cache_dir, 'model2DRG', 'genes', keys['genes'], 
+                                        [output+'/gene.list', output+'/geneReactions.list'])
+
 
-    ## Create file with genes (geneID: EntrezGene | Ensembl )
-    genesModel = make_gene_file(output, model)
-    print('\nNumber of genes:' +str(len(genesModel)))
 
-    ## Create file linking reactions and genes (geneID: EntrezGene | Ensembl )
-    geneReaction = make_geneReaction_file(output, model)
+if __name__ == '__main__':
 
+    ## Get arguments: [--backend objects|sparse] [--currency list|names|degree:N|none] [--model-cache folder] 
+    ##                [--stage-cache folder] [--report FILE] [--profile STAGE] output matfile
+    opts, args = getopt.getopt(sys.argv[1:], 'b:', ['backend=', 'currency=', 'model-cache=', 'stage-cache=', 'report=',
+                                                    'profile='])
+    backend = 'objects'
+    currency = 'list'
+    model_cache = None
+    stage_cache_dir = None
+    report, profile = None, None
+    for opt, arg in opts:
+        if opt in ('-b', '--backend'):
+            backend = arg
+        elif opt == '--currency':
+            currency = arg
+        elif opt == '--model-cache':
+            model_cache = arg
+        elif opt == '--stage-cache':
+            stage_cache_dir = arg
+        elif opt == '--report':
+            report = arg
+        elif opt == '--profile':
+            profile = arg
+    if backend not in ('objects', 'sparse'):
+        sys.exit('Unknown backend: '+backend+' (objects | sparse)')
+    try:
+        currency_metabolites.rule_cutoff(currency)
+    except ValueError as e:
+        sys.exit(str(e))
+    output = args[0]
+    matfile = args[1]
+    run_report.start(report, 'create_reaction_graph.py', profile)
+    build_reaction_graph(output, matfile, backend, model_cache, stage_cache_dir, currency)
+    run_report.finish()
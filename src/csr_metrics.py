@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+'''
+
+Node measures of a DIRECTED graph computed together from its CSR adjacency
+(NumPy/SciPy) instead of one networkx traversal per measure:
+
+    - In/out-degree: row/column counts of the adjacency (a self-loop counts once in
+    each, as in networkx).
+    - Degree centralities normalized by 1/(n-1), as nx.*degree_centrality.
+    - Ratio in/out-degree and Source/Sink categories from the same degree arrays.
+    - Closeness: BFS distances of scipy.sparse.csgraph, a block of rows at a time
+    (same definition as nx.closeness_centrality: outgoing distances in networkx 1.x,
+    incoming distances in networkx >= 2).
+
+Values follow the order of the nodes of the graph; node_measure converts an array
+into the {REACTION: VALUE} dictionaries written by calculate_topology_RG.py.
+
+'''
+import multiprocessing
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+import networkx as nx
+from graph_core import GraphCore
+
+
+## networkx >= 2 computes closeness of directed graphs with incoming distances
+CLOSENESS_INCOMING = int(nx.__version__.split('.')[0]) >= 2
+
+## Maximum size of a block of the distance matrix (number of values, float64)
+DISTANCE_BLOCK = 1000000
+
+_ADJACENCY = None
+
+
+
+def csr_adjacency(G):
+    '''
+    Node list and adjacency of the graph (CSR, A[i,j] = 1 if link i --> j).
+    A graph core (graph_core.GraphCore) already holds it: its arrays are not copied.
+    '''
+    if isinstance(G, GraphCore):
+        return(G.nodes(), G.adjacency())
+    nodes = list(G.nodes())
+    pos = dict((n, i) for i, n in enumerate(nodes))
+    edges = list(G.edges())
+    rows = np.fromiter((pos[u] for u, v in edges), dtype=np.int32, count=len(edges))
+    cols = np.fromiter((pos[v] for u, v in edges), dtype=np.int32, count=len(edges))
+    A = sp.csr_matrix((np.ones(len(edges), dtype=np.int8), (rows, cols)),
+                      shape=(len(nodes), len(nodes)))
+    return(nodes, A)
+
+
+
+def degree_arrays(A):
+    '''
+    In-degree and out-degree of every node (not normalized)
+    '''
+    outdeg = np.diff(A.indptr).astype(np.int64)
+    indeg = np.bincount(A.indices, minlength=A.shape[0]).astype(np.int64)
+    return(indeg, outdeg)
+
+
+
+def normalized(degree, n):
+    '''
+    Degree centrality: degree * 1/(n-1) (as networkx)
+    '''
+    s = 1.0 / (n - 1.0) if n > 1 else 1.0
+    return(degree * s)
+
+
+
+def ratio_io(indeg, outdeg):
+    '''
+    out-degree / in-degree of every node (0 if in-degree = 0), as DG_ratio_io
+    '''
+    ratio = np.zeros(len(indeg))
+    has_in = indeg > 0
+    ratio[has_in] = outdeg[has_in].astype(float) / indeg[has_in]
+    return(ratio)
+
+
+
+def source_sink(indeg, outdeg):
+    '''
+    Source/Sink categories: source (indegree = 0), sink (outdegree = 0),
+    intermediate (both > 0), isolated (both = 0)
+    '''
+    category = np.empty(len(indeg), dtype=object)
+    category[(indeg == 0) & (outdeg != 0)] = 'source'
+    category[(indeg != 0) & (outdeg == 0)] = 'sink'
+    category[(indeg != 0) & (outdeg != 0)] = 'intermediate'
+    category[(indeg == 0) & (outdeg == 0)] = 'isolated'
+    return(category)
+
+
+
+def closeness_rows(A, rows):
+    '''
+    Closeness of the given rows from their BFS distances to every node
+    '''
+    n = A.shape[0]
+    D = csgraph.shortest_path(A, method='D', directed=True, unweighted=True, indices=rows)
+    reach = np.isfinite(D)
+    r = reach.sum(1).astype(float)
+    totsp = np.where(reach, D, 0.0).sum(1)
+    closeness = np.zeros(len(rows))
+    ok = totsp > 0.0
+    if n > 1:
+        closeness[ok] = (r[ok] - 1.0) / totsp[ok]
+        closeness[ok] *= (r[ok] - 1.0) / (n - 1)
+    return(closeness)
+
+
+
+def _closeness_task(rows):
+    return(closeness_rows(_ADJACENCY, rows))
+
+
+
+def closeness(A, jobs=1):
+    '''
+    Closeness of every node, the distance matrix is calculated in blocks of rows
+    (at most DISTANCE_BLOCK values each). With jobs > 1 blocks are sent to a pool of processes.
+    '''
+    global _ADJACENCY
+    n = A.shape[0]
+    if n == 0:
+        return(np.zeros(0))
+    if CLOSENESS_INCOMING:
+        A = A.T.tocsr()
+    step = max(1, DISTANCE_BLOCK // n)
+    blocks = [np.arange(i, min(n, i + step)) for i in range(0, n, step)]
+    if jobs > 1 and len(blocks) > 1:
+        _ADJACENCY = A
+        pool = multiprocessing.Pool(processes=jobs)
+        results = pool.map(_closeness_task, blocks)
+        pool.close()
+        pool.join()
+        _ADJACENCY = None
+    else:
+        results = [closeness_rows(A, rows) for rows in blocks]
+    return(np.concatenate(results))
+
+
+
+def node_metrics(G):
+    '''
+    Degree-based measures of every node of the graph from a single adjacency:
+    {'nodes', 'adjacency', 'indegree', 'outdegree', 'degree', 'ratio_io', 'source_sink'}
+    (degrees normalized by 1/(n-1), as networkx)
+    '''
+    nodes, A = csr_adjacency(G)
+    n = len(nodes)
+    indeg, outdeg = degree_arrays(A)
+    return({'nodes': nodes,
+            'adjacency': A,
+            'indegree': normalized(indeg, n),
+            'outdegree': normalized(outdeg, n),
+            'degree': normalized(indeg + outdeg, n),
+            'ratio_io': ratio_io(indeg, outdeg),
+            'source_sink': source_sink(indeg, outdeg)})
+
+
+
+def node_measure(metrics, values):
+    '''
+    Array of values (node order) --> {REACTION: VALUE}
+    '''
+    return(dict(zip(metrics['nodes'], values.tolist())))
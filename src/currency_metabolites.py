@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+'''
+
+Currency metabolites of a model, selected by a rule instead of a fixed list of IDs,
+and sweeps of the reaction graph over a range of degree cutoffs:
+
+    - Metabolite index (once per model): name and compartment of every metabolite
+    (IDs 'atp[c]' as Recon or 'atp_c' as BiGG), coded as arrays, and its degree: the
+    number of reactions where it takes part (nonzero in the stoichiometric matrix).
+    - Per-compartment view: degree of every metabolite name x compartment (dense matrix),
+    the degree of a name is summed over its compartments.
+    - Rules (--currency in create_reaction_graph.py):
+        list        CURRENCY_METABOLITES: 16 metabolites in 8 compartments (Recon IDs)
+        names       the 16 metabolites of the list in every compartment of the model
+        degree:N    metabolites whose name takes part in N or more reactions, in every compartment
+        none        no currency metabolites
+    The metabolites and compartments left out by a rule are reported, not ignored.
+    - Sweep: reaction graph and summary of the rules list, names and degree:N for every
+    cutoff N, from a single metabolite index and a single pair of incidence matrices
+    (sparse_reaction_graph): every rule is a mask of the metabolites and one sparse product.
+
+Output of the sweep:
+    currency_sweep.txt: RULE  CURRENCY_METABOLITES  CURRENCY_NAMES  LINKS  SELF_LOOPS
+        ISOLATED_REACTIONS  COMPONENTS  LARGEST_COMPONENT  MEAN_DEGREE (rule none first)
+    currency_degrees.txt: NAME  DEGREE  and the degree in every compartment (names with
+        degree >= the lowest cutoff, highest first)
+    RULE/node.list, RULE/edge.list, RULE/currency.list: reaction graph of every rule
+    (degree:N in folder degree_N), as create_reaction_graph.py (without --no-graphs)
+
+    python currency_metabolites.py [--cutoffs 25,50,100,...] [--no-graphs] [--model-cache folder]
+        [--report FILE] output matfile
+
+'''
+import os
+import re
+import sys
+import getopt
+import numpy as np
+from scipy.sparse import csgraph
+import sparse_reaction_graph
+import run_report
+
+
+## Currency metabolites with the highest degree: 16 metabolites in 8 compartments (128 metabolites)
+## NOTE: compartments might change! (rule names: the 16 metabolites in the compartments of the model)
+CURRENCY_NAMES = ["adp", "atp", "co2", "o2", "h2o", "h2o2", "h", "k", "na1", "nad", "nadh", "nadp", "nadph", "nh4", "pi", "ppi"]
+COMPARTMENTS = ["[c]", "[e]", "[l]", "[m]", "[x]", "[r]", "[g]", "[n]"]
+CURRENCY_METABOLITES = frozenset(m + c for m in CURRENCY_NAMES for c in COMPARTMENTS)
+
+## Degree cutoffs of the sweep
+CUTOFFS = [25, 50, 100, 200, 400, 800]
+
+_COMPARTMENT = re.compile(r'^(.+?)(\[\w+\]|_[a-z][a-z0-9]?)$')
+
+
+
+def split_compartment(met_id):
+    '''
+    Name and compartment of a metabolite ID: 'atp[c]' or 'atp_c' --> ('atp', 'c'),
+    ('atp', '') without compartment
+    '''
+    match = _COMPARTMENT.match(met_id)
+    if match is None:
+        return(met_id, '')
+    name, compartment = match.groups()
+    return(name, compartment.strip('[]_'))
+
+
+
+def metabolite_index(S, met_ids):
+    '''
+    Metabolites of the stoichiometric matrix (metabolites x reactions): names and
+    compartments (sorted) and the position of those of every metabolite, and its degree
+    '''
+    split = [split_compartment(m) for m in met_ids]
+    names = sorted(set(s[0] for s in split))
+    compartments = sorted(set(s[1] for s in split))
+    name_pos = dict((x, i) for i, x in enumerate(names))
+    compartment_pos = dict((x, i) for i, x in enumerate(compartments))
+    coo = S.tocoo()
+    degree = np.bincount(coo.row[coo.data != 0], minlength=len(met_ids))
+    return({'ids': list(met_ids), 'names': names, 'compartments': compartments,
+            'name_codes': np.array([name_pos[s[0]] for s in split], dtype=np.int64),
+            'compartment_codes': np.array([compartment_pos[s[1]] for s in split], dtype=np.int64),
+            'degree': degree})
+
+
+
+def compartment_view(index):
+    '''
+    Degree of every metabolite name (rows) in every compartment (columns)
+    '''
+    view = np.zeros((len(index['names']), len(index['compartments'])), dtype=np.int64)
+    np.add.at(view, (index['name_codes'], index['compartment_codes']), index['degree'])
+    return(view)
+
+
+
+def rule_cutoff(rule):
+    '''
+    Degree cutoff of a rule (None for list, names and none), ValueError if unknown
+    '''
+    if rule in ('list', 'names', 'none'):
+        return(None)
+    if rule.startswith('degree:') and rule[len('degree:'):].isdigit():
+        return(int(rule[len('degree:'):]))
+    raise ValueError('Unknown currency rule: ' + rule + ' (list | names | degree:N | none)')
+
+
+
+def currency_selection(index, rule, view=None):
+    '''
+    Boolean vector of the currency metabolites of a rule (True: currency)
+    '''
+    cutoff = rule_cutoff(rule)
+    if rule == 'none':
+        return(np.zeros(len(index['ids']), dtype=bool))
+    if rule == 'list':
+        return(np.array([m in CURRENCY_METABOLITES for m in index['ids']], dtype=bool))
+    if rule == 'names':
+        selected = np.array([x in CURRENCY_NAMES for x in index['names']], dtype=bool)
+    else:
+        if view is None:
+            view = compartment_view(index)
+        selected = view.sum(axis=1) >= cutoff
+    return(selected[index['name_codes']])
+
+
+
+def describe(index, rule, currency):
+    '''
+    Message with the currency metabolites of a rule and the compartments without them
+    '''
+    compartments = index['compartments']
+    found = set(index['compartment_codes'][currency].tolist())
+    missing = [compartments[i] or '-' for i in range(len(compartments)) if i not in found]
+    message = ('Currency metabolites (' + rule + '): ' + str(int(currency.sum())) + ' metabolites, ' +
+               str(len(set(index['name_codes'][currency].tolist()))) + ' names')
+    if currency.any() and missing:
+        message += ', compartments without them: ' + ' '.join(missing)
+    return(message)
+
+
+
+def select_currency(mod, rule='list', filename=None):
+    '''
+    IDs of the currency metabolites of a model for a rule (frozenset),
+    also written to filename (currency.list) if given
+    '''
+    S, met_ids, rxn_ids, reversible = sparse_reaction_graph.stoichiometric_matrix(mod)
+    index = metabolite_index(S, met_ids)
+    currency = currency_selection(index, rule)
+    print('\n' + describe(index, rule, currency))
+    if filename is not None:
+        write_currency(filename, index, currency)
+    return(frozenset(m for m, c in zip(index['ids'], currency) if c))
+
+
+
+def write_currency(filename, index, currency):
+    '''
+    currency.list: METABOLITE  NAME  COMPARTMENT  DEGREE of the currency metabolites
+    '''
+    f = open(filename, 'w')
+    f.write('METABOLITE\tNAME\tCOMPARTMENT\tDEGREE\n')
+    for i in np.flatnonzero(currency):
+        f.write('\t'.join([index['ids'][i], index['names'][index['name_codes'][i]],
+                           index['compartments'][index['compartment_codes'][i]], str(index['degree'][i])]) + '\n')
+    f.close()
+
+
+
+def graph_summary(A):
+    '''
+    Links, self-loops, isolated reactions, weakly connected components, nodes of the
+    largest one and mean out-degree of an adjacency
+    '''
+    n = A.shape[0]
+    linked = (np.diff(A.indptr) > 0) | (np.bincount(A.indices, minlength=n) > 0)
+    count, labels = csgraph.connected_components(A, directed=True, connection='weak')
+    return({'LINKS': A.nnz, 'SELF_LOOPS': int(A.diagonal().sum()), 'ISOLATED_REACTIONS': int(n - linked.sum()),
+            'COMPONENTS': count, 'LARGEST_COMPONENT': int(np.bincount(labels).max()) if n else 0,
+            'MEAN_DEGREE': float(A.nnz) / n if n else 0.0})
+
+
+
+SWEEP_COLUMNS = ['CURRENCY_METABOLITES', 'CURRENCY_NAMES', 'LINKS', 'SELF_LOOPS', 'ISOLATED_REACTIONS',
+                 'COMPONENTS', 'LARGEST_COMPONENT', 'MEAN_DEGREE']
+
+def sweep(output, mod, cutoffs=CUTOFFS, graphs=True):
+    '''
+    Reaction graphs (unless graphs is False) and summary of the rules none, list, names
+    and degree:N of every cutoff. Returns the rows of currency_sweep.txt.
+    '''
+    with run_report.stage('metabolite_index') as counts:
+        S, met_ids, rxn_ids, reversible = sparse_reaction_graph.stoichiometric_matrix(mod)
+        index = metabolite_index(S, met_ids)
+        view = compartment_view(index)
+        P, R = sparse_reaction_graph.incidence_matrices(S, reversible)
+        counts.update(metabolites=len(met_ids), names=len(index['names']), compartments=len(index['compartments']))
+
+    rules = ['none', 'list', 'names'] + ['degree:' + str(c) for c in sorted(cutoffs)]
+    rows = []
+    with run_report.stage('sweep', rules=len(rules), graphs=graphs):
+        for rule in rules:
+            currency = currency_selection(index, rule, view)
+            print(describe(index, rule, currency))
+            A = sparse_reaction_graph.adjacency_matrix(P, R, keep=~currency)
+            row = graph_summary(A)
+            row.update(RULE=rule, CURRENCY_METABOLITES=int(currency.sum()),
+                       CURRENCY_NAMES=len(set(index['name_codes'][currency].tolist())))
+            rows.append(row)
+            if graphs:
+                folder = os.path.join(output, rule.replace(':', '_'))
+                if not os.path.exists(folder):
+                    os.makedirs(folder)
+                f = open(folder + '/node.list', 'w')
+                for r in rxn_ids:
+                    f.write("%s\n" % r)
+                f.close()
+                sparse_reaction_graph.write_edges(folder + '/edge.list', A, rxn_ids)
+                write_currency(folder + '/currency.list', index, currency)
+
+    f = open(os.path.join(output, 'currency_sweep.txt'), 'w')
+    f.write('RULE\t' + '\t'.join(SWEEP_COLUMNS) + '\n')
+    for row in rows:
+        f.write(row['RULE'] + '\t' + '\t'.join(_number(row[c]) for c in SWEEP_COLUMNS) + '\n')
+    f.close()
+
+    total = view.sum(axis=1)
+    f = open(os.path.join(output, 'currency_degrees.txt'), 'w')
+    f.write('NAME\tDEGREE\t' + '\t'.join(c or '-' for c in index['compartments']) + '\n')
+    for i in np.argsort(-total, kind='mergesort'):
+        if cutoffs and total[i] < min(cutoffs):
+            break
+        f.write(index['names'][i] + '\t' + str(total[i]) + '\t' + '\t'.join(str(x) for x in view[i]) + '\n')
+    f.close()
+    print('Written ' + os.path.join(output, 'currency_sweep.txt'))
+    return(rows)
+
+
+
+def _number(x):
+    if isinstance(x, float):
+        return('%.6g' % x)
+    return(str(x))
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: see the docstring
+    opts, args = getopt.getopt(sys.argv[1:], '', ['cutoffs=', 'no-graphs', 'model-cache=', 'report='])
+    cutoffs, graphs = CUTOFFS, True
+    model_cache, report = None, None
+    for opt, arg in opts:
+        if opt == '--cutoffs':
+            cutoffs = [int(c) for c in arg.split(',') if c]
+        elif opt == '--no-graphs':
+            graphs = False
+        elif opt == '--model-cache':
+            model_cache = arg
+        elif opt == '--report':
+            report = arg
+    output, matfile = args[:2]
+    if not os.path.exists(output):
+        os.makedirs(output)
+    run_report.start(report, 'currency_metabolites.py')
+
+    from create_reaction_graph import load_graph_model
+    sweep(output, load_graph_model(matfile, model_cache), cutoffs, graphs)
+    run_report.finish()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+'''
+
+Link genes and reactions of a metabolic model in a single grouped pass.
+
+    GeneID:
+        - Entrez Gene --> genes are coded with entrezGene transcripts ids (27349.1), keep only gene unique ids (27349)
+        - Ensembl Stable Gene ID --> unique ids
+        - Other --> unique ids
+
+    The mapping {GENE: [REACTIONS]} is an OrderedDict (genes in model order, reactions
+    in model order) that can be reused in memory or read back from geneReactions.list.
+
+'''
+from collections import OrderedDict
+
+
+
+def gene_id_type(mod):
+    '''
+    Detect the gene ID type from the first gene of the model: EntrezGene | Ensembl | Other
+    '''
+    test_gene = mod.genes[0]
+    if test_gene.id[0].isdigit():
+        return('EntrezGene')
+    elif test_gene.id.startswith('ENSG'):
+        return('Ensembl')
+    else:
+        return('Other')
+
+
+
+def normalise_gene_id(gene_id, id_type):
+    '''
+    Entrez transcript --> gene (27349.1 --> 27349), other ID types are unique ids.
+    '''
+    if id_type == 'EntrezGene':
+        return(gene_id.split('.')[0])
+    return(gene_id)
+
+
+
+def index_genes(mod):
+    '''
+    Group the reactions of every gene of the model by normalised gene ID.
+    Entrez IDs without transcript number (e.g. Recon3D placeholder gene '0') are kept
+    as genes but not linked to reactions.
+    Returns the ID type and an OrderedDict {GENE: [REACTIONS]}
+    '''
+    id_type = gene_id_type(mod)
+    rxn_pos = dict((r.id, i) for i, r in enumerate(mod.reactions))
+
+    grouped = OrderedDict()
+    for g in mod.genes:
+        uniq_g = normalise_gene_id(g.id, id_type)
+        reactions = grouped.setdefault(uniq_g, set())
+        if id_type == 'EntrezGene' and '.' not in g.id:
+            continue
+        reactions.update(rr.id for rr in g.reactions if rr.id in rxn_pos)
+
+    gene_map = OrderedDict((k, sorted(v, key=rxn_pos.get)) for k, v in grouped.items())
+    return(id_type, gene_map)
+
+
+
+def gene_reaction_pairs(gene_map):
+    '''
+    Flatten the mapping into two columns: GENE, REACTION
+    '''
+    df_g, df_r = [], []
+    for uniq_g, reactions in gene_map.items():
+        for item in reactions:
+            df_g.append(uniq_g)
+            df_r.append(item)
+    return(df_g, df_r)
+
+
+
+def reactions_by_gene(gene_map):
+    '''
+    Reverse mapping {REACTION: [GENES]}
+    '''
+    by_reaction = OrderedDict()
+    for uniq_g, reactions in gene_map.items():
+        for item in reactions:
+            by_reaction.setdefault(item, []).append(uniq_g)
+    return(by_reaction)
+
+
+
+def read_gene_reactions(filename):
+    '''
+    Read geneReactions.list (GENE REACTION, tab separated with header) into the
+    same mapping {GENE: [REACTIONS]}
+    '''
+    gene_map = OrderedDict()
+    f = open(filename)
+    header = f.readline().rstrip('\n').split('\t')
+    g_col, r_col = header.index('GENE'), header.index('REACTION')
+    for line in f:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) > max(g_col, r_col):
+            gene_map.setdefault(fields[g_col], []).append(fields[r_col])
+    f.close()
+    return(gene_map)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+'''
+
+Compact core of a DIRECTED reaction graph, instead of networkx dictionaries keyed by
+reaction labels:
+
+    - Labels: reaction IDs read once (node.list, edge.list); nodes are int32 positions
+    in the list of labels, components keep references to the same label strings.
+    - Links: CSR arrays (indptr, indices, int32) of the successors, sorted and without
+    duplicates. adjacency() wraps them in a scipy CSR matrix without copying; its
+    transpose (.T, CSC of the same arrays) is the reversed graph, also without copying.
+    - Weakly connected components: scipy.sparse.csgraph on the CSR (no undirected copy).
+    - Induced subgraphs (components) are sliced from the CSR arrays.
+
+GraphCore has the part of the networkx DiGraph interface used by the pipeline
+(name, nodes, edges, number_of_nodes, number_of_edges, in, len). to_networkx()
+builds a DiGraph on demand for the measures that need one.
+
+Nodes keep the order of node.list (model order); nodes that are only in edge.list
+follow in order of appearance.
+
+'''
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+import networkx as nx
+
+
+
+class GraphCore(object):
+    '''
+    Directed graph of int32 nodes with interned labels (see the module docstring)
+    '''
+
+    def __init__(self, labels, indptr, indices, name=''):
+        self.labels = labels
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.name = name
+        self._index = None
+        self._data = None
+
+    @classmethod
+    def from_positions(cls, labels, rows, cols, name=''):
+        '''
+        Graph of the links rows[i] --> cols[i] (positions in labels), duplicates merged
+        '''
+        n = len(labels)
+        A = sp.csr_matrix((np.ones(len(rows), dtype=np.int8), (np.asarray(rows, dtype=np.int32),
+                                                                np.asarray(cols, dtype=np.int32))), shape=(n, n))
+        A.sum_duplicates()
+        return(cls(labels, A.indptr, A.indices, name))
+
+    @classmethod
+    def from_edges(cls, nodes, edges, name=''):
+        '''
+        Graph of the nodes (labels) and the edges (pairs of labels). Labels only found
+        in edges are added after the nodes.
+        '''
+        labels, index = [], {}
+        for label in nodes:
+            if label not in index:
+                index[label] = len(labels)
+                labels.append(label)
+        rows, cols = [], []
+        for u, v in edges:
+            for label in (u, v):
+                if label not in index:
+                    index[label] = len(labels)
+                    labels.append(label)
+            rows.append(index[u])
+            cols.append(index[v])
+        core = cls.from_positions(labels, rows, cols, name)
+        core._index = index
+        return(core)
+
+    def number_of_nodes(self):
+        return(len(self.labels))
+
+    def number_of_edges(self):
+        return(int(self.indptr[-1]))
+
+    def __len__(self):
+        return(len(self.labels))
+
+    def index(self):
+        '''
+        {label: position}, built on first use
+        '''
+        if self._index is None:
+            self._index = dict((label, i) for i, label in enumerate(self.labels))
+        return(self._index)
+
+    def __contains__(self, label):
+        return(label in self.index())
+
+    def nodes(self):
+        return(list(self.labels))
+
+    def edges(self):
+        '''
+        Links as pairs of labels, in CSR order
+        '''
+        labels = self.labels
+        for i in range(len(labels)):
+            u = labels[i]
+            for j in self.indices[self.indptr[i]:self.indptr[i+1]]:
+                yield (u, labels[j])
+
+    def adjacency(self):
+        '''
+        CSR adjacency (A[i,j] = 1 if link i --> j) on the arrays of the graph (not copied),
+        A.T is the reversed graph
+        '''
+        if self._data is None or len(self._data) != len(self.indices):
+            self._data = np.ones(len(self.indices), dtype=np.int8)
+        n = len(self.labels)
+        return(sp.csr_matrix((self._data, self.indices, self.indptr), shape=(n, n), copy=False))
+
+    def weak_components(self):
+        '''
+        Component number of every node (weakly connected components) and their number
+        '''
+        count, labels = csgraph.connected_components(self.adjacency(), directed=True, connection='weak')
+        return(labels, count)
+
+    def subgraph(self, positions, name=''):
+        '''
+        Induced subgraph of the nodes at the (sorted) positions, links inside them only
+        '''
+        positions = np.asarray(positions, dtype=np.int64)
+        A = self.adjacency()[positions][:, positions].tocsr()
+        A.sort_indices()
+        return(GraphCore([self.labels[i] for i in positions.tolist()], A.indptr, A.indices, name))
+
+    def to_networkx(self):
+        '''
+        networkx DiGraph of the graph (built on demand, not kept)
+        '''
+        G = nx.DiGraph(name=self.name)
+        G.add_nodes_from(self.labels)
+        G.add_edges_from(self.edges())
+        return(G)
+
+    def info(self):
+        '''
+        Summary of the graph as nx.info of a DiGraph
+        '''
+        n = len(self.labels)
+        average = float(self.number_of_edges()) / n if n else 0.0
+        return('\n'.join(['Name: ' + self.name, 'Type: DiGraph', 'Number of nodes: ' + str(n),
+                          'Number of edges: ' + str(self.number_of_edges()),
+                          'Average in degree: %8.4f' % average, 'Average out degree: %8.4f' % average]))
+
+    def write_edgelist(self, filename):
+        '''
+        Links as edge.list: NODE1 NODE2 (tab separated)
+        '''
+        f = open(filename, 'w')
+        for u, v in self.edges():
+            f.write(u + '\t' + v + '\n')
+        f.close()
+
+
+
+def read_pairs(filename):
+    '''
+    NODE1 NODE2 pairs of an edge list file (tab separated), read line by line
+    '''
+    f = open(filename)
+    for line in f:
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) >= 2:
+            yield fields[0], fields[1]
+    f.close()
+
+
+
+def read_reaction_graph(ifiles, name='ReactionGraph'):
+    '''
+    Graph of a reaction_graph folder: node.list and edge.list (NODE1 NODE2, tab separated)
+    '''
+    f = open(ifiles + '/node.list')
+    nodes = [line.rstrip('\r\n') for line in f]
+    f.close()
+    return(GraphCore.from_edges([n for n in nodes if n], read_pairs(ifiles + '/edge.list'), name))
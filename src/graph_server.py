@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+
+'''
+
+Query service over a reaction graph and its topology: the graph, the gene-reaction
+map and the measures are loaded once and queries are answered from memory over a
+local HTTP port or a Unix socket.
+
+    - Graph: node.list and adjacency.npz (sparse backend) or edge.list, as CSR
+    (successors) and its transpose (predecessors).
+    - Genes: geneReactions.list of the reaction graph folder.
+    - Measures and components: topology_table of the connected components folder
+    (memory-mapped columns, topology_table.py), optional.
+    - Shortest paths: unweighted BFS from the source (csgraph), the predecessors of the
+    last PATH_CACHE sources are kept (least recently used out), so repeated paths and
+    paths from the same source do not traverse the graph again.
+
+Queries: JSON objects {"query": NAME, ...} sent with POST (one object, or a list of them
+answered in order), or GET /NAME?arg=value&...:
+    info                                    nodes, links, components, measures
+    neighbors   reaction, [direction]       successors (out), predecessors (in) or both
+    path        source, target              shortest directed path (null if not reachable)
+    reaction    reaction, [measures]        component, genes, degrees and measures
+    gene        gene, [measures]            reactions of a gene with their measures
+    component   reaction | component        component of a reaction and its reactions
+Answers: {"result": ...} or {"error": message}, a list for a list of queries.
+measures: comma separated in GET, list in POST (default: all).
+
+    python graph_server.py [--port P [--host H] | --socket FILE] [--path-cache N]
+        reaction_graph [cComponents]
+
+'''
+import os
+import sys
+import json
+import getopt
+import signal
+import numpy as np
+import scipy.sparse as sp
+from collections import OrderedDict
+from scipy.sparse import csgraph
+import topology_table
+from gene_reactions import read_gene_reactions, reactions_by_gene
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import UnixStreamServer
+    from urlparse import urlparse, parse_qs
+except ImportError:     # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import UnixStreamServer
+    from urllib.parse import urlparse, parse_qs
+
+
+try:
+    basestring_ = basestring
+except NameError:       # Python 3
+    basestring_ = str
+
+
+PORT = 8765
+HOST = '127.0.0.1'
+
+## Sources of shortest paths kept in memory (predecessors, one int32 array each)
+PATH_CACHE = 256
+
+
+
+def read_nodes(ifiles):
+    f = open(ifiles + '/node.list')
+    nodes = [line.rstrip('\n') for line in f if line.strip()]
+    f.close()
+    return(nodes)
+
+
+
+def read_adjacency(ifiles, nodes):
+    '''
+    Adjacency of the reaction graph in node.list order (CSR): adjacency.npz if it was
+    written (sparse backend), otherwise edge.list
+    '''
+    if os.path.exists(ifiles + '/adjacency.npz'):
+        A = sp.load_npz(ifiles + '/adjacency.npz').tocsr()
+        if A.shape[0] == len(nodes):
+            return(A)
+    pos = dict((n, i) for i, n in enumerate(nodes))
+    rows, cols = [], []
+    f = open(ifiles + '/edge.list')
+    for line in f:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) >= 2:
+            for name in fields[:2]:
+                if name not in pos:         # edge.list without node.list entry
+                    pos[name] = len(nodes)
+                    nodes.append(name)
+            rows.append(pos[fields[0]])
+            cols.append(pos[fields[1]])
+    f.close()
+    A = sp.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(len(nodes), len(nodes)))
+    A.sort_indices()
+    return(A)
+
+
+
+class QueryError(Exception):
+    '''
+    Query that cannot be answered (unknown reaction, gene, measure...)
+    '''
+
+
+
+class ReactionGraph(object):
+    '''
+    Reaction graph, genes and measures in memory, and the answers to the queries
+    '''
+
+    def __init__(self, ifiles, components=None, path_cache=PATH_CACHE):
+        self.nodes = read_nodes(ifiles)
+        self.A = read_adjacency(ifiles, self.nodes)
+        self.AT = self.A.T.tocsr()
+        self.pos = dict((n, i) for i, n in enumerate(self.nodes))
+        genes_file = ifiles + '/geneReactions.list'
+        self.gene_map = read_gene_reactions(genes_file) if os.path.exists(genes_file) else OrderedDict()
+        self.genes_of = reactions_by_gene(self.gene_map)
+        self.columns, self.measures, self.row = {}, {}, {}
+        if components and os.path.exists(os.path.join(components, topology_table.TABLE_FOLDER, 'manifest.json')):
+            self.columns, manifest = topology_table.load_table(components)
+            self.measures = OrderedDict((c['name'], c) for c in manifest['columns']
+                                        if c['name'] not in ('component', 'reaction'))
+            reactions = self.columns['reaction']
+            self.row = dict((str(r), i) for i, r in enumerate(reactions.tolist()))
+            comp = np.asarray(self.columns['component'])
+            self.component_slices = dict(('%03d' % c, (int(np.searchsorted(comp, c, 'left')),
+                                                       int(np.searchsorted(comp, c, 'right'))))
+                                         for c in np.unique(comp).tolist())
+        else:
+            self.component_slices = {}
+        self.path_cache = OrderedDict()
+        self.path_cache_size = path_cache
+
+    def position(self, reaction):
+        if reaction not in self.pos:
+            raise QueryError('unknown reaction: ' + str(reaction))
+        return(self.pos[reaction])
+
+    def component_of(self, reaction):
+        i = self.row.get(reaction)
+        if i is None:
+            return(None)
+        return('%03d' % int(self.columns['component'][i]))
+
+    def measure_values(self, reaction, names=None):
+        '''
+        {measure: value} of a reaction (None: NA or not calculated). names: list of
+        measures or comma-separated string (as GET), all measures by default.
+        '''
+        i = self.row.get(reaction)
+        if i is None:
+            return({})
+        if isinstance(names, basestring_):
+            names = [m for m in names.split(',') if m]
+        elif names is not None and not (isinstance(names, list) and all(isinstance(m, basestring_) for m in names)):
+            raise QueryError('measures: a list of names or a comma-separated string')
+        values = OrderedDict()
+        for name in (names or self.measures):
+            info = self.measures.get(name)
+            if info is None:
+                raise QueryError('unknown measure: ' + str(name))
+            v = self.columns[name][i]
+            if info['kind'] == 'category':
+                values[name] = str(info['levels'][v]) if v >= 0 else None
+            elif v != v:
+                values[name] = None
+            else:
+                values[name] = int(v) if info['kind'] == 'integer' else float(v)
+        return(values)
+
+    def info(self, args):
+        return({'nodes': len(self.nodes), 'links': int(self.A.nnz), 'genes': len(self.gene_map),
+                'components': len(self.component_slices), 'measures': list(self.measures),
+                'cached_paths': len(self.path_cache)})
+
+    def neighbors(self, args):
+        i = self.position(args['reaction'])
+        direction = args.get('direction', 'both')
+        if direction not in ('in', 'out', 'both'):
+            raise QueryError('direction: in, out or both')
+        result = OrderedDict()
+        if direction in ('out', 'both'):
+            result['successors'] = [self.nodes[j] for j in self.A.indices[self.A.indptr[i]:self.A.indptr[i+1]]]
+        if direction in ('in', 'both'):
+            result['predecessors'] = [self.nodes[j] for j in self.AT.indices[self.AT.indptr[i]:self.AT.indptr[i+1]]]
+        return(result)
+
+    def predecessors(self, s):
+        '''
+        BFS predecessors of the shortest paths from s (cached, least recently used out;
+        not cached with a path cache of size 0)
+        '''
+        pred = self.path_cache.pop(s, None)
+        if pred is None:
+            pred = csgraph.breadth_first_order(self.A, s, directed=True, return_predecessors=True)[1]
+            pred = pred.astype(np.int32)
+        if self.path_cache_size > 0:
+            if len(self.path_cache) >= self.path_cache_size:
+                self.path_cache.popitem(last=False)
+            self.path_cache[s] = pred
+        return(pred)
+
+    def path(self, args):
+        s, t = self.position(args['source']), self.position(args['target'])
+        if s == t:
+            return([self.nodes[s]])
+        pred = self.predecessors(s)
+        if pred[t] < 0:
+            return(None)
+        path = [t]
+        while path[-1] != s:
+            path.append(pred[path[-1]])
+        return([self.nodes[i] for i in reversed(path)])
+
+    def reaction(self, args):
+        r = args['reaction']
+        i = self.position(r)
+        return(OrderedDict([('reaction', r), ('component', self.component_of(r)),
+                            ('genes', self.genes_of.get(r, [])),
+                            ('indegree', int(self.AT.indptr[i+1] - self.AT.indptr[i])),
+                            ('outdegree', int(self.A.indptr[i+1] - self.A.indptr[i])),
+                            ('measures', self.measure_values(r, args.get('measures')))]))
+
+    def gene(self, args):
+        g = args['gene']
+        if g not in self.gene_map:
+            raise QueryError('unknown gene: ' + str(g))
+        return(OrderedDict([('gene', g),
+                            ('reactions', [OrderedDict([('reaction', r), ('component', self.component_of(r)),
+                                                        ('measures', self.measure_values(r, args.get('measures')))])
+                                           for r in self.gene_map[g]])]))
+
+    def component(self, args):
+        if 'reaction' in args:
+            self.position(args['reaction'])
+            name = self.component_of(args['reaction'])
+        else:
+            name = args['component']
+        if name not in self.component_slices:
+            return(None)
+        lo, hi = self.component_slices[name]
+        return(OrderedDict([('component', name), ('nodes', hi - lo),
+                            ('reactions', [str(r) for r in self.columns['reaction'][lo:hi].tolist()])]))
+
+    QUERIES = ('info', 'neighbors', 'path', 'reaction', 'gene', 'component')
+
+    def answer(self, query):
+        '''
+        Answer of a query (dict): {"result": ...} or {"error": message}
+        '''
+        if not isinstance(query, dict):
+            return({'error': 'a query is a JSON object'})
+        try:
+            name = query.get('query')
+            if name not in self.QUERIES:
+                raise QueryError('unknown query: ' + str(name) + ' (' + ', '.join(self.QUERIES) + ')')
+            return({'result': getattr(self, name)(query)})
+        except QueryError as e:
+            return({'error': str(e)})
+        except KeyError as e:
+            return({'error': 'missing argument: ' + str(e.args[0])})
+        except TypeError as e:
+            return({'error': 'invalid argument: ' + str(e)})
+
+    def answer_all(self, queries):
+        '''
+        Answers of one query or of a list of queries (in order)
+        '''
+        if isinstance(queries, list):
+            return([self.answer(q) for q in queries])
+        return(self.answer(queries))
+
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    '''
+    GET /QUERY?arg=value or POST of JSON queries, JSON answers
+    '''
+    graph = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        query['query'] = url.path.strip('/') or 'info'
+        self.send_json(self.graph.answer(query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            queries = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as e:
+            self.send_json({'error': 'invalid JSON: ' + str(e)}, 400)
+            return
+        self.send_json(self.graph.answer_all(queries))
+
+    def send_json(self, answer, status=200):
+        body = json.dumps(answer).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        ## Unix sockets have no client address
+        return(self.client_address[0] or 'unix')
+
+    def log_message(self, format, *args):
+        sys.stderr.write(self.address_string() + ' ' + (format % args) + '\n')
+
+
+
+class UnixHTTPServer(UnixStreamServer):
+    '''
+    HTTP server on a Unix socket (HTTPServer.server_bind needs a host and port)
+    '''
+
+    def get_request(self):
+        request, address = UnixStreamServer.get_request(self)
+        return(request, ('',) if not address else address)
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = self.server_address, 0
+
+
+
+def serve(graph, port=PORT, host=HOST, unix_socket=None):
+    QueryHandler.graph = graph
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixHTTPServer(unix_socket, QueryHandler)
+        print('Serving ' + str(len(graph.nodes)) + ' reactions on ' + unix_socket)
+    else:
+        server = HTTPServer((host, port), QueryHandler)
+        print('Serving ' + str(len(graph.nodes)) + ' reactions on http://' + host + ':' + str(port))
+    sys.stdout.flush()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: see the docstring
+    opts, args = getopt.getopt(sys.argv[1:], 'p:', ['port=', 'host=', 'socket=', 'path-cache='])
+    port, host, unix_socket = PORT, HOST, None
+    path_cache = PATH_CACHE
+    for opt, arg in opts:
+        if opt in ('-p', '--port'):
+            port = int(arg)
+        elif opt == '--host':
+            host = arg
+        elif opt == '--socket':
+            unix_socket = arg
+        elif opt == '--path-cache':
+            path_cache = int(arg)
+            if path_cache < 0:
+                sys.exit('--path-cache: 0 or more sources')
+    ifiles = args[0]
+    components = args[1] if len(args) > 1 else None
+    serve(ReactionGraph(ifiles, components, path_cache), port, host, unix_socket)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+'''
+
+Reaction knockout scan: delete every reaction (node) from the reaction graph, one at a
+time, and measure how the topology of its connected component changes, without
+rebuilding the graph or recalculating the other components:
+
+    - Fragmentation: weakly connected pieces left by the component without the reaction
+    (1: still connected) and nodes of the largest piece.
+    - Reachability loss: ordered pairs of the remaining nodes (u reaches v) lost by the
+    knockout, from the successors of every node (reachability.py) before and after.
+    - Betweenness shift: sum and maximum of the absolute change of the betweenness of the
+    remaining nodes, normalized as in the intact component (1/((n-1)(n-2))).
+
+Baseline of every component (once): CSR adjacency, successors, and the dependencies of
+every node for the shortest paths of every source (path_centrality.dependency_rows:
+blocks of sources traversed together with sparse products).
+A knockout only changes the dependencies of the sources that reach the deleted reaction:
+their rows are subtracted and recalculated without it, the rest are reused.
+The dependencies of the sources are kept in memory (sources x nodes) when they fit in
+DEPENDENCY_VALUES, otherwise they are recalculated for every knockout.
+
+With --approx-samples K | --approx-error EPSILON [--seed S] betweenness uses K sampled
+sources (the same pivots as calculate_topology_RG.py, estimate n/K * dependencies):
+every knockout then costs at most K BFS.
+
+Knockouts are independent tasks of a pool of --jobs processes that inherit the
+components and their baselines.
+
+Output (sorted by reachability loss, then betweenness shift):
+    REACTION  COMPONENT  NODES  PIECES  LARGEST_PIECE  BETWEENNESS  BETWEENNESS_SHIFT
+    BETWEENNESS_MAX_SHIFT  REACHABLE_PAIRS  LOST_PAIRS  LOST_FRACTION
+
+    python knockout_scan.py [--jobs N] [--approx-samples K | --approx-error EPSILON] [--seed S]
+        [--components 000,...] [--reactions R1,R2,...] [--stage-cache folder] [--report FILE]
+        reaction_graph output.txt
+
+'''
+import os
+import sys
+import getopt
+import multiprocessing
+import numpy as np
+from scipy.sparse import csgraph
+import path_centrality
+import csr_metrics
+import reachability
+import run_report
+from calculate_topology_RG import reaction_graph_components
+
+
+## Maximum size of the dependency matrix kept in memory (sources x nodes, float64)
+DEPENDENCY_VALUES = 20000000
+
+## Knockouts sent to a process at a time
+CHUNK = 16
+
+
+
+def component_baseline(comp, approx=None):
+    '''
+    Intact component: nodes, adjacency (CSR, also transposed), successors,
+    sources of betweenness and their scale, betweenness (not normalized) and the
+    dependency matrix of the sources (None if it does not fit in memory)
+    '''
+    approx = approx or {}
+    nodes, A = csr_metrics.csr_adjacency(comp)
+    n = len(nodes)
+    succ = reachability.successors_predecessors(A)[0]
+    if approx.get('samples') or approx.get('epsilon'):
+        sources = path_centrality.sample_pivots(n, approx.get('samples'), approx.get('epsilon'), approx.get('seed', 0))
+    else:
+        sources = list(range(n))
+    scale = 1.0 / ((n - 1) * (n - 2)) if n > 2 else 0.0
+    return({'name': comp.name, 'nodes': nodes, 'A': A, 'AT': A.T.tocsr(), 'succ': succ,
+            'sources': np.array(sources, dtype=np.int64), 'scale': scale * n / len(sources),
+            'betweenness': None, 'dependencies': None})
+
+
+
+def knockout(base, r):
+    '''
+    Topology deltas of the component without node r
+    '''
+    n = len(base['nodes'])
+    keep = np.ones(n, dtype=bool)
+    keep[r] = False
+    A = base['A'][keep][:, keep]
+
+    ## fragmentation
+    pieces, labels = csgraph.connected_components(A, directed=True, connection='weak')
+    largest = np.bincount(labels).max() if n > 1 else 0
+
+    ## reachability: pairs among the remaining nodes (without the pairs of r)
+    reaching = csgraph.breadth_first_order(base['AT'], r, directed=True, return_predecessors=False)
+    succ = base['succ']
+    before = int(succ.sum()) - int(succ[r]) - (len(reaching) - 1)
+    after = int(reachability.successors_predecessors(A)[0].sum()) if n > 1 else 0
+
+    ## betweenness: only the sources that reach r change
+    upstream = np.zeros(n, dtype=bool)
+    upstream[reaching] = True
+    rows = np.flatnonzero(upstream[base['sources']])
+    changed = [s for s in base['sources'][rows].tolist() if s != r]
+    if base['dependencies'] is not None:
+        old = base['dependencies'][rows].sum(axis=0)
+    else:
+        old = path_centrality.dependency_rows(base['A'], base['sources'][rows]).sum(axis=0)
+    new = path_centrality.dependency_rows(base['A'], changed, removed=r).sum(axis=0)
+    shift = np.abs(new - old)[keep] * base['scale']
+    return({'reaction': base['nodes'][r], 'component': base['name'], 'nodes': n,
+            'pieces': pieces, 'largest': int(largest),
+            'betweenness': base['betweenness'][r] * base['scale'],
+            'shift': shift.sum(), 'max_shift': shift.max() if len(shift) else 0.0,
+            'pairs': before, 'lost': before - after})
+
+
+
+_BASELINES = []
+
+def _dependency_task(task):
+    '''
+    Worker: dependency rows of some sources of a component (their sum if the matrix
+    does not fit in memory)
+    '''
+    c, sources, store = task
+    rows = path_centrality.dependency_rows(_BASELINES[c]['A'], sources)
+    if store:
+        return(c, sources, rows)
+    return(c, sources, rows.sum(axis=0))
+
+
+
+def _knockout_task(task):
+    c, r = task
+    return(knockout(_BASELINES[c], r))
+
+
+
+def run_pool(function, tasks, jobs, chunk=1):
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes=jobs)
+        results = list(pool.imap(function, tasks, chunksize=chunk))
+        pool.close()
+        pool.join()
+        return(results)
+    return([function(t) for t in tasks])
+
+
+
+def dependencies(baselines, jobs=1):
+    '''
+    Betweenness (not normalized) of every component and the dependency matrix of its
+    sources (when it fits in DEPENDENCY_VALUES), sources split across the processes
+    '''
+    global _BASELINES
+    tasks = []
+    for c, base in enumerate(baselines):
+        sources = base['sources'].tolist()
+        store = len(sources) * len(base['nodes']) <= DEPENDENCY_VALUES
+        tasks += [(c, chunk, store) for chunk in path_centrality.source_chunks(sources)]
+        base['betweenness'] = np.zeros(len(base['nodes']))
+        if store:
+            base['dependencies'] = np.zeros((len(sources), len(base['nodes'])))
+    _BASELINES = baselines
+    for c, sources, values in run_pool(_dependency_task, tasks, jobs):
+        base = baselines[c]
+        if base['dependencies'] is None:
+            base['betweenness'] += values
+        else:
+            base['dependencies'][np.searchsorted(base['sources'], sources)] = values
+            base['betweenness'] += values.sum(axis=0)
+    _BASELINES = []
+
+
+
+def knockout_scan(components, jobs=1, approx=None, reactions=None):
+    '''
+    Knockouts of the reactions (all nodes of the components by default, components
+    with edges). Returns the rows of the table.
+    '''
+    global _BASELINES
+    components = [comp for comp in components if comp.number_of_edges() > 0 and
+                  (reactions is None or any(r in comp for r in reactions))]
+    with run_report.stage('baseline', components=len(components)) as counts:
+        baselines = [component_baseline(comp, approx) for comp in components]
+        dependencies(baselines, jobs)
+        counts['sources'] = sum(len(base['sources']) for base in baselines)
+    tasks = [(c, r) for c, base in enumerate(baselines) for r, node in enumerate(base['nodes'])
+             if reactions is None or node in reactions]
+    print('Knockouts: ' + str(len(tasks)) + ' reactions of ' + str(len(baselines)) + ' components in ' +
+          str(jobs) + ' processes')
+
+    _BASELINES = baselines
+    with run_report.stage('knockouts', knockouts=len(tasks), jobs=jobs):
+        results = run_pool(_knockout_task, tasks, jobs, CHUNK)
+    _BASELINES = []
+    ## shifts compared as written (ties in the last bits are ordered by name)
+    results.sort(key=lambda k: (-k['lost'], -float(_number(k['shift'])), k['reaction']))
+    return(results)
+
+
+
+def _number(x):
+    return('%.10g' % x)
+
+
+
+def write_knockouts(filename, results):
+    f = open(filename, 'w')
+    f.write('REACTION\tCOMPONENT\tNODES\tPIECES\tLARGEST_PIECE\tBETWEENNESS\tBETWEENNESS_SHIFT\t'
+            'BETWEENNESS_MAX_SHIFT\tREACHABLE_PAIRS\tLOST_PAIRS\tLOST_FRACTION\n')
+    for k in results:
+        fraction = float(k['lost']) / k['pairs'] if k['pairs'] else 0.0
+        f.write('\t'.join([k['reaction'], k['component'], str(k['nodes']), str(k['pieces']), str(k['largest']),
+                           _number(k['betweenness']), _number(k['shift']), _number(k['max_shift']),
+                           str(k['pairs']), str(k['lost']), _number(fraction)]) + '\n')
+    f.close()
+    print('Written ' + filename)
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: see the docstring
+    opts, args = getopt.getopt(sys.argv[1:], 'j:', ['jobs=', 'approx-samples=', 'approx-error=', 'seed=',
+                                                    'components=', 'reactions=', 'stage-cache=', 'report='])
+    jobs = 1
+    approx = {}
+    selected, reactions = None, None
+    cache_dir, report = None, None
+    for opt, arg in opts:
+        if opt in ('-j', '--jobs'):
+            jobs = int(arg)
+        elif opt == '--approx-samples':
+            approx['samples'] = int(arg)
+        elif opt == '--approx-error':
+            approx['epsilon'] = float(arg)
+        elif opt == '--seed':
+            approx['seed'] = int(arg)
+        elif opt == '--components':
+            selected = set(c for c in arg.split(',') if c)
+        elif opt == '--reactions':
+            reactions = set(r for r in arg.split(',') if r)
+        elif opt == '--stage-cache':
+            cache_dir = arg
+        elif opt == '--report':
+            report = arg
+    if approx and 'samples' not in approx and 'epsilon' not in approx:
+        approx = {}     # --seed alone: exact calculation
+    ifiles, output = args[:2]
+    if os.path.dirname(output) and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    run_report.start(report, 'knockout_scan.py')
+
+    graphs, graph_key = reaction_graph_components(ifiles, cache_dir)
+    if selected is not None:
+        graphs = [comp for comp in graphs if comp.name in selected]
+    write_knockouts(output, knockout_scan(graphs, jobs, approx, reactions))
+    run_report.finish()
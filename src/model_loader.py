@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+
+'''
+
+Load a metabolic model in MATLAB format reading only what the reaction graph needs:
+reaction IDs, metabolite IDs, stoichiometry, reversibility, subsystems and genes.
+
+    - Reversibility follows cobra: lower bound < 0 < upper bound.
+    - Genes are taken from the gene-reaction rules (grRules).
+    - The model is kept as NumPy arrays plus interned ID tables (CompactModel), with
+    read-only views (reactions, metabolites, genes) that behave like the cobra ones
+    used by create_reaction_graph.py.
+
+Snapshot: with a cache folder, the arrays are stored in a subfolder named after the
+content hash (SHA-1) of the .mat file and memory-mapped by later runs:
+
+    S_data.npy, S_indices.npy, S_indptr.npy     (CSC metabolites x reactions)
+    G_indices.npy, G_indptr.npy                 (CSC genes x reactions)
+    lb.npy, ub.npy
+    reactions.npy, metabolites.npy, genes.npy, subsystems.npy
+
+cobra is only imported on a cache miss when the MATLAB struct can not be read directly.
+
+'''
+import os
+import re
+import shutil
+import hashlib
+import numpy as np
+import scipy.io as sio
+import scipy.sparse as sp
+
+
+SNAPSHOT_VERSION = '1'
+SNAPSHOT_ARRAYS = ['S_data', 'S_indices', 'S_indptr', 'G_indices', 'G_indptr', 'lb', 'ub',
+                   'reactions', 'metabolites', 'genes', 'subsystems']
+
+_gene_tokens_re = re.compile(r'[\s()]+')
+
+
+
+class IdList(list):
+    '''
+    List of model objects with lookup by id (like cobra DictList)
+    '''
+    def __init__(self, items=()):
+        list.__init__(self, items)
+        self._index = dict((x.id, i) for i, x in enumerate(self))
+
+    def get_by_id(self, id):
+        return(self[self._index[id]])
+
+    def has_id(self, id):
+        return(id in self._index)
+
+
+
+class CompactMetabolite(object):
+    __slots__ = ['id']
+
+    def __init__(self, id):
+        self.id = id
+
+    def __str__(self):
+        return(self.id)
+
+    def __repr__(self):
+        return('<Metabolite %s>' % self.id)
+
+
+
+class CompactGene(object):
+    __slots__ = ['id', 'reactions']
+
+    def __init__(self, id):
+        self.id = id
+        self.reactions = frozenset()
+
+    def __str__(self):
+        return(self.id)
+
+    def __repr__(self):
+        return('<Gene %s>' % self.id)
+
+
+
+class CompactReaction(object):
+    __slots__ = ['id', 'metabolites', 'reversibility', 'subsystem', 'genes']
+
+    def __init__(self, id, metabolites, reversibility, subsystem):
+        self.id = id
+        self.metabolites = metabolites
+        self.reversibility = reversibility
+        self.subsystem = subsystem
+        self.genes = frozenset()
+
+    @property
+    def reactants(self):
+        return([m for m, c in self.metabolites.items() if c < 0])
+
+    @property
+    def products(self):
+        return([m for m, c in self.metabolites.items() if c > 0])
+
+    def __str__(self):
+        return(self.id)
+
+    def __repr__(self):
+        return('<Reaction %s>' % self.id)
+
+
+
+class CompactModel(object):
+    '''
+    Arrays of a metabolic model:
+        - S: stoichiometric matrix, metabolites x reactions (CSC)
+        - G: gene-reaction association, genes x reactions (CSC, 0/1)
+        - lb, ub: bounds of the reactions
+        - reaction_ids, metabolite_ids, gene_ids, subsystems: lists of str
+    The cobra-like views (reactions, metabolites, genes) are built on first use.
+    '''
+    def __init__(self, S, G, lb, ub, reaction_ids, metabolite_ids, gene_ids, subsystems, id=None):
+        self.id = id
+        self.S = S
+        self.G = G
+        self.lb = np.asarray(lb, dtype=np.float64)
+        self.ub = np.asarray(ub, dtype=np.float64)
+        self.reaction_ids = list(reaction_ids)
+        self.metabolite_ids = list(metabolite_ids)
+        self.gene_ids = list(gene_ids)
+        self.subsystems = list(subsystems)
+        self._views = None
+
+    @property
+    def reversible(self):
+        return((self.lb < 0) & (self.ub > 0))
+
+    def _build_views(self):
+        metabolites = IdList(CompactMetabolite(m) for m in self.metabolite_ids)
+        genes = IdList(CompactGene(g) for g in self.gene_ids)
+        reversible = self.reversible
+        S, G = self.S, self.G
+        reactions = []
+        for j, r_id in enumerate(self.reaction_ids):
+            start, end = S.indptr[j], S.indptr[j+1]
+            mets = dict((metabolites[i], float(c)) for i, c in zip(S.indices[start:end], S.data[start:end]))
+            reactions.append(CompactReaction(r_id, mets, bool(reversible[j]), self.subsystems[j]))
+        reactions = IdList(reactions)
+        by_gene = [[] for g in genes]
+        for j, rr in enumerate(reactions):
+            r_genes = [genes[i] for i in G.indices[G.indptr[j]:G.indptr[j+1]]]
+            rr.genes = frozenset(r_genes)
+            for i in G.indices[G.indptr[j]:G.indptr[j+1]]:
+                by_gene[i].append(rr)
+        for g, g_reactions in zip(genes, by_gene):
+            g.reactions = frozenset(g_reactions)
+        self._views = (reactions, metabolites, genes)
+
+    @property
+    def reactions(self):
+        if self._views is None:
+            self._build_views()
+        return(self._views[0])
+
+    @property
+    def metabolites(self):
+        if self._views is None:
+            self._build_views()
+        return(self._views[1])
+
+    @property
+    def genes(self):
+        if self._views is None:
+            self._build_views()
+        return(self._views[2])
+
+    def remove_reactions(self, reactions):
+        '''
+        Remove reactions (ids or reaction views) from the model. Metabolites are kept.
+        '''
+        remove = set(str(r) for r in reactions)
+        keep = np.array([r not in remove for r in self.reaction_ids], dtype=bool)
+        self.S = self.S[:, keep].tocsc()
+        self.G = self.G[:, keep].tocsc()
+        self.lb, self.ub = self.lb[keep], self.ub[keep]
+        self.reaction_ids = [r for r, k in zip(self.reaction_ids, keep) if k]
+        self.subsystems = [s for s, k in zip(self.subsystems, keep) if k]
+        self._views = None
+
+
+
+def _to_str(x):
+    '''
+    Native str (utf-8 encoded in python 2)
+    '''
+    try:
+        return(str(x))
+    except UnicodeEncodeError:
+        return(x.encode('utf-8'))
+
+
+
+def _cell_str(x):
+    '''
+    First string inside a (nested) MATLAB cell, '' if empty.
+    '''
+    while isinstance(x, np.ndarray):
+        if x.size == 0:
+            return('')
+        x = x.flat[0]
+    return(_to_str(x))
+
+
+
+def parse_gene_rule(rule):
+    '''
+    Gene ids in a gene-reaction rule, in order of appearance (e.g. "(26.1) or (314.2 and 314.1)")
+    '''
+    genes = []
+    for token in _gene_tokens_re.split(rule):
+        if token and token.lower() not in ('and', 'or') and token not in genes:
+            genes.append(token)
+    return(genes)
+
+
+
+def from_mat_struct(m, model_id=None):
+    '''
+    Create a CompactModel from the COBRA toolbox struct read by scipy.io.loadmat
+    '''
+    if m.dtype.names is None or not set(['rxns', 'mets', 'S', 'lb', 'ub']) <= set(m.dtype.names):
+        raise ValueError('not a valid mat struct')
+    field = lambda name: m[name][0, 0]
+
+    reaction_ids = [_cell_str(x) for x in field('rxns')]
+    metabolite_ids = [_cell_str(x) for x in field('mets')]
+    n_rxns = len(reaction_ids)
+    lb = np.asarray(field('lb'), dtype=np.float64).reshape(-1)
+    ub = np.asarray(field('ub'), dtype=np.float64).reshape(-1)
+    S = sp.csc_matrix(field('S'), dtype=np.float64)
+    S.eliminate_zeros()
+    S.sort_indices()
+
+    if 'subSystems' in m.dtype.names:
+        subsystems = [_cell_str(x) for x in field('subSystems')]
+    else:
+        subsystems = [''] * n_rxns
+
+    gene_ids, gene_pos = [], {}
+    rows, cols = [], []
+    if 'grRules' in m.dtype.names:
+        for j, x in enumerate(field('grRules')):
+            for g in parse_gene_rule(_cell_str(x)):
+                if g not in gene_pos:
+                    gene_pos[g] = len(gene_ids)
+                    gene_ids.append(g)
+                rows.append(gene_pos[g])
+                cols.append(j)
+    G = sp.csc_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(len(gene_ids), n_rxns))
+    G.sort_indices()
+
+    return(CompactModel(S, G, lb, ub, reaction_ids, metabolite_ids, gene_ids, subsystems, id=model_id))
+
+
+
+def from_cobra(mod):
+    '''
+    Create a CompactModel from a cobra model
+    '''
+    metabolite_ids = [m.id for m in mod.metabolites]
+    met_pos = dict((m, i) for i, m in enumerate(metabolite_ids))
+    gene_ids = [g.id for g in mod.genes]
+    gene_pos = dict((g, i) for i, g in enumerate(gene_ids))
+    s_rows, s_cols, s_data, g_rows, g_cols = [], [], [], [], []
+    for j, r in enumerate(mod.reactions):
+        for m, c in r.metabolites.items():
+            s_rows.append(met_pos[m.id])
+            s_cols.append(j)
+            s_data.append(c)
+        for g in r.genes:
+            g_rows.append(gene_pos[g.id])
+            g_cols.append(j)
+    n_rxns = len(mod.reactions)
+    S = sp.csc_matrix((np.asarray(s_data, dtype=np.float64), (s_rows, s_cols)), shape=(len(metabolite_ids), n_rxns))
+    S.sort_indices()
+    G = sp.csc_matrix((np.ones(len(g_rows), dtype=np.int8), (g_rows, g_cols)), shape=(len(gene_ids), n_rxns))
+    G.sort_indices()
+    return(CompactModel(S, G, [r.lower_bound for r in mod.reactions], [r.upper_bound for r in mod.reactions],
+                        [r.id for r in mod.reactions], metabolite_ids, gene_ids,
+                        [r.subsystem for r in mod.reactions], id=mod.id))
+
+
+
+def read_matlab_model(matfile):
+    '''
+    Read the first MATLAB variable that looks like a COBRA model.
+    Falls back to cobra.io.load_matlab_model if the struct can not be read directly.
+    '''
+    data = sio.loadmat(matfile)
+    possible_names = sorted(k for k in data if not k.startswith('__'))
+    for name in possible_names:
+        try:
+            return(from_mat_struct(data[name], model_id=name))
+        except (ValueError, IndexError, TypeError):
+            pass
+    import cobra
+    return(from_cobra(cobra.io.load_matlab_model(matfile)))
+
+
+
+def file_hash(filename):
+    '''
+    SHA-1 of the contents of a file
+    '''
+    h = hashlib.sha1()
+    f = open(filename, 'rb')
+    for block in iter(lambda: f.read(1 << 20), b''):
+        h.update(block)
+    f.close()
+    return(h.hexdigest())
+
+
+
+def _id_table(ids):
+    if len(ids) == 0:
+        return(np.array([], dtype='U1'))
+    return(np.array([u'%s' % x for x in ids]))
+
+
+
+def save_snapshot(folder, mod):
+    '''
+    Write the arrays of the model as .npy files (written in a temporary folder, then renamed)
+    '''
+    tmp = folder + '.tmp%d' % os.getpid()
+    if not os.path.exists(tmp):
+        os.makedirs(tmp)
+    arrays = {
+        'S_data': mod.S.data, 'S_indices': mod.S.indices, 'S_indptr': mod.S.indptr,
+        'G_indices': mod.G.indices, 'G_indptr': mod.G.indptr,
+        'lb': mod.lb, 'ub': mod.ub,
+        'reactions': _id_table(mod.reaction_ids), 'metabolites': _id_table(mod.metabolite_ids),
+        'genes': _id_table(mod.gene_ids), 'subsystems': _id_table(mod.subsystems),
+    }
+    for name in SNAPSHOT_ARRAYS:
+        np.save(os.path.join(tmp, name + '.npy'), arrays[name])
+    f = open(os.path.join(tmp, 'id.txt'), 'w')
+    f.write('%s\n' % mod.id)
+    f.close()
+    if os.path.exists(folder):   # written by another process meanwhile
+        shutil.rmtree(tmp)
+        return
+    os.rename(tmp, folder)
+
+
+
+def load_snapshot(folder):
+    '''
+    Memory-map the arrays of a snapshot into a CompactModel
+    '''
+    a = dict((name, np.load(os.path.join(folder, name + '.npy'), mmap_mode='r')) for name in SNAPSHOT_ARRAYS)
+    reaction_ids = [_to_str(x) for x in a['reactions'].tolist()]
+    metabolite_ids = [_to_str(x) for x in a['metabolites'].tolist()]
+    gene_ids = [_to_str(x) for x in a['genes'].tolist()]
+    S = sp.csc_matrix((a['S_data'], a['S_indices'], a['S_indptr']), shape=(len(metabolite_ids), len(reaction_ids)))
+    G = sp.csc_matrix((np.ones(len(a['G_indices']), dtype=np.int8), a['G_indices'], a['G_indptr']),
+                      shape=(len(gene_ids), len(reaction_ids)))
+    f = open(os.path.join(folder, 'id.txt'))
+    model_id = f.read().strip()
+    f.close()
+    return(CompactModel(S, G, a['lb'], a['ub'], reaction_ids, metabolite_ids, gene_ids,
+                        [_to_str(x) for x in a['subsystems'].tolist()], id=model_id))
+
+
+
+def snapshot_folder(cache_dir, matfile):
+    name = os.path.splitext(os.path.basename(matfile))[0]
+    return(os.path.join(cache_dir, '%s-%s-v%s' % (name, file_hash(matfile), SNAPSHOT_VERSION)))
+
+
+
+def load_model(matfile, cache_dir=None):
+    '''
+    Load a model (CompactModel). With a cache folder, reuse the snapshot of the file
+    contents if it exists, otherwise read the .mat file and write the snapshot.
+    '''
+    if cache_dir is None:
+        return(read_matlab_model(matfile))
+    folder = snapshot_folder(cache_dir, matfile)
+    if os.path.exists(folder):
+        print('\nLoading model snapshot: '+folder)
+        return(load_snapshot(folder))
+    mod = read_matlab_model(matfile)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    save_snapshot(folder, mod)
+    print('\nModel snapshot saved: '+folder)
+    return(mod)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+'''
+
+Degree-preserving null models of the connected components of a reaction graph:
+empirical mean, standard deviation and z-score of every topology measure of every
+reaction, against K random rewirings of its component.
+
+    - Rewiring: directed double-edge swaps (a --> b, c --> d) => (a --> d, c --> b), which
+    keep the in-degree and out-degree of every node. Every round pairs all the swappable
+    edges at random (disjoint pairs) and applies at once the swaps that do not create an
+    existing link or the same new link twice, until SWAPS x edges swaps were tried.
+    - Self-loops (--self-loops): 'keep' (default) self-loops are not swapped and no new
+    ones are created (same self-loops as the model); 'swap' they are swapped as any link.
+    - Measures: the DG_* functions of calculate_topology_RG.py (DG_topology) on every
+    rewiring, with the same options (--measures, --approx-samples K | --approx-error E).
+    Categorical (source/sink) and NA values are not summarized.
+    - Every rewiring (component, replicate) has its own seeded random stream, and the
+    replicates are summed in order: same results with any number of --jobs. Rewirings are
+    tasks of a pool of processes.
+
+Output: null_models.txt, one row per component, reaction and measure:
+    COMPONENT  REACTION  MEASURE  OBSERVED  NULL_MEAN  NULL_SD  Z  K
+    (Z = NA if the null SD is 0, e.g. in/out-degree)
+
+    python null_models.py [--replicates K] [--swaps Q] [--self-loops keep|swap] [--seed S] [--jobs N]
+        [--components 000,...] [--measures closeness,betweenness,...]
+        [--approx-samples K | --approx-error EPSILON] [--stage-cache folder] [--report FILE]
+        reaction_graph output
+
+'''
+import os
+import sys
+import zlib
+import getopt
+import multiprocessing
+import numpy as np
+import calculate_topology_RG
+import csr_metrics
+import run_report
+from calculate_topology_RG import MeasureBuffer
+from graph_core import GraphCore
+
+
+REPLICATES = 100
+## Swaps tried per link
+SWAPS = 10
+SEED = 46268008
+
+
+
+def stream(seed, component, replicate):
+    '''
+    Random stream of a rewiring of a component
+    '''
+    return(np.random.RandomState([seed, zlib.crc32(component.encode('utf-8')) & 0xffffffff, replicate]))
+
+
+
+def edge_arrays(comp):
+    '''
+    Nodes of the component and its links as arrays of node positions
+    '''
+    nodes, A = csr_metrics.csr_adjacency(comp)
+    coo = A.tocoo()
+    return(nodes, coo.row.astype(np.int64), coo.col.astype(np.int64))
+
+
+
+def rewire(u, v, n, rng, swaps=SWAPS, self_loops='keep'):
+    '''
+    Targets of the links after the double-edge swaps (sources u do not change:
+    out-degrees are kept, and the targets are permuted: in-degrees are kept)
+    '''
+    v = v.copy()
+    swappable = np.flatnonzero(u != v) if self_loops == 'keep' else np.arange(len(u))
+    half = len(swappable) // 2
+    if half == 0:
+        return(v)
+    keys = np.sort(u * n + v)
+    tried = 0
+    while tried < swaps * len(u):
+        order = rng.permutation(swappable)
+        a, c = order[:half], order[half:2*half]
+        new_a, new_c = u[a] * n + v[c], u[c] * n + v[a]
+        ok = (u[a] != u[c]) & (v[a] != v[c])
+        if self_loops == 'keep':
+            ok &= (u[a] != v[c]) & (u[c] != v[a])
+        ## new links must not exist (nor be created twice in this round)
+        ok &= ~_member(new_a, keys) & ~_member(new_c, keys)
+        created = np.concatenate([new_a[ok], new_c[ok]])
+        values, counts = np.unique(created, return_counts=True)
+        ok[ok] &= ~_member(new_a[ok], values[counts > 1]) & ~_member(new_c[ok], values[counts > 1])
+        v[a[ok]], v[c[ok]] = v[c[ok]], v[a[ok]]
+        keys = np.sort(u * n + v)
+        tried += half
+    return(v)
+
+
+
+def _member(x, sorted_values):
+    '''
+    x in sorted_values (element-wise)
+    '''
+    if not len(sorted_values):
+        return(np.zeros(len(x), dtype=bool))
+    i = np.minimum(np.searchsorted(sorted_values, x), len(sorted_values) - 1)
+    return(sorted_values[i] == x)
+
+
+
+def measure_values(comp, nodes, approx=None, names=None):
+    '''
+    Numeric measures of DG_topology of a graph: {measure: array in node order}
+    (NaN for NA values, categorical measures left out)
+    '''
+    produced = calculate_topology_RG.DG_topology(MeasureBuffer(), comp, 1, approx, names)
+    values = {}
+    for name, function, code in calculate_topology_RG.TOPOLOGY_MEASURES:
+        for filename, header, measure, message, error, comment in produced.get(name, []):
+            column = [measure.get(node) for node in nodes]
+            if not all(isinstance(x, (int, float)) or x == 'NA' for x in column):
+                continue
+            values[filename.rsplit('.list', 1)[0]] = np.array([np.nan if x == 'NA' else x for x in column], dtype=float)
+    return(values)
+
+
+
+_COMPONENTS = []
+_OPTIONS = {}
+
+def _replicate_task(task):
+    '''
+    Worker: measures of one rewiring of a component (inherited from the parent process)
+    '''
+    c, replicate = task
+    comp, nodes, u, v = _COMPONENTS[c]
+    rng = stream(_OPTIONS['seed'], comp.name, replicate)
+    v = rewire(u, v, len(nodes), rng, _OPTIONS['swaps'], _OPTIONS['self_loops'])
+    G = GraphCore.from_positions(nodes, u, v, comp.name)
+    return(c, measure_values(G, nodes, _OPTIONS['approx'], _OPTIONS['names']))
+
+
+
+def null_models(components, replicates=REPLICATES, swaps=SWAPS, self_loops='keep', seed=SEED, jobs=1,
+                approx=None, names=None):
+    '''
+    Observed measures and null mean/SD of every component with links.
+    Returns [(component, nodes, {measure: (observed, mean, sd)})], sums of every
+    replicate are accumulated as they arrive (shifted by the observed values).
+    '''
+    global _COMPONENTS, _OPTIONS
+    components = [comp for comp in components if comp.number_of_edges() > 0]
+    prepared = [(comp,) + edge_arrays(comp) for comp in components]
+    _COMPONENTS = prepared
+    _OPTIONS = {'seed': seed, 'swaps': swaps, 'self_loops': self_loops, 'approx': approx, 'names': names}
+    observed, total, total_sq, count = [], [], [], []
+    for comp, nodes, u, v in prepared:
+        observed.append(measure_values(comp, nodes, approx, names))
+        total.append(dict((m, np.zeros(len(nodes))) for m in observed[-1]))
+        total_sq.append(dict((m, np.zeros(len(nodes))) for m in observed[-1]))
+        count.append(dict((m, np.zeros(len(nodes))) for m in observed[-1]))
+
+    tasks = [(c, k) for c in range(len(components)) for k in range(replicates)]
+    print('Null models: ' + str(len(components)) + ' components x ' + str(replicates) + ' rewirings in ' +
+          str(jobs) + ' processes')
+    with run_report.stage('rewirings', rewirings=len(tasks), jobs=jobs):
+        if jobs > 1:
+            pool = multiprocessing.Pool(processes=jobs)
+            results = pool.imap(_replicate_task, tasks)
+        else:
+            results = (_replicate_task(t) for t in tasks)
+        for done, (c, values) in enumerate(results):
+            for m in total[c]:
+                x = values.get(m)
+                if x is None:
+                    continue
+                d = x - observed[c][m]
+                valid = ~np.isnan(d)
+                total[c][m][valid] += d[valid]
+                total_sq[c][m][valid] += d[valid] ** 2
+                count[c][m] += valid
+            calculate_topology_RG.progress(done + 1, len(tasks))
+        if jobs > 1:
+            pool.close()
+            pool.join()
+        print('')
+    _COMPONENTS, _OPTIONS = [], {}
+
+    summary = []
+    for c, (comp, nodes, u, v) in enumerate(prepared):
+        stats = {}
+        for m, obs in observed[c].items():
+            k = count[c][m]
+            mean_d = total[c][m] / np.maximum(k, 1)
+            var = (total_sq[c][m] - k * mean_d ** 2) / np.maximum(k - 1, 1)
+            sd = np.sqrt(np.maximum(var, 0.0))
+            stats[m] = (obs, np.where(k > 0, obs + mean_d, np.nan), np.where(k > 1, sd, np.nan), k)
+        summary.append((comp.name, nodes, stats))
+    return(summary)
+
+
+
+def _number(x):
+    if x != x:
+        return('NA')
+    return('%.10g' % x)
+
+
+
+def write_null_models(filename, summary):
+    f = open(filename, 'w')
+    f.write('COMPONENT\tREACTION\tMEASURE\tOBSERVED\tNULL_MEAN\tNULL_SD\tZ\tK\n')
+    for component, nodes, stats in summary:
+        for m in sorted(stats):
+            obs, mean, sd, k = stats[m]
+            ## z-scores of null SDs that are 0 up to rounding (degrees) are not defined
+            spread = np.nan_to_num(sd) > 1e-12 * np.maximum(np.abs(np.nan_to_num(mean)), 1.0)
+            z = np.full(len(nodes), np.nan)
+            z[spread] = (obs[spread] - mean[spread]) / sd[spread]
+            for i in np.argsort(nodes, kind='mergesort'):
+                f.write('\t'.join([component, nodes[i], m, _number(obs[i]), _number(mean[i]), _number(sd[i]),
+                                   _number(z[i]), str(int(k[i]))]) + '\n')
+    f.close()
+    print('Written ' + filename)
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: see the docstring
+    opts, args = getopt.getopt(sys.argv[1:], 'j:', ['replicates=', 'swaps=', 'self-loops=', 'seed=', 'jobs=',
+                                                    'components=', 'measures=', 'approx-samples=',
+                                                    'approx-error=', 'stage-cache=', 'report='])
+    replicates, swaps, self_loops, seed, jobs = REPLICATES, SWAPS, 'keep', SEED, 1
+    selected, names = None, None
+    approx = {}
+    cache_dir, report = None, None
+    for opt, arg in opts:
+        if opt == '--replicates':
+            replicates = int(arg)
+        elif opt == '--swaps':
+            swaps = float(arg)
+        elif opt == '--self-loops':
+            if arg not in ('keep', 'swap'):
+                sys.exit('--self-loops: keep or swap')
+            self_loops = arg
+        elif opt == '--seed':
+            seed = int(arg)
+        elif opt in ('-j', '--jobs'):
+            jobs = int(arg)
+        elif opt == '--components':
+            selected = set(c for c in arg.split(',') if c)
+        elif opt == '--measures':
+            names = [m for m in arg.split(',') if m]
+        elif opt == '--approx-samples':
+            approx['samples'] = int(arg)
+        elif opt == '--approx-error':
+            approx['epsilon'] = float(arg)
+        elif opt == '--stage-cache':
+            cache_dir = arg
+        elif opt == '--report':
+            report = arg
+    if approx:
+        approx['seed'] = seed
+    ifiles, output = args[:2]
+    if not os.path.exists(output):
+        os.makedirs(output)
+    run_report.start(report, 'null_models.py')
+
+    graphs, graph_key = calculate_topology_RG.reaction_graph_components(ifiles, cache_dir)
+    if selected is not None:
+        graphs = [comp for comp in graphs if comp.name in selected]
+    summary = null_models(graphs, replicates, swaps, self_loops, seed, jobs, approx, names)
+    write_null_models(os.path.join(output, 'null_models.txt'), summary)
+    run_report.finish()
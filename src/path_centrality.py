@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+
+'''
+
+Exact shortest-path centralities of a DIRECTED graph with the source nodes split
+across worker processes:
+
+    - Betweenness: Brandes algorithm on blocks of sources (dependency_rows): the BFS of
+    all the sources of a block advance one level at a time with a sparse product of the
+    CSR adjacency, and the dependencies are accumulated level by level backwards.
+    The partial dependency vectors of every chunk of sources are summed in chunk order
+    and normalized as nx.betweenness_centrality (normalized by 1/((n-1)(n-2))).
+    - Closeness: one BFS per source, same definition as nx.closeness_centrality
+    (outgoing distances in networkx 1.x, incoming distances in networkx >= 2).
+
+The graph is converted once to a CSR adjacency (integer adjacency lists for the BFS of
+closeness) that the workers inherit from the parent process (fork), so there is a
+single read-only copy of it. Results match networkx up to floating point summation order.
+The chunks of sources depend only on the number of sources (SOURCE_CHUNK), not on the
+number of processes: results are the same with any number of jobs.
+
+Approximate mode (pivot sampling): k sources (pivots) are sampled without replacement
+with a fixed seed. Every node gets the estimate and the half-width of its 95% confidence
+interval, from the per-pivot contributions:
+
+    - Betweenness: n/k * sum of the dependencies on the node of the sampled sources.
+    The contribution of a source is bounded (dependency <= n - 2), so the interval is the
+    empirical Bernstein bound (Maurer & Pontil 2009), without assumptions on their
+    distribution: the normal approximation covers far less than 95% of the nodes, as most
+    sources contribute 0 and a few a lot (nodes that no pivot goes through get 0 +/- bound).
+    - Closeness: reachability (x) and distance (y) of the node to the pivots, 
+    closeness = mean(x)^2 / mean(y), error by the delta method (finite population corrected).
+
+The number of pivots is given or derived from a target absolute error (epsilon) with 
+the Hoeffding bound for all nodes at 95%: k = ln(2n/0.05) / (2 epsilon^2).
+
+'''
+import math
+import multiprocessing
+import numpy as np
+import networkx as nx
+from scipy.sparse import csgraph
+import csr_metrics
+
+
+## networkx >= 2 computes closeness of directed graphs with incoming distances
+CLOSENESS_INCOMING = int(nx.__version__.split('.')[0]) >= 2
+
+## Sources per chunk (tasks of the pool, partial sums added in chunk order)
+SOURCE_CHUNK = 128
+
+## Maximum size of a block of sources x nodes (dependency_rows, float64 values)
+SOURCE_BLOCK = 500000
+
+## Normal quantile of the reported confidence intervals (closeness)
+Z_95 = 1.959964
+
+## Two-sided error probability of the empirical Bernstein intervals (betweenness)
+ALPHA = 0.05
+
+_GRAPH = None
+
+
+
+def integer_adjacency(G, reverse=False):
+    '''
+    Node list and successors (predecessors if reverse) of every node as lists of positions
+    '''
+    nodes, A = csr_metrics.csr_adjacency(G)
+    if reverse:
+        A = A.T.tocsr()
+    neighbors = [A.indices[A.indptr[i]:A.indptr[i+1]].tolist() for i in range(len(nodes))]
+    return(nodes, neighbors)
+
+
+
+def dependency_rows(A, sources, removed=None):
+    '''
+    Dependencies of every node for the shortest paths of every source (unweighted Brandes
+    algorithm, one row per source) from the CSR adjacency A (A[i,j] = 1 if i --> j).
+    Blocks of sources are traversed together, one BFS level at a time: the path counts
+    of level d+1 are the sparse product of the rows of the level d nodes (of any source),
+    and the dependencies of level d-1 are sigma * A (1 + delta) / sigma of level d.
+    Only the rows of the nodes of a level are touched.
+    removed: a node deleted from the graph (knockouts), never reached
+    '''
+    n = A.shape[0]
+    sources = np.asarray(sources, dtype=np.int64)
+    rows = np.zeros((len(sources), n))
+    block = max(1, SOURCE_BLOCK // max(n, 1))
+    for first in range(0, len(sources), block):
+        S = sources[first:first+block]
+        b = len(S)
+        ## node x source arrays
+        seen = np.zeros((n, b), dtype=bool)
+        sigma = np.zeros((n, b))
+        if removed is not None:
+            seen[removed] = True
+        seen[S, np.arange(b)] = True
+        sigma[S, np.arange(b)] = 1.0
+        nodes = np.unique(S)
+        levels = [(nodes, nodes[:, None] == S[None, :])]
+        counts = sigma[nodes]
+        while True:
+            ## successors of the level nodes, and their path counts by source
+            T = A[nodes].T.tocsr()
+            targets = np.flatnonzero(np.diff(T.indptr))
+            counts = T[targets].dot(counts)
+            reached = ~seen[targets] & (counts > 0)
+            keep = reached.any(axis=1)
+            if not keep.any():
+                break
+            nodes, reached = targets[keep], reached[keep]
+            counts = np.where(reached, counts[keep], 0.0)
+            seen[nodes] |= reached
+            sigma[nodes] += counts
+            levels.append((nodes, reached))
+        delta = np.zeros((n, b))
+        for d in range(len(levels) - 1, 0, -1):
+            nodes, level = levels[d]
+            coeff = np.where(level, (1.0 + delta[nodes]) / np.where(level, sigma[nodes], 1.0), 0.0)
+            parents, parent_level = levels[d - 1]
+            delta[parents] += np.where(parent_level, sigma[parents] * A[parents][:, nodes].dot(coeff), 0.0)
+        delta[S, np.arange(b)] = 0.0
+        rows[first:first+b] = delta.T
+    return(rows)
+
+
+
+def bfs_distances(adj, s):
+    '''
+    Distances from s to every node (-1 if not reachable) and the list of reached nodes
+    '''
+    D = [-1] * len(adj)
+    D[s] = 0
+    Q = [s]
+    head = 0
+    while head < len(Q):
+        v = Q[head]
+        head += 1
+        Dv = D[v] + 1
+        for w in adj[v]:
+            if D[w] < 0:
+                D[w] = Dv
+                Q.append(w)
+    return(D, Q)
+
+
+
+def bfs_sources(adj, sources):
+    '''
+    Number of reachable nodes and sum of distances from every source (BFS).
+    Returns two arrays with one value per source.
+    '''
+    reached = np.zeros(len(sources))
+    total = np.zeros(len(sources))
+    for k, s in enumerate(sources):
+        D, Q = bfs_distances(adj, s)
+        reached[k] = len(Q)
+        total[k] = sum(D[v] for v in Q)
+    return(reached, total)
+
+
+
+def dependency_sums(A, sources, squares=False):
+    '''
+    Sum of the dependency_rows of the sources (and of their squares), block by block
+    '''
+    total, total_sq = np.zeros(A.shape[0]), np.zeros(A.shape[0])
+    block = max(1, SOURCE_BLOCK // max(A.shape[0], 1))
+    for first in range(0, len(sources), block):
+        rows = dependency_rows(A, sources[first:first+block])
+        total += rows.sum(axis=0)
+        if squares:
+            total_sq += (rows ** 2).sum(axis=0)
+    if squares:
+        return(total, total_sq)
+    return(total)
+
+
+
+def _betweenness_task(sources):
+    return(dependency_sums(_GRAPH, sources))
+
+
+
+def _betweenness_sq_task(sources):
+    return(dependency_sums(_GRAPH, sources, squares=True))
+
+
+
+def _closeness_task(sources):
+    return(sources, bfs_sources(_GRAPH, sources))
+
+
+
+def distance_sums(A, sources):
+    '''
+    For every node: number of sources at distance > 0 (reachable, not itself), sum of
+    those distances and of their squares. BFS distances of blocks of sources of at
+    most csr_metrics.DISTANCE_BLOCK values.
+    '''
+    n = A.shape[0]
+    reached, total, total_sq = np.zeros(n), np.zeros(n), np.zeros(n)
+    block = max(1, csr_metrics.DISTANCE_BLOCK // max(n, 1))
+    for first in range(0, len(sources), block):
+        D = csgraph.shortest_path(A, directed=True, unweighted=True, indices=sources[first:first+block])
+        D[np.isinf(D)] = 0.0
+        reached += (D > 0).sum(0)
+        total += D.sum(0)
+        total_sq += (D ** 2).sum(0)
+    return(reached, total, total_sq)
+
+
+
+def _distances_task(sources):
+    return(distance_sums(_GRAPH, sources))
+
+
+
+def source_chunks(sources):
+    '''
+    Split the sources in consecutive chunks of SOURCE_CHUNK (neighbouring sources share
+    most of their BFS levels): the same chunks with any number of processes
+    '''
+    chunks = [sources[i:i+SOURCE_CHUNK] for i in range(0, len(sources), SOURCE_CHUNK)]
+    return(chunks or [sources])
+
+
+
+def _run(task, adj, jobs, sources=None):
+    '''
+    Split the source nodes (all nodes of the adjacency lists by default) in chunks and
+    map them to a pool of processes that inherit adj (adjacency lists or CSR).
+    Results are returned in chunk order.
+    '''
+    global _GRAPH
+    if sources is None:
+        sources = list(range(len(adj)))
+    chunks = source_chunks(sources)
+    _GRAPH = adj
+    if jobs > 1:
+        pool = multiprocessing.Pool(processes=jobs)
+        results = pool.map(task, chunks)
+        pool.close()
+        pool.join()
+    else:
+        results = [task(c) for c in chunks]
+    _GRAPH = None
+    return(results)
+
+
+
+def betweenness_centrality(G, jobs=1):
+    '''
+    Exact normalized betweenness {node: value} (as nx.betweenness_centrality on a DiGraph)
+    '''
+    nodes, A = csr_metrics.csr_adjacency(G)
+    n = len(nodes)
+    betweenness = np.zeros(n)
+    for partial in _run(_betweenness_task, A, jobs, list(range(n))):
+        betweenness += partial
+    if n > 2:
+        betweenness *= 1.0 / ((n - 1) * (n - 2))
+    return(dict(zip(nodes, betweenness.tolist())))
+
+
+
+def closeness_centrality(G, jobs=1):
+    '''
+    Closeness {node: value} (as nx.closeness_centrality):
+        (r/totsp) * (r/(n-1)) with r = reachable nodes, totsp = sum of distances
+    '''
+    nodes, adj = integer_adjacency(G, reverse=CLOSENESS_INCOMING)
+    n = len(nodes)
+    closeness = [0.0] * n
+    for sources, (reached, total) in _run(_closeness_task, adj, jobs):
+        for s, r, totsp in zip(sources, reached, total):
+            if totsp > 0.0 and n > 1:
+                closeness[s] = ((r - 1.0) / totsp) * ((r - 1.0) / (n - 1))
+    return(dict(zip(nodes, closeness)))
+
+
+
+def pivots_for_error(n, epsilon):
+    '''
+    Number of pivots for an absolute error epsilon on every node (Hoeffding bound, 95%)
+    '''
+    return(int(math.ceil(math.log(2.0 * n / 0.05) / (2.0 * epsilon ** 2))))
+
+
+
+def sample_size(n, samples=None, epsilon=None):
+    '''
+    Number of pivots for a graph of n nodes (n: exact calculation)
+    '''
+    k = samples if samples is not None else pivots_for_error(n, epsilon)
+    return(max(1, min(n, k)))
+
+
+
+def sample_pivots(n, samples=None, epsilon=None, seed=0):
+    '''
+    Sorted sample of pivots (positions) without replacement, all nodes if k >= n
+    '''
+    k = sample_size(n, samples, epsilon)
+    if k >= n:
+        return(list(range(n)))
+    rng = np.random.RandomState(seed)
+    return(sorted(rng.choice(n, k, replace=False).tolist()))
+
+
+
+def bernstein_error(sum_x, sum_x2, k, bound, alpha=ALPHA):
+    '''
+    Half-width of the two-sided 1 - alpha interval of the mean of k values in [0, bound]
+    from their sums (empirical Bernstein bound, Maurer & Pontil 2009)
+    '''
+    if k < 2:
+        return(np.full(len(sum_x), float(bound)))
+    log_term = math.log(4.0 / alpha)
+    variance = np.maximum(sum_x2 - sum_x ** 2 / k, 0.0) / (k - 1)
+    return(np.sqrt(2.0 * variance * log_term / k) + 7.0 * bound * log_term / (3.0 * (k - 1)))
+
+
+
+def approximate_betweenness(G, samples=None, epsilon=None, seed=0, jobs=1):
+    '''
+    Normalized betweenness estimated from sampled sources.
+    The intervals are empirical Bernstein bounds of the mean contribution of a source
+    (n * dependency / ((n-1)(n-2)), between 0 and n/(n-1)).
+    Returns {node: value}, {node: half-width of the 95% CI}
+    '''
+    nodes, A = csr_metrics.csr_adjacency(G)
+    n = len(nodes)
+    pivots = sample_pivots(n, samples, epsilon, seed)
+    k = len(pivots)
+    total, total_sq = np.zeros(n), np.zeros(n)
+    for partial, partial_sq in _run(_betweenness_sq_task, A, jobs, pivots):
+        total += partial
+        total_sq += partial_sq
+    scale = 1.0 / ((n - 1) * (n - 2)) if n > 2 else 0.0
+    betweenness = scale * n * total / k
+    error = bernstein_error(scale * n * total, (scale * n) ** 2 * total_sq, k, scale * n * (n - 2))
+    return(dict(zip(nodes, betweenness.tolist())), dict(zip(nodes, error.tolist())))
+
+
+
+def approximate_closeness(G, samples=None, epsilon=None, seed=0, jobs=1):
+    '''
+    Closeness estimated from the distances of every node to sampled pivots 
+    (BFS of scipy.sparse.csgraph from the pivots in the opposite direction), only their
+    sums are kept (distances are integers: the sums are exact in any order).
+    Returns {node: value}, {node: half-width of the 95% CI}
+    '''
+    nodes, A = csr_metrics.csr_adjacency(G)
+    if not CLOSENESS_INCOMING:
+        A = A.T.tocsr()
+    n = len(nodes)
+    pivots = sample_pivots(n, samples, epsilon, seed)
+    ## x: pivot reachable from the node (excluding itself, 0/1), y: distance
+    sx, sy, syy = np.zeros(n), np.zeros(n), np.zeros(n)
+    for reached, total, total_sq in _run(_distances_task, A, jobs, pivots):
+        sx += reached
+        sy += total
+        syy += total_sq
+    sxx, sxy = sx, sy
+    k = np.full(n, float(len(pivots)))
+    k[pivots] -= 1                            # a pivot is not compared with itself
+
+    kk = np.maximum(k, 1)
+    mx, my = sx / kk, sy / kk
+    closeness = np.where(my > 0, mx ** 2 / np.where(my > 0, my, 1), 0.0)
+
+    N = n - 1.0
+    fpc = np.maximum(N - k, 0) / max(N - 1.0, 1.0) if N > 1 else np.zeros(n)
+    denom = np.maximum(k - 1, 1)
+    cxx = (sxx - k * mx ** 2) / denom
+    cyy = (syy - k * my ** 2) / denom
+    cxy = (sxy - k * mx * my) / denom
+    gx = np.where(my > 0, 2 * mx / np.where(my > 0, my, 1), 0.0)
+    gy = np.where(my > 0, -mx ** 2 / np.where(my > 0, my, 1) ** 2, 0.0)
+    var = (gx ** 2 * cxx + gy ** 2 * cyy + 2 * gx * gy * cxy) / kk * fpc
+    error = Z_95 * np.sqrt(np.maximum(var, 0.0))
+    return(dict(zip(nodes, closeness.tolist())), dict(zip(nodes, error.tolist())))
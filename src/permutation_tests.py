@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+'''
+
+Selection vs. topology tests of a connected component: are the reactions of genes
+under positive selection (maxBoost >= threshold of the boosting test) more central?
+Same statistics as plot_PS_Boosting_Topology.R, for every measure and boosting test:
+
+    - Rows: gene-reaction pairs (geneReactions.list) with a centrality value and a
+    boosting score (boosting/TEST.txt).
+    - Permutation test (as perm::permTS, two-sided, Monte Carlo): difference of the
+    means of selected and neutral rows, labels permuted. p = (#|T*| >= |T| + 1) / (B + 1).
+    - Bootstrap null distribution of the mean of the selected rows (as the sample()
+    loop): means of B samples with replacement of the same size from all rows.
+    p_bootstrap = (#{null >= observed} + 1) / (B + 1), one-sided (the R script's
+    (B - rank) / B is negative when the observed mean is above every bootstrap mean).
+
+Resamples are drawn as index matrices, a block of rows at a time (at most BATCH_VALUES
+values), and all measures are evaluated together: counts (resample x row) . values
+(row x measure). Every boosting test has its own random stream seeded from --seed and
+its name, so results do not depend on --jobs or on the order of the tests.
+
+Output (output folder):
+    permutation_tests.txt   COMPONENT TEST MEASURE N N_SELECTED MEAN_SELECTED MEAN_NEUTRAL
+                            DIFFERENCE P_PERMUTATION P_BOOTSTRAP PERMUTATIONS
+    null_COMPONENT_TEST.txt bootstrap means, one column per measure (first row: observed)
+
+    python permutation_tests.py [--permutations B] [--seed S] [--jobs N] [--thresholds FILE]
+        [--components 000,001] reaction_graph cComponents boosting output
+
+'''
+import os
+import sys
+import glob
+import zlib
+import getopt
+import multiprocessing
+import numpy as np
+import topology_table
+from boosting_stats import read_thresholds, THRESHOLDS_FILE
+from gene_reactions import read_gene_reactions
+
+
+## Resamples of each test (plot_PS_Boosting_Topology.R: 10000 bootstrap, 2000 permutations)
+PERMUTATIONS = 10000
+SEED = 46268008
+## Maximum size of a block of the resample matrix (resamples x rows)
+BATCH_VALUES = 4000000
+
+
+
+def component_measures(cc, component):
+    '''
+    Numeric measures of a component {name: {REACTION: VALUE}}, from the topology table
+    or from its .list files (categorical measures and CI95 columns are skipped)
+    '''
+    measures = {}
+    if os.path.exists(os.path.join(cc, topology_table.TABLE_FOLDER, 'manifest.json')):
+        manifest = topology_table.read_manifest(cc)
+        for c in manifest['columns']:
+            if c['kind'] in ('integer', 'float') and not c.get('error_of') and \
+               c['name'] in manifest['measures'].get(component, []):
+                measure = topology_table.component_measure(cc, component, c['name'])
+                measures[c['name']] = dict((k, float(v)) for k, v in measure.items() if v != 'NA')
+        return(measures)
+    for filename in sorted(glob.glob(os.path.join(cc, component, 'topology', '*.list'))):
+        measure = {}
+        f = open(filename)
+        lines = [line for line in f if not line.startswith('#')]
+        f.close()
+        try:
+            for line in lines[1:]:
+                fields = line.rstrip('\n').split('\t')
+                measure[fields[0]] = float(fields[1])
+        except (IndexError, ValueError):
+            continue
+        measures[os.path.basename(filename).rsplit('.list', 1)[0]] = measure
+    return(measures)
+
+
+
+def read_boosting(filename):
+    '''
+    {GENE: maxBoost} of a boosting statistics file (boosting_stats.py)
+    '''
+    boost = {}
+    f = open(filename)
+    header = f.readline().rstrip('\n').split('\t')
+    g_col, m_col = header.index('GENE'), header.index('maxBoost')
+    for line in f:
+        fields = line.rstrip('\n').split('\t')
+        try:
+            boost[fields[g_col]] = float(fields[m_col])
+        except (IndexError, ValueError):
+            pass
+    f.close()
+    return(boost)
+
+
+
+def value_matrix(gene_map, measures, names):
+    '''
+    Gene-reaction pairs of the component: genes (one per row) and values (rows x measures,
+    NaN where a measure has no value)
+    '''
+    genes, values = [], []
+    for gene, reactions in gene_map.items():
+        for r in reactions:
+            row = [measures[name].get(r, np.nan) for name in names]
+            if any(v == v for v in row):
+                genes.append(gene)
+                values.append(row)
+    return(genes, np.array(values, dtype=np.float64).reshape(len(values), len(names)))
+
+
+
+def stream(seed, test):
+    '''
+    Random stream of a boosting test
+    '''
+    return(np.random.RandomState([seed, zlib.crc32(test.encode('utf-8')) & 0xffffffff]))
+
+
+
+def _blocks(total, n):
+    step = max(1, BATCH_VALUES // max(1, n))
+    for start in range(0, total, step):
+        yield(min(step, total - start))
+
+
+
+def bootstrap_means(V, n_sel, B, rng):
+    '''
+    Means of B samples with replacement of n_sel rows (B x measures, NaN ignored)
+    '''
+    n = V.shape[0]
+    valid = np.isfinite(V).astype(np.float64)
+    V0 = np.where(np.isfinite(V), V, 0.0)
+    means = []
+    for b in _blocks(B, n):
+        idx = rng.randint(0, n, (b, n_sel))
+        counts = np.bincount((np.arange(b)[:, None] * n + idx).ravel(), minlength=b * n).reshape(b, n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means.append(counts.dot(V0) / counts.dot(valid))
+    return(np.vstack(means))
+
+
+
+def permutation_differences(V, n_sel, B, rng):
+    '''
+    Difference of means (selected - neutral) of B random relabellings with n_sel selected rows
+    '''
+    n = V.shape[0]
+    valid = np.isfinite(V).astype(np.float64)
+    V0 = np.where(np.isfinite(V), V, 0.0)
+    total, total_n = V0.sum(0), valid.sum(0)
+    diffs = []
+    for b in _blocks(B, n):
+        keys = rng.random_sample((b, n))
+        sel = np.argpartition(keys, n_sel - 1, axis=1)[:, :n_sel]
+        mask = np.zeros((b, n))
+        mask[np.arange(b)[:, None], sel] = 1.0
+        s, s_n = mask.dot(V0), mask.dot(valid)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            diffs.append(s / s_n - (total - s) / (total_n - s_n))
+    return(np.vstack(diffs))
+
+
+
+def bootstrap_pvalue(observed, null):
+    '''
+    One-sided p-value of the observed mean against the B bootstrap means:
+    (#{null >= observed} + 1) / (B + 1), in [1/(B+1), 1]
+    '''
+    null = null[np.isfinite(null)]
+    if observed != observed or len(null) == 0:
+        return(np.nan)
+    return((np.sum(null >= observed - 1e-12) + 1.0) / (len(null) + 1.0))
+
+
+
+def selection_test(V, selected, B, rng):
+    '''
+    Tests of every measure (columns of V) for the selected rows: list of dictionaries
+    and the bootstrap means (B + 1 x measures, first row observed)
+    '''
+    n_sel = int(selected.sum())
+    with np.errstate(invalid='ignore'):
+        mean_sel = np.nanmean(V[selected], 0)
+        mean_neu = np.nanmean(V[~selected], 0) if n_sel < len(V) else np.full(V.shape[1], np.nan)
+    observed = mean_sel - mean_neu
+    null = bootstrap_means(V, n_sel, B, rng)
+    if n_sel < len(V):
+        diffs = permutation_differences(V, n_sel, B, rng)
+    else:
+        diffs = np.full((B, V.shape[1]), np.nan)
+    results = []
+    for j in range(V.shape[1]):
+        d = diffs[:, j][np.isfinite(diffs[:, j])]
+        p_perm = (np.sum(np.abs(d) >= np.abs(observed[j]) - 1e-12) + 1.0) / (len(d) + 1.0) \
+                 if len(d) and observed[j] == observed[j] else np.nan
+        results.append({'mean_selected': mean_sel[j], 'mean_neutral': mean_neu[j],
+                        'difference': observed[j], 'p_permutation': p_perm,
+                        'p_bootstrap': bootstrap_pvalue(mean_sel[j], null[:, j])})
+    return(results, np.vstack([mean_sel, null]))
+
+
+
+def run_test(test, boost, threshold, genes, V, B, seed):
+    '''
+    One boosting test on the value matrix of a component, None if no gene is selected
+    '''
+    score = np.array([boost.get(g, np.nan) for g in genes])
+    scored = np.isfinite(score)
+    selected = score[scored] >= threshold
+    if not selected.any():
+        return(None)
+    results, null = selection_test(V[scored], selected, B, stream(seed, test))
+    return(int(scored.sum()), int(selected.sum()), results, null)
+
+
+
+_TASK = None
+
+def _test_task(args):
+    test, boost, threshold = args
+    genes, V, B, seed = _TASK
+    return(test, run_test(test, boost, threshold, genes, V, B, seed))
+
+
+
+def _number(x):
+    if x != x:
+        return('NA')
+    return('%.10g' % x)
+
+
+
+def read_boosting_tests(boosting, thresholds):
+    '''
+    Boosting tests with a threshold: list of (TEST, {GENE: maxBoost}, threshold)
+    boosting: statistics files (boosting/TEST.txt)
+    '''
+    tests = []
+    for filename in boosting:
+        test = os.path.basename(filename).split('.')[0]
+        if test not in thresholds:
+            print('No threshold for ' + test + ', skipped')
+            continue
+        tests.append((test, read_boosting(filename), thresholds[test]))
+    return(tests)
+
+
+
+def component_tests(component, gene_map, cc, tests, output, B=PERMUTATIONS, seed=SEED, jobs=1):
+    '''
+    All boosting tests (read_boosting_tests) x measures of a component. 
+    Returns the rows of permutation_tests.txt.
+    '''
+    global _TASK
+    measures = component_measures(cc, component)
+    names = sorted(measures)
+    genes, V = value_matrix(gene_map, measures, names)
+    print('Component ' + component + ': ' + str(len(genes)) + ' gene-reactions, ' + str(len(names)) +
+          ' measures, ' + str(len(tests)) + ' tests, ' + str(B) + ' permutations')
+
+    _TASK = (genes, V, B, seed)
+    if jobs > 1 and len(tests) > 1:
+        pool = multiprocessing.Pool(processes=jobs)
+        done = pool.map(_test_task, tests)
+        pool.close()
+        pool.join()
+    else:
+        done = [_test_task(t) for t in tests]
+    _TASK = None
+
+    rows = []
+    for test, result in done:
+        if result is None:
+            print('    ' + test + ': no genes under positive selection')
+            continue
+        n, n_sel, results, null = result
+        for name, r in zip(names, results):
+            rows.append([component, test, name, str(n), str(n_sel), _number(r['mean_selected']),
+                         _number(r['mean_neutral']), _number(r['difference']),
+                         _number(r['p_permutation']), _number(r['p_bootstrap']), str(B)])
+        f = open(os.path.join(output, 'null_' + component + '_' + test + '.txt'), 'w')
+        f.write('\t'.join(names) + '\n')
+        for row in null:
+            f.write('\t'.join(_number(x) for x in row) + '\n')
+        f.close()
+    return(rows)
+
+
+
+def write_tests(output, rows):
+    f = open(os.path.join(output, 'permutation_tests.txt'), 'w')
+    f.write('COMPONENT\tTEST\tMEASURE\tN\tN_SELECTED\tMEAN_SELECTED\tMEAN_NEUTRAL\tDIFFERENCE\t'
+            'P_PERMUTATION\tP_BOOTSTRAP\tPERMUTATIONS\n')
+    for row in rows:
+        f.write('\t'.join(row) + '\n')
+    f.close()
+    print('Written ' + os.path.join(output, 'permutation_tests.txt'))
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: [--permutations B] [--seed S] [--jobs N] [--thresholds FILE] [--components 000,...]
+    ##                reaction_graph cComponents boosting output
+    opts, args = getopt.getopt(sys.argv[1:], 'j:', ['permutations=', 'seed=', 'jobs=', 'thresholds=', 'components='])
+    B, seed, jobs = PERMUTATIONS, SEED, 1
+    thresholds_file = THRESHOLDS_FILE
+    components = ['000']    # giant component (as plot_PS_Boosting_Topology.R)
+    for opt, arg in opts:
+        if opt == '--permutations':
+            B = int(arg)
+        elif opt == '--seed':
+            seed = int(arg)
+        elif opt in ('-j', '--jobs'):
+            jobs = int(arg)
+        elif opt == '--thresholds':
+            thresholds_file = arg
+        elif opt == '--components':
+            components = [c for c in arg.split(',') if c]
+    reaction_graph, cc, boosting_dir, output = args[:4]
+    if not os.path.exists(output):
+        os.makedirs(output)
+
+    gene_map = read_gene_reactions(reaction_graph + '/geneReactions.list')
+    tests = read_boosting_tests(sorted(glob.glob(boosting_dir + '/*.txt')), read_thresholds(thresholds_file))
+    rows = []
+    for component in components:
+        rows += component_tests(component, gene_map, cc, tests, output, B, seed, jobs)
+    write_tests(output, rows)
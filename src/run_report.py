@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+'''
+
+Run report of the pipeline stages (model2DRG, topology): one JSON line per event,
+appended to the report file given with --report.
+
+    {"event": "run", "script", "argv", "python", "networkx", "numpy", "date"}
+    {"event": "stage", "name", "wall_s", "cpu_s", "peak_rss_mb", "pid", ...counts}
+    {"event": "measure", "name", "component", "nodes", "edges", "wall_s", "cpu_s",
+     "peak_rss_mb", "pid"}
+    {"event": "cache", "stage", "cached", "calculated"}
+    {"event": "end", "wall_s", "cpu_s", "peak_rss_mb"}
+
+    - Stages: loading the model, edges, genes, components, measures, table...
+    with the number of nodes/edges/... they produced.
+    - Cache: artifacts of a stage restored from the stage cache and calculated.
+    - Measures: every DG_* call of every component, also from the worker processes
+    (--jobs): lines are appended with a single write.
+    - peak_rss_mb: peak resident set size of the process so far (ru_maxrss).
+
+With --profile NAME the stage (or measure, all components) with that name runs under
+cProfile: statistics are saved in REPORT.NAME.prof (read with pstats) and the functions
+with the highest cumulative time are printed at the end of the run. Measures of
+components calculated by worker processes (--jobs) are not profiled.
+
+Without --report nothing is recorded.
+
+'''
+import os
+import sys
+import json
+import time
+import resource
+import platform
+
+
+## Report file and profiled stage/measure (set by start())
+REPORT_FILE = None
+PROFILE = None
+## Number of functions printed from the profile
+PROFILE_LINES = 25
+
+_PROFILER = None
+_START = None
+
+
+
+def peak_rss_mb():
+    '''
+    Peak resident set size of this process in MB (ru_maxrss: KB on Linux, bytes on macOS)
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024.0
+    return(peak / 1024.0)
+
+
+
+def cpu_seconds():
+    t = os.times()
+    return(t[0] + t[1])
+
+
+
+def record(event, **fields):
+    '''
+    Append an event to the report (nothing without a report file)
+    '''
+    if REPORT_FILE is None:
+        return
+    fields['event'] = event
+    fields.setdefault('pid', os.getpid())
+    f = open(REPORT_FILE, 'a')
+    f.write(json.dumps(fields, sort_keys=True) + '\n')
+    f.close()
+
+
+
+def start(filename, script, profile=None):
+    '''
+    Start the report of a run (the file is appended, one run after the other)
+    '''
+    global REPORT_FILE, PROFILE, _START
+    REPORT_FILE = filename
+    PROFILE = profile
+    _START = (time.time(), cpu_seconds())
+    if filename is None:
+        return
+    import numpy
+    import networkx
+    record('run', script=script, argv=sys.argv[1:], python=platform.python_version(),
+           networkx=networkx.__version__, numpy=numpy.__version__,
+           date=time.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+
+class stage(object):
+    '''
+    Time a block and record it when it ends:
+        with run_report.stage('edges') as counts:
+            ...
+            counts['edges'] = len(edges)
+    event: 'stage' or 'measure', fields: extra fields of the event (component...)
+    '''
+    def __init__(self, name, event='stage', **fields):
+        self.name = name
+        self.event = event
+        self.counts = fields
+
+    def __enter__(self):
+        global _PROFILER
+        if PROFILE == self.name and REPORT_FILE is not None:
+            if _PROFILER is None:
+                import cProfile
+                _PROFILER = cProfile.Profile()
+            _PROFILER.enable()
+        self.start = (time.time(), cpu_seconds())
+        return(self.counts)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.time() - self.start[0]
+        cpu = cpu_seconds() - self.start[1]
+        if PROFILE == self.name and _PROFILER is not None:
+            _PROFILER.disable()
+        if exc_type is None:
+            record(self.event, name=self.name, wall_s=round(wall, 6), cpu_s=round(cpu, 3),
+                   peak_rss_mb=round(peak_rss_mb(), 1), **self.counts)
+        return(False)
+
+
+
+def finish():
+    '''
+    End of the run: total time, and the profile of the --profile stage
+    '''
+    global _PROFILER
+    if REPORT_FILE is None:
+        return
+    record('end', wall_s=round(time.time() - _START[0], 3), cpu_s=round(cpu_seconds() - _START[1], 3),
+           peak_rss_mb=round(peak_rss_mb(), 1))
+    if _PROFILER is not None:
+        import pstats
+        filename = REPORT_FILE + '.' + PROFILE + '.prof'
+        _PROFILER.dump_stats(filename)
+        print('\nProfile of ' + PROFILE + ': ' + filename)
+        pstats.Stats(filename).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        _PROFILER = None
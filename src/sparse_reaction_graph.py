@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+'''
+
+Create the directed reaction graph with sparse linear algebra (SciPy CSR)
+instead of per-reaction loops. Alternative backend of create_reaction_graph.py,
+the rules are the same:
+
+    - If the products of a node are the reactants of any other node,
+    create a directed link between them.
+    - If reaction is reversible, only metabolites with -1/+1 coefficients are taken
+    into account to identify the physiological direction.
+    - Currency metabolites are masked out of the stoichiometric matrix.
+
+    With P (products) and R (reactants) the metabolite x reaction incidence matrices:
+        A = P.T * R   --> A[i,j] > 0 if any product of reaction i is a reactant of reaction j
+
+    Rows and columns of the adjacency follow the order of the reactions in the model (node.list).
+    The subsystem graph (subsystem_graph) is collapsed from the same adjacency.
+
+'''
+import numpy as np
+import scipy.sparse as sp
+import subsystem_graph
+
+
+
+def stoichiometric_matrix(mod):
+    '''
+    Export the stoichiometric matrix of the model: metabolites x reactions (CSR).
+    Returns the matrix, metabolite ids, reaction ids and reversibility of the reactions.
+    '''
+    if hasattr(mod, 'S'):   # model_loader.CompactModel: already in matrix form
+        return(mod.S.tocsr(), mod.metabolite_ids, mod.reaction_ids, mod.reversible)
+    met_ids = [str(m) for m in mod.metabolites]
+    met_pos = dict((m, i) for i, m in enumerate(met_ids))
+    rxn_ids, reversible = [], []
+    rows, cols, data = [], [], []
+    for j, r in enumerate(mod.reactions):
+        rxn_ids.append(r.id)
+        reversible.append(bool(r.reversibility))
+        for m, c in r.metabolites.items():
+            rows.append(met_pos[str(m)])
+            cols.append(j)
+            data.append(c)
+    S = sp.csr_matrix((np.asarray(data, dtype=np.float64), (rows, cols)),
+                      shape=(len(met_ids), len(rxn_ids)))
+    return(S, met_ids, rxn_ids, np.asarray(reversible, dtype=bool))
+
+
+
+def incidence_matrices(S, reversible):
+    '''
+    Split the stoichiometric matrix into products and reactants incidence matrices (0/1).
+    In reversible reactions only coefficients -1/+1 are taken into account
+    (same rule as create_reaction_graph.split_metabolites).
+    '''
+    coo = S.tocoo()
+    rev = reversible[coo.col]
+    is_prod = np.where(rev, coo.data == 1.0, coo.data > 0)
+    is_react = np.where(rev, coo.data == -1.0, coo.data < 0)
+    P = sp.csr_matrix((np.ones(is_prod.sum(), dtype=np.int32), (coo.row[is_prod], coo.col[is_prod])), shape=S.shape)
+    R = sp.csr_matrix((np.ones(is_react.sum(), dtype=np.int32), (coo.row[is_react], coo.col[is_react])), shape=S.shape)
+    return(P, R)
+
+
+
+def currency_mask(met_ids, currency):
+    '''
+    Boolean vector of metabolites to keep (True) or mask (False, currency metabolites)
+    '''
+    return(np.array([m not in currency for m in met_ids], dtype=bool))
+
+
+
+def adjacency_matrix(P, R, keep=None):
+    '''
+    Reaction x reaction adjacency from a single sparse product: A = P.T * diag(keep) * R,
+    with diag(keep) applied as a selection of the metabolite rows of P and R.
+    Self-loops are allowed, multiple shared metabolites count as one link.
+    '''
+    if keep is not None:
+        rows = np.flatnonzero(keep)
+        P, R = P[rows], R[rows]
+    A = P.T.tocsr().dot(R).tocsr()
+    A.eliminate_zeros()
+    A.data[:] = 1
+    A = A.astype(bool)
+    A.sort_indices()
+    return(A)
+
+
+
+def write_edges(filename, A, rxn_ids):
+    '''
+    Write the edges of the adjacency in the edge.list format: NODE1 NODE2
+    Returns the list of edges.
+    '''
+    all_links_model = []
+    for i in range(A.shape[0]):
+        for j in A.indices[A.indptr[i]:A.indptr[i+1]]:
+            all_links_model.append(rxn_ids[i]+'\t'+rxn_ids[j])
+    f = open(filename, 'w')
+    for item in all_links_model:
+        f.write("%s\n" % item)
+    f.close()
+    return(all_links_model)
+
+
+
+def save_adjacency(filename, A):
+    sp.save_npz(filename, A, compressed=False)
+
+
+
+def load_adjacency(filename):
+    '''
+    Load an adjacency artifact (rows/columns in node.list order)
+    '''
+    return(sp.load_npz(filename).tocsr())
+
+
+
+def make_edge_files(out, mod, currency, subsystems=None):
+    '''
+    Write both edge files (with and without currency metabolites) and their
+    adjacency matrices (adjacency_withCurrency.npz, adjacency.npz).
+    With the subsystems of the reactions, also the subsystem graph of the adjacency
+    without currency metabolites (subsystem_graph).
+    '''
+    print('\nCalculating links (sparse)...')
+    S, met_ids, rxn_ids, reversible = stoichiometric_matrix(mod)
+    P, R = incidence_matrices(S, reversible)
+
+    A_currency = adjacency_matrix(P, R)
+    save_adjacency(out + '/adjacency_withCurrency.npz', A_currency)
+    edges_currency = write_edges(out + '/edge_withCurrency.list', A_currency, rxn_ids)
+
+    A = adjacency_matrix(P, R, keep=currency_mask(met_ids, currency))
+    save_adjacency(out + '/adjacency.npz', A)
+    edges = write_edges(out + '/edge.list', A, rxn_ids)
+    if subsystems is not None:
+        subsystem_graph.write_subsystem_graph(out, A, subsystems)
+    return(edges_currency, edges)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+'''
+
+Spectral centralities of a DIRECTED graph on its sparse adjacency A (SciPy):
+
+    - Eigenvector centrality: Perron vector of A.T ("left", in-edges) or A ("right",
+    out-edges) with ARPACK (scipy.sparse.linalg.eigs), dense LAPACK up to DENSE_SIZE nodes.
+    Same normalization as nx.eigenvector_centrality_numpy (unit norm, positive sum).
+    Optional positive starting vector (v0), otherwise a constant positive start
+    (not ARPACK's random one: same vector in any process), explicit tolerance and iterations cap.
+    - Katz centrality: x = alpha * M x + beta, by iteration, with
+    alpha = min(0.1, 0.9 / bound of the spectral radius) so that it always converges.
+    - PageRank: power iteration with damping 0.85, dangling nodes spread uniformly
+    (as nx.pagerank).
+
+M is A.T for in-edge measures (left) and A for out-edge measures (right).
+
+On components that are not strongly connected the Perron vector can be degenerate:
+zero spectral radius (acyclic graph), complex dominant eigenvalue, eigenvector with mixed
+signs, ARPACK does not converge, or the dominant eigenvalue is repeated. The last one is
+checked on the graph: the Perron vector is unique only if a single strongly connected
+component (scipy.sparse.csgraph) has the dominant eigenvalue as its spectral radius,
+otherwise ARPACK returns a mix of their vectors that depends on the starting vector.
+eigenvector() then falls back to Katz centrality (PageRank if Katz does not converge)
+and returns the method used.
+
+'''
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+from scipy.sparse.linalg import eigs, ArpackNoConvergence
+
+
+## Convergence control (set from the command line of calculate_topology_RG.py)
+TOL = 1e-10
+MAXITER = 1000
+
+## Graphs up to this number of nodes are solved with dense LAPACK (ARPACK is not reliable
+## on a few nodes)
+DENSE_SIZE = 200
+
+## Relative difference below which the spectral radius of a component equals the dominant eigenvalue
+RADIUS_TOL = 1e-6
+
+## Default Katz attenuation (as nx.katz_centrality) and PageRank damping
+KATZ_ALPHA = 0.1
+PAGERANK_ALPHA = 0.85
+
+
+
+def operator(A, left=True):
+    '''
+    Matrix of the measure: A.T (in-edges, left) or A (out-edges, right) as float CSR
+    '''
+    M = A.T if left else A
+    return(sp.csr_matrix(M, dtype=np.float64))
+
+
+
+def perron(M, v0=None, tol=None, maxiter=None):
+    '''
+    Dominant eigenvalue (largest real part) and eigenvector of M.
+    Raises ArpackNoConvergence if ARPACK does not converge in maxiter iterations.
+    '''
+    tol = TOL if tol is None else tol
+    maxiter = MAXITER if maxiter is None else maxiter
+    n = M.shape[0]
+    if n <= max(DENSE_SIZE, 2):       # eigs needs k < n - 1
+        values, vectors = np.linalg.eig(M.toarray())
+        i = np.argmax(values.real)
+        return(values[i], vectors[:, i])
+    if v0 is None:
+        v0 = np.ones(n)
+    v0 = np.asarray(v0, dtype=np.float64)
+    values, vectors = eigs(M, k=1, which='LR', v0=v0, tol=tol, maxiter=maxiter)
+    return(values[0], vectors[:, 0])
+
+
+
+def degenerate(value, vector, tol=1e-8):
+    '''
+    Reason why the dominant eigenvector is not a Perron vector, None if it is
+    '''
+    scale = max(1.0, abs(value))
+    if abs(value) <= tol or value.real <= tol:
+        return('zero spectral radius')
+    if abs(value.imag) > tol * scale:
+        return('complex dominant eigenvalue')
+    x = vector.real * np.sign(vector.real.sum() or 1.0)
+    if np.abs(vector.imag).max() > tol * np.abs(x).max() or x.min() < -tol * np.abs(x).max():
+        return('eigenvector with mixed signs')
+    return(None)
+
+
+
+def dominant_blocks(M, value, tol=RADIUS_TOL):
+    '''
+    Number of strongly connected components of M with spectral radius equal to the
+    dominant eigenvalue (relative tolerance tol): 1 if the Perron vector is unique
+    '''
+    count, labels = csgraph.connected_components(M, directed=True, connection='strong')
+    sizes = np.bincount(labels, minlength=count)
+    diagonal = M.diagonal()
+    bound = value.real * (1.0 - tol)
+    ## single nodes: the weight of their self-loop
+    blocks = int((diagonal[sizes[labels] == 1] >= bound).sum())
+    order = np.argsort(labels, kind='mergesort')
+    ends = np.cumsum(sizes)
+    for c in np.flatnonzero(sizes > 1):
+        members = order[ends[c] - sizes[c]:ends[c]]
+        if perron(M[members][:, members])[0].real >= bound:
+            blocks += 1
+    return(blocks)
+
+
+
+def normalize(x):
+    '''
+    Unit Euclidean norm with positive sum (as nx.eigenvector_centrality_numpy)
+    '''
+    norm = np.sign(x.sum()) * np.linalg.norm(x)
+    if norm == 0:
+        return(x)
+    return(x / norm)
+
+
+
+def katz(M, alpha=None, beta=1.0, tol=None, maxiter=None):
+    '''
+    Katz centrality x = alpha * M x + beta (normalized), None if it does not converge.
+    Default alpha: KATZ_ALPHA, reduced below 1/spectral radius (bound: max row/column sum).
+    Returns the values and alpha.
+    '''
+    tol = TOL if tol is None else tol
+    maxiter = MAXITER if maxiter is None else maxiter
+    n = M.shape[0]
+    if alpha is None:
+        bound = min(np.abs(M).sum(0).max(), np.abs(M).sum(1).max()) if n else 0.0
+        alpha = min(KATZ_ALPHA, 0.9 / bound) if bound > 0 else KATZ_ALPHA
+    x = np.zeros(n)
+    for i in range(maxiter):
+        x_new = alpha * M.dot(x) + beta
+        if np.abs(x_new - x).sum() < n * tol:
+            return(normalize(x_new), alpha)
+        x = x_new
+    return(None, alpha)
+
+
+
+def pagerank(M, alpha=PAGERANK_ALPHA, tol=None, maxiter=None):
+    '''
+    PageRank (sum = 1) of the graph where M[j,i] is the link i --> j, None if it does
+    not converge
+    '''
+    tol = TOL if tol is None else tol
+    maxiter = MAXITER if maxiter is None else maxiter
+    n = M.shape[0]
+    if n == 0:
+        return(np.zeros(0))
+    outdeg = np.asarray(M.sum(0)).ravel()
+    dangling = outdeg == 0
+    T = M.dot(sp.diags(np.where(dangling, 0.0, 1.0 / np.where(dangling, 1.0, outdeg)), 0)).tocsr()
+    x = np.ones(n) / n
+    for i in range(maxiter):
+        x_new = alpha * (T.dot(x) + x[dangling].sum() / n) + (1.0 - alpha) / n
+        if np.abs(x_new - x).sum() < n * tol:
+            return(x_new)
+        x = x_new
+    return(None)
+
+
+
+def eigenvector(A, left=True, v0=None, tol=None, maxiter=None):
+    '''
+    Eigenvector centrality (left: in-edges, right: out-edges) with fallback to Katz and
+    PageRank. Returns the values (node order), the method and a note about the fallback
+    (None for the eigenvector).
+    '''
+    M = operator(A, left)
+    try:
+        value, vector = perron(M, v0, tol, maxiter)
+        reason = degenerate(value, vector)
+        if reason is None:
+            blocks = dominant_blocks(M, value)
+            if blocks > 1:
+                reason = 'repeated dominant eigenvalue (%d strongly connected components)' % blocks
+    except ArpackNoConvergence:
+        reason = 'ARPACK did not converge'
+    if reason is None:
+        return(normalize(vector.real), 'eigenvector', None)
+    x, alpha = katz(M, tol=tol, maxiter=maxiter)
+    if x is not None:
+        return(x, 'katz', '%s, Katz centrality (alpha %g)' % (reason, alpha))
+    return(pagerank(M, tol=tol, maxiter=maxiter), 'pagerank',
+           '%s, Katz did not converge, PageRank' % reason)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+'''
+
+Content-hash cache of the artifacts of the pipeline stages (model2DRG, topology).
+
+An artifact is stored under a key that hashes everything it depends on:
+    - input contents (model file, edge/node lists), not timestamps
+    - currency metabolites
+    - code version: contents of the source files that calculate it
+    - parameters (backend, approximation, convergence...)
+
+    cache_dir/STAGE/ARTIFACT-KEY/     files of the artifact or value.pkl, and COMPLETE
+
+Artifacts are written in a temporary folder and renamed when complete, so an interrupted
+run never leaves a partial artifact behind. Artifacts are reused independently: changing
+the code or parameters of one measure only invalidates that measure.
+
+'''
+import os
+import json
+import shutil
+import pickle
+import hashlib
+
+
+CACHE_VERSION = 1
+COMPLETE = 'COMPLETE'
+
+
+
+def hash_values(*values):
+    '''
+    SHA-1 of JSON-serializable values (sets and tuples as sorted lists / lists)
+    '''
+    def plain(v):
+        if isinstance(v, (set, frozenset)):
+            return(sorted(plain(x) for x in v))
+        if isinstance(v, (list, tuple)):
+            return([plain(x) for x in v])
+        if isinstance(v, dict):
+            return(dict((str(k), plain(x)) for k, x in v.items()))
+        return(v)
+    text = json.dumps([CACHE_VERSION] + [plain(v) for v in values], sort_keys=True)
+    return(hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+
+
+def hash_files(filenames):
+    '''
+    SHA-1 of the contents of several files (in the given order)
+    '''
+    h = hashlib.sha1()
+    for filename in filenames:
+        f = open(filename, 'rb')
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+        f.close()
+        h.update(b'\0')
+    return(h.hexdigest())
+
+
+
+def source_file(module):
+    '''
+    Source (.py) of a module or file name
+    '''
+    filename = module if isinstance(module, str) else module.__file__
+    if filename.endswith(('.pyc', '.pyo')):
+        filename = filename[:-1]
+    return(filename)
+
+
+
+def code_version(*modules):
+    '''
+    Hash of the source files of the modules that calculate an artifact
+    '''
+    return(hash_files([source_file(m) for m in modules]))
+
+
+
+def artifact_folder(cache_dir, stage, artifact, key):
+    return(os.path.join(cache_dir, stage, '%s-%s' % (artifact, key)))
+
+
+
+def lookup(cache_dir, stage, artifact, key):
+    '''
+    Folder of a complete artifact, None if it is not cached
+    '''
+    if not cache_dir:
+        return(None)
+    folder = artifact_folder(cache_dir, stage, artifact, key)
+    if os.path.exists(os.path.join(folder, COMPLETE)):
+        return(folder)
+    return(None)
+
+
+
+def _commit(tmp, folder):
+    open(os.path.join(tmp, COMPLETE), 'w').close()
+    if os.path.exists(folder):      # stored by another process meanwhile
+        shutil.rmtree(tmp)
+        return(folder)
+    os.rename(tmp, folder)
+    return(folder)
+
+
+
+def _tmp_folder(cache_dir, stage, artifact, key):
+    folder = artifact_folder(cache_dir, stage, artifact, key)
+    tmp = folder + '.tmp%d' % os.getpid()
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    return(folder, tmp)
+
+
+
+def store_files(cache_dir, stage, artifact, key, filenames):
+    '''
+    Copy the files of an artifact into the cache
+    '''
+    folder, tmp = _tmp_folder(cache_dir, stage, artifact, key)
+    for filename in filenames:
+        shutil.copy2(filename, tmp)
+    return(_commit(tmp, folder))
+
+
+
+def restore_files(folder, out):
+    '''
+    Copy the files of a cached artifact into out. Returns the file names.
+    '''
+    names = sorted(n for n in os.listdir(folder) if n != COMPLETE)
+    for name in names:
+        shutil.copy2(os.path.join(folder, name), out)
+    return(names)
+
+
+
+def store_object(cache_dir, stage, artifact, key, value):
+    '''
+    Pickle a value (measures, components) into the cache
+    '''
+    folder, tmp = _tmp_folder(cache_dir, stage, artifact, key)
+    f = open(os.path.join(tmp, 'value.pkl'), 'wb')
+    pickle.dump(value, f, 2)
+    f.close()
+    return(_commit(tmp, folder))
+
+
+
+def load_object(folder):
+    f = open(os.path.join(folder, 'value.pkl'), 'rb')
+    value = pickle.load(f)
+    f.close()
+    return(value)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+'''
+
+Subsystem (pathway) level view of the reaction graph, computed from the adjacency of
+the reactions while the edges are built (create_reaction_graph.py, both backends):
+
+    - Quotient graph: every reaction is collapsed into its subsystem, a link between
+    two subsystems is weighted by the number of reaction links between them
+    (Q = M.T * A * M, with M the reaction x subsystem membership matrix).
+    Links inside a subsystem are its self-loop.
+    - Aggregates of the reaction metrics of every subsystem: reactions, links inside,
+    links from/to other subsystems, self-loops, neighbour subsystems, bridge reactions
+    (linked both from and to other subsystems) and mean/max in- and out-degree.
+    - Subsystem of every reaction (reactionSubsystems.list).
+
+The shortest-path and spectral measures (closeness, betweenness, eigenvectors...) are only
+calculated later by calculate_topology_RG.py, so they can not be aggregated while the edges
+are built: after the topology, topology_summary() collapses the topology table
+(topology_table.py) into the mean and maximum of every numeric measure by subsystem
+(values as in the table: normalized within the component of the reaction).
+
+Subsystem names as make_pwy_file: Recon3D '[array' format reduced to the name,
+reactions without subsystem are 'NA'.
+
+Output (graph without currency metabolites):
+    subsystem_edge.list: SUBSYSTEM1  SUBSYSTEM2  LINKS (tab separated, as edge.list)
+    subsystem_stats.txt: SUBSYSTEM  REACTIONS  LINKS_INTERNAL  LINKS_IN  LINKS_OUT  SELF_LOOPS
+        SUBSYSTEMS_IN  SUBSYSTEMS_OUT  BRIDGE_REACTIONS  MEAN_IN_DEGREE  MAX_IN_DEGREE
+        MEAN_OUT_DEGREE  MAX_OUT_DEGREE
+    reactionSubsystems.list: REACTION  SUBSYSTEM
+Output of the topology summary (cComponents):
+    subsystem_topology.txt: SUBSYSTEM  REACTIONS  COMPONENTS  and MEAN_<HEADER>  MAX_<HEADER>
+        of every numeric measure (INDEGREE, CLOSENESS, BETWEENESS...)
+
+    python subsystem_graph.py reaction_graph cComponents    (topology summary only)
+
+'''
+import os
+import sys
+import numpy as np
+import scipy.sparse as sp
+import topology_table
+
+
+REACTION_SUBSYSTEMS = 'reactionSubsystems.list'
+SUBSYSTEM_FILES = ['subsystem_edge.list', 'subsystem_stats.txt', REACTION_SUBSYSTEMS]
+SUMMARY_FILE = 'subsystem_topology.txt'
+
+
+
+def subsystem_name(subsystem):
+    '''
+    Name of the subsystem of a reaction (Recon3D has a different format than Recon2)
+    '''
+    if subsystem.startswith('[array'):
+        return(subsystem.split("\'")[1])
+    return(subsystem)
+
+
+
+def reaction_subsystems(mod):
+    '''
+    Subsystem of every reaction, in model order
+    '''
+    return([subsystem_name(r.subsystem) for r in mod.reactions])
+
+
+
+def adjacency_from_targets(targets):
+    '''
+    CSR adjacency from the target positions of every reaction (in model order)
+    '''
+    n = len(targets)
+    counts = np.array([len(t) for t in targets], dtype=np.int64)
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    indices = np.fromiter((j for t in targets for j in t), dtype=np.int64, count=int(counts.sum()))
+    return(sp.csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr), shape=(n, n)))
+
+
+
+def membership(subsystems):
+    '''
+    Subsystem names (sorted), position of the subsystem of every reaction and the
+    reaction x subsystem membership matrix
+    '''
+    labels = [s if s else 'NA' for s in subsystems]
+    names = sorted(set(labels))
+    pos = dict((s, i) for i, s in enumerate(names))
+    codes = np.array([pos[s] for s in labels], dtype=np.int64)
+    M = sp.csr_matrix((np.ones(len(codes)), (np.arange(len(codes)), codes)), shape=(len(codes), len(names)))
+    return(names, codes, M)
+
+
+
+def quotient(A, M):
+    '''
+    Subsystem x subsystem links: number of reaction links between them
+    '''
+    A = sp.csr_matrix(A, dtype=np.float64)
+    Q = M.T.dot(A).dot(M).tocsr()
+    Q.eliminate_zeros()
+    Q.sort_indices()
+    return(Q)
+
+
+
+def aggregates(A, codes, k):
+    '''
+    Aggregates of the reactions of every subsystem (columns of subsystem_stats.txt)
+    '''
+    A = sp.csr_matrix(A)
+    n = A.shape[0]
+    coo = A.tocoo()
+    source, target = codes[coo.row], codes[coo.col]
+    internal = source == target
+    out_degree = np.diff(A.indptr)
+    in_degree = np.bincount(coo.col, minlength=n)
+    from_other = np.bincount(coo.col[~internal], minlength=n) > 0
+    to_other = np.bincount(coo.row[~internal], minlength=n) > 0
+    reactions = np.bincount(codes, minlength=k)
+
+    ## neighbour subsystems: distinct pairs of different subsystems
+    pairs = np.unique(source[~internal] * k + target[~internal])
+    max_in, max_out = np.zeros(k, dtype=np.int64), np.zeros(k, dtype=np.int64)
+    np.maximum.at(max_in, codes, in_degree)
+    np.maximum.at(max_out, codes, out_degree)
+    return({'REACTIONS': reactions,
+            'LINKS_INTERNAL': np.bincount(source[internal], minlength=k),
+            'LINKS_IN': np.bincount(target[~internal], minlength=k),
+            'LINKS_OUT': np.bincount(source[~internal], minlength=k),
+            'SELF_LOOPS': np.bincount(codes[coo.row[coo.row == coo.col]], minlength=k),
+            'SUBSYSTEMS_IN': np.bincount(pairs % k, minlength=k),
+            'SUBSYSTEMS_OUT': np.bincount(pairs // k, minlength=k),
+            'BRIDGE_REACTIONS': np.bincount(codes[from_other & to_other], minlength=k),
+            'MEAN_IN_DEGREE': np.bincount(codes, weights=in_degree, minlength=k) / np.maximum(reactions, 1),
+            'MAX_IN_DEGREE': max_in,
+            'MEAN_OUT_DEGREE': np.bincount(codes, weights=out_degree, minlength=k) / np.maximum(reactions, 1),
+            'MAX_OUT_DEGREE': max_out})
+
+
+
+STATS_COLUMNS = ['REACTIONS', 'LINKS_INTERNAL', 'LINKS_IN', 'LINKS_OUT', 'SELF_LOOPS', 'SUBSYSTEMS_IN',
+                 'SUBSYSTEMS_OUT', 'BRIDGE_REACTIONS', 'MEAN_IN_DEGREE', 'MAX_IN_DEGREE',
+                 'MEAN_OUT_DEGREE', 'MAX_OUT_DEGREE']
+
+def _number(x):
+    if float(x) == int(x):
+        return(str(int(x)))
+    return('%.10g' % x)
+
+
+
+def write_subsystem_graph(out, A, subsystems):
+    '''
+    Write the quotient graph and the aggregates of the subsystems of the reaction
+    graph with adjacency A (reactions in model order). Returns the subsystem links.
+    '''
+    names, codes, M = membership(subsystems)
+    Q = quotient(A, M)
+    links = []
+    f = open(out + '/subsystem_edge.list', 'w')
+    for i in range(Q.shape[0]):
+        for j, w in zip(Q.indices[Q.indptr[i]:Q.indptr[i+1]], Q.data[Q.indptr[i]:Q.indptr[i+1]]):
+            links.append((names[i], names[j], int(w)))
+            f.write('%s\t%s\t%d\n' % links[-1])
+    f.close()
+
+    stats = aggregates(A, codes, len(names))
+    f = open(out + '/subsystem_stats.txt', 'w')
+    f.write('SUBSYSTEM\t' + '\t'.join(STATS_COLUMNS) + '\n')
+    for i, name in enumerate(names):
+        f.write(name + '\t' + '\t'.join(_number(stats[c][i]) for c in STATS_COLUMNS) + '\n')
+    f.close()
+    return(links)
+
+
+
+def write_reaction_subsystems(out, reaction_ids, subsystems):
+    '''
+    reactionSubsystems.list: REACTION  SUBSYSTEM of every reaction (model order)
+    '''
+    f = open(out + '/' + REACTION_SUBSYSTEMS, 'w')
+    f.write('REACTION\tSUBSYSTEM\n')
+    for r, s in zip(reaction_ids, subsystems):
+        f.write(r + '\t' + (s if s else 'NA') + '\n')
+    f.close()
+
+
+
+def read_reaction_subsystems(ifiles):
+    '''
+    {REACTION: SUBSYSTEM} of a reaction_graph folder, None if it has no reactionSubsystems.list
+    '''
+    filename = os.path.join(ifiles, REACTION_SUBSYSTEMS)
+    if not os.path.exists(filename):
+        return(None)
+    f = open(filename)
+    f.readline()
+    subsystem_of = dict(line.rstrip('\r\n').split('\t', 1) for line in f if line.strip())
+    f.close()
+    return(subsystem_of)
+
+
+
+def topology_summary(columns, manifest, subsystem_of):
+    '''
+    Reactions, components and mean/max of every numeric measure of the topology table
+    over the reactions of every subsystem (NaN values left out).
+    Returns the subsystem names, the column names and {column: array}.
+    '''
+    reactions = [str(r) for r in columns['reaction'].tolist()]
+    names, codes, M = membership([subsystem_of.get(r, 'NA') for r in reactions])
+    k = len(names)
+    component = np.asarray(columns['component'], dtype=np.int64)
+    base = int(component.max()) + 1 if len(component) else 1
+    pairs = np.unique(codes * base + component)         # distinct (subsystem, component)
+    stats = {'REACTIONS': np.bincount(codes, minlength=k),
+             'COMPONENTS': np.bincount(pairs // base, minlength=k)}
+    order = ['REACTIONS', 'COMPONENTS']
+    for c in manifest['columns']:
+        if c['kind'] not in ('integer', 'float') or 'header' not in c or c.get('error_of'):
+            continue
+        values = np.asarray(columns[c['name']], dtype=np.float64)
+        valid = np.isfinite(values)
+        count = np.bincount(codes[valid], minlength=k)
+        mean = np.bincount(codes[valid], weights=values[valid], minlength=k) / np.maximum(count, 1)
+        top = np.full(k, -np.inf)
+        np.maximum.at(top, codes[valid], values[valid])
+        stats['MEAN_' + c['header']] = np.where(count > 0, mean, np.nan)
+        stats['MAX_' + c['header']] = np.where(count > 0, top, np.nan)
+        order += ['MEAN_' + c['header'], 'MAX_' + c['header']]
+    return(names, order, stats)
+
+
+
+def write_topology_summary(ifiles, output):
+    '''
+    subsystem_topology.txt of the topology table in output (cComponents) with the
+    subsystems of the reaction graph in ifiles. Returns the file name, None if the
+    reaction graph has no reactionSubsystems.list (built before it was written).
+    '''
+    subsystem_of = read_reaction_subsystems(ifiles)
+    if subsystem_of is None:
+        print('\nNo ' + REACTION_SUBSYSTEMS + ' in ' + ifiles + ': subsystem summary not written')
+        return(None)
+    columns, manifest = topology_table.load_table(output)
+    names, order, stats = topology_summary(columns, manifest, subsystem_of)
+    filename = os.path.join(output, SUMMARY_FILE)
+    f = open(filename, 'w')
+    f.write('SUBSYSTEM\t' + '\t'.join(order) + '\n')
+    for i, name in enumerate(names):
+        f.write(name + '\t' + '\t'.join('NA' if stats[c][i] != stats[c][i] else _number(stats[c][i])
+                                          for c in order) + '\n')
+    f.close()
+    print('\nSubsystem summary of the topology: ' + filename)
+    return(filename)
+
+
+
+if __name__ == '__main__':
+
+    ## Get arguments: reaction_graph cComponents
+    write_topology_summary(sys.argv[1], sys.argv[2])
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+'''
+
+Columnar table of the topological measures of all connected components of a run,
+instead of one small .list file per measure and component:
+
+    cComponents/topology_table/
+        manifest.json       rows, columns (name, kind, header, levels), measures calculated,
+                            measures with CI95 and notes (# comment lines) by component
+        component.npy       int32, component number (folder name 000, 001, ...)
+        reaction.npy        unicode, reaction ID
+        <measure>.npy       float64 (NaN: not calculated / NA), or int16 codes for
+                            categorical measures (-1: not calculated, levels in the manifest)
+        <measure>_ci95.npy  float64, half-width of the 95% CI of approximate measures
+
+Rows: every node of every component (component order, reactions sorted).
+Measure names are the legacy file names without .list (indegree, betweenness, ...).
+Columns are .npy files that are read memory-mapped (np.load(mmap_mode='r')):
+reading a measure does not parse or copy the rest of the table.
+
+The legacy .list files can be exported back from the table:
+    python topology_table.py cComponents
+
+'''
+import os
+import sys
+import json
+import shutil
+import numpy as np
+
+
+TABLE_FOLDER = 'topology_table'
+TABLE_VERSION = 1
+
+
+
+def _kind(values):
+    '''
+    Storage of a measure: integer | float (stored as float64) | category
+    '''
+    kind = 'integer'
+    for v in values:
+        if v == 'NA' or v is None:
+            continue
+        if isinstance(v, bool) or not isinstance(v, (int, float, np.integer, np.floating)):
+            return('category')
+        if kind == 'integer' and not isinstance(v, (int, np.integer)):
+            kind = 'float'
+    return(kind)
+
+
+
+def _float(v):
+    if v == 'NA' or v is None:
+        return(np.nan)
+    return(float(v))
+
+
+
+def build_table(components, measures):
+    '''
+    Columns of the table from the buffered measures of every component.
+        components: list of (component name, node list)
+        measures: {component name: [(filename, header, measure, message, error, comment)]}
+    Returns the columns {name: array} and the manifest.
+    '''
+    names, rows = [], []
+    for name, nodes in components:
+        for n in sorted(nodes):
+            names.append(name)
+            rows.append(n)
+    position = dict(((c, n), i) for i, (c, n) in enumerate(zip(names, rows)))
+    columns = {'component': np.array([int(c) for c in names], dtype=np.int32),
+               'reaction': np.array([u'%s' % n for n in rows])}
+    manifest = {'version': TABLE_VERSION, 'rows': len(rows), 'notes': {}, 'measures': {}, 'errors': {},
+                'columns': [{'name': 'component', 'kind': 'integer'},
+                            {'name': 'reaction', 'kind': 'text'}]}
+
+    order, headers, values, errors = [], {}, {}, {}
+    for name, nodes in components:
+        for filename, header, measure, message, error, comment in measures.get(name, []):
+            column = filename.rsplit('.list', 1)[0]
+            if column not in headers:
+                order.append(column)
+                headers[column] = header
+                values[column] = {}
+            values[column].update(((name, k), v) for k, v in measure.items())
+            manifest['measures'].setdefault(name, []).append(column)
+            if error is not None:
+                errors.setdefault(column, {}).update(((name, k), v) for k, v in error.items())
+                manifest['errors'].setdefault(name, []).append(column)
+            if comment:
+                manifest['notes'].setdefault(name, {})[column] = comment
+
+    for column in order:
+        kind = _kind(values[column].values())
+        info = {'name': column, 'kind': kind, 'header': headers[column]}
+        if kind == 'category':
+            levels = sorted(set(str(v) for v in values[column].values() if v != 'NA'))
+            code = dict((l, i) for i, l in enumerate(levels))
+            data = np.full(len(rows), -1, dtype=np.int16)
+            for key, v in values[column].items():
+                if v != 'NA':
+                    data[position[key]] = code[str(v)]
+            info['levels'] = levels
+        else:
+            data = np.full(len(rows), np.nan)
+            for key, v in values[column].items():
+                data[position[key]] = _float(v)
+        columns[column] = data
+        manifest['columns'].append(info)
+        if column in errors:
+            data = np.full(len(rows), np.nan)
+            for key, v in errors[column].items():
+                data[position[key]] = _float(v)
+            columns[column + '_ci95'] = data
+            manifest['columns'].append({'name': column + '_ci95', 'kind': 'float',
+                                        'header': 'CI95', 'error_of': column})
+    return(columns, manifest)
+
+
+
+def write_table(output, components, measures):
+    '''
+    Write the table in output/topology_table (written in a temporary folder, then renamed)
+    '''
+    columns, manifest = build_table(components, measures)
+    folder = os.path.join(output, TABLE_FOLDER)
+    tmp = folder + '.tmp%d' % os.getpid()
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    for name, data in columns.items():
+        np.save(os.path.join(tmp, name + '.npy'), data)
+    f = open(os.path.join(tmp, 'manifest.json'), 'w')
+    json.dump(manifest, f, indent=1, sort_keys=True)
+    f.close()
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.rename(tmp, folder)
+    return(folder)
+
+
+
+def read_manifest(output):
+    f = open(os.path.join(output, TABLE_FOLDER, 'manifest.json'))
+    manifest = json.load(f)
+    f.close()
+    return(manifest)
+
+
+
+def load_column(output, name):
+    '''
+    Memory-mapped column of the table
+    '''
+    return(np.load(os.path.join(output, TABLE_FOLDER, name + '.npy'), mmap_mode='r'))
+
+
+
+def load_table(output):
+    '''
+    All columns of the table (memory-mapped) and the manifest
+    '''
+    manifest = read_manifest(output)
+    columns = dict((c['name'], load_column(output, c['name'])) for c in manifest['columns'])
+    return(columns, manifest)
+
+
+
+def component_rows(output, component):
+    '''
+    Slice of the rows of a component (rows are in component order)
+    '''
+    comp = load_column(output, 'component')
+    number = int(component)
+    return(slice(int(np.searchsorted(comp, number, 'left')), int(np.searchsorted(comp, number, 'right'))))
+
+
+
+def component_measure(output, component, name):
+    '''
+    {REACTION: VALUE} of a measure of a component (None if the measure is not in the table).
+    Missing values are 'NA' if the measure was calculated for the component.
+    '''
+    if not os.path.exists(os.path.join(output, TABLE_FOLDER, 'manifest.json')):
+        return(None)
+    manifest = read_manifest(output)
+    info = dict((c['name'], c) for c in manifest['columns']).get(name)
+    if info is None:
+        return(None)
+    base = name[:-len('_ci95')] if info.get('error_of') else name
+    missing = 'NA' if base in manifest['measures'].get(component, []) else None
+    rows = component_rows(output, component)
+    reactions = [str(r) for r in load_column(output, 'reaction')[rows].tolist()]
+    data = load_column(output, name)[rows]
+    measure = {}
+    for r, v in zip(reactions, data.tolist()):
+        if info['kind'] == 'category':
+            if v >= 0:
+                measure[r] = str(info['levels'][v])
+            elif missing:
+                measure[r] = missing
+        elif v == v:        # not NaN
+            measure[r] = int(v) if info['kind'] == 'integer' else v
+        elif missing:
+            measure[r] = missing
+    return(measure)
+
+
+
+def export_lists(output):
+    '''
+    Write the legacy files output/COMPONENT/topology/<measure>.list from the table
+    (CI95 column only for the measures of the component that had one: approximate)
+    '''
+    manifest = read_manifest(output)
+    comp = load_column(output, 'component')
+    components = sorted(set(comp.tolist()))
+    info = dict((c['name'], c) for c in manifest['columns'])
+    for number in components:
+        name = '%03d' % number
+        notes = manifest['notes'].get(name, {})
+        ## tables without 'errors': measures with a note are the approximate ones
+        with_error = manifest['errors'].get(name, []) if 'errors' in manifest else list(notes)
+        for c in manifest['columns']:
+            if c['name'] not in manifest['measures'].get(name, []):
+                continue
+            measure = component_measure(output, name, c['name'])
+            folder = os.path.join(output, name, 'topology')
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            error = None
+            if c['name'] + '_ci95' in info and c['name'] in with_error:
+                error = component_measure(output, name, c['name'] + '_ci95')
+            f = open(os.path.join(folder, c['name'] + '.list'), 'w')
+            if c['name'] in notes:
+                f.write('# ' + notes[c['name']] + '\n')
+            if error is None:
+                f.write('REACTION\t' + c['header'] + '\n')
+                for k in sorted(measure):
+                    f.write(k + '\t' + str(measure[k]) + '\n')
+            else:
+                f.write('REACTION\t' + c['header'] + '\tCI95\n')
+                for k in sorted(measure):
+                    f.write(k + '\t' + str(measure[k]) + '\t' + str(error[k]) + '\n')
+            f.close()
+
+
+
+if __name__ == '__main__':
+
+    ## Export the legacy .list files of a run: cComponents
+    output = sys.argv[1]
+    export_lists(output)
+    print('Exported .list files of ' + os.path.join(output, TABLE_FOLDER))